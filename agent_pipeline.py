@@ -0,0 +1,296 @@
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, List, Any, Callable, Iterable, Optional
+
+from stream_segmenter import StreamSegmenter
+
+
+class PipelineError(Exception):
+    """Raised for an invalid pipeline definition or, by PipelineRun.raise_for_error(), a failed stage"""
+
+
+class Stage:
+    """One pipeline step: func(**inputs) produces the value named output
+
+    inputs name either pipeline inputs (Pipeline.run keyword arguments) or the
+    outputs of other stages. A stage runs as soon as all of its inputs exist.
+    """
+
+    def __init__(self, name: str, func: Callable[..., Any], inputs: Iterable[str] = (),
+                 output: Optional[str] = None):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.output = output or name
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, inputs={list(self.inputs)}, output={self.output!r})"
+
+
+class PipelineRun:
+    """Values and per-stage timings of one Pipeline.run()"""
+
+    def __init__(self, pipeline: 'Pipeline', inputs: Dict[str, Any]):
+        self.pipeline = pipeline
+        self.values: Dict[str, Any] = dict(inputs)
+        # stage name -> {'status', 'start_ms', 'end_ms', 'duration_ms', 'error'}, times relative to run start
+        self.timings: Dict[str, Dict[str, Any]] = {}
+        self.errors: Dict[str, BaseException] = {}
+        self.wall_ms: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors and all(t['status'] == 'completed' for t in self.timings.values())
+
+    def raise_for_error(self):
+        """Raise PipelineError for the first failed stage"""
+        for name, error in self.errors.items():
+            raise PipelineError(f"Stage {name} failed: {error}") from error
+
+    def critical_path(self) -> List[str]:
+        """Stages on the longest dependency chain, ending with the last stage to finish
+
+        Walks back from the latest-finishing stage through, at each step, the
+        producer of its inputs that finished last, i.e. the one it waited for.
+        """
+        finished = {name: t for name, t in self.timings.items() if t.get('end_ms') is not None}
+        if not finished:
+            return []
+        producers = {stage.output: stage.name for stage in self.pipeline.stages}
+        stages = {stage.name: stage for stage in self.pipeline.stages}
+
+        path = [max(finished, key=lambda name: finished[name]['end_ms'])]
+        while True:
+            upstream = [producers[i] for i in stages[path[-1]].inputs if producers.get(i) in finished]
+            if not upstream:
+                break
+            path.append(max(upstream, key=lambda name: finished[name]['end_ms']))
+        return list(reversed(path))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'pipeline': self.pipeline.name,
+            'wall_ms': round(self.wall_ms, 1),
+            'critical_path': self.critical_path(),
+            'stages': {name: dict(timing) for name, timing in self.timings.items()},
+        }
+
+    def report(self) -> str:
+        """Human-readable timing table, critical path stages marked with *"""
+        critical = set(self.critical_path())
+        lines = [f"Pipeline {self.pipeline.name}: {self.wall_ms:.0f}ms wall"]
+        for name, t in sorted(self.timings.items(), key=lambda item: item[1].get('start_ms') or 0):
+            mark = '*' if name in critical else ' '
+            span = (f"{t['start_ms']:7.0f} -> {t['end_ms']:7.0f}ms ({t['duration_ms']:.0f}ms)"
+                    if t.get('end_ms') is not None else "not run")
+            error = f"  {t['error']}" if t.get('error') else ""
+            lines.append(f" {mark} {name:<20} {t['status']:<10} {span}{error}")
+        lines.append(f"Critical path: {' -> '.join(self.critical_path())}")
+        return "\n".join(lines)
+
+
+class Pipeline:
+    """Runs stages in dependency order, independent stages concurrently
+
+    Stages are scheduled on a thread pool the moment their inputs are available,
+    so e.g. entity extraction and scene context queries overlap. When a stage
+    fails, stages depending on it are skipped and the others still finish; check
+    PipelineRun.ok or call raise_for_error(). Setting cancel_event stops new
+    stages from starting. Stages that touch the database must use their own
+    connection (AgentRegistry.acquire gives each checkout one).
+    """
+
+    def __init__(self, stages: List[Stage], max_workers: int = 4, name: str = "pipeline"):
+        self.stages = list(stages)
+        self.max_workers = max_workers
+        self.name = name
+        self._validate()
+
+    def run(self, cancel_event: Optional[threading.Event] = None, **inputs) -> PipelineRun:
+        """Run every stage; inputs supply the values stages consume that no stage produces
+
+        cancel_event is also available to stages as the input 'cancel_event'.
+        """
+        inputs['cancel_event'] = cancel_event
+        missing = {i for stage in self.stages for i in stage.inputs} - set(inputs) - {s.output for s in self.stages}
+        if missing:
+            raise PipelineError(f"Pipeline {self.name} is missing inputs: {', '.join(sorted(missing))}")
+
+        run = PipelineRun(self, inputs)
+        pending = {stage.name: stage for stage in self.stages}
+        start = time.perf_counter()
+
+        def elapsed_ms() -> float:
+            return (time.perf_counter() - start) * 1000
+
+        def execute(stage: Stage):
+            run.timings[stage.name] = {'status': 'running', 'start_ms': round(elapsed_ms(), 1)}
+            return stage.func(**{i: run.values[i] for i in stage.inputs})
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"{self.name}-stage") as pool:
+            running = {}
+            while pending or running:
+                if cancel_event is None or not cancel_event.is_set():
+                    for stage in [s for s in pending.values() if all(i in run.values for i in s.inputs)]:
+                        del pending[stage.name]
+                        running[pool.submit(execute, stage)] = stage
+
+                # Stages whose inputs can no longer appear (failed upstream or cancelled)
+                if not running:
+                    for stage in pending.values():
+                        run.timings[stage.name] = {'status': 'cancelled' if cancel_event is not None
+                                                   and cancel_event.is_set() else 'skipped'}
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    timing = run.timings[stage.name]
+                    timing['end_ms'] = round(elapsed_ms(), 1)
+                    timing['duration_ms'] = round(timing['end_ms'] - timing['start_ms'], 1)
+                    try:
+                        run.values[stage.output] = future.result()
+                        timing['status'] = 'completed'
+                    except BaseException as e:
+                        timing['status'] = 'failed'
+                        timing['error'] = str(e)
+                        run.errors[stage.name] = e
+                        print(f"✗ [Pipeline:{self.name}] Stage {stage.name} failed: {e}")
+                        traceback.print_exc()
+
+        run.wall_ms = elapsed_ms()
+        return run
+
+    def _validate(self):
+        names = [stage.name for stage in self.stages]
+        outputs = [stage.output for stage in self.stages]
+        for label, values in (('stage name', names), ('output', outputs)):
+            duplicates = {v for v in values if values.count(v) > 1}
+            if duplicates:
+                raise PipelineError(f"Duplicate {label}(s) in pipeline {self.name}: {', '.join(sorted(duplicates))}")
+
+        # Kahn's algorithm over stage outputs; anything left over is on a cycle
+        producers = {stage.output: stage for stage in self.stages}
+        remaining = {stage.name: {producers[i].name for i in stage.inputs if i in producers}
+                     for stage in self.stages}
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                raise PipelineError(f"Dependency cycle in pipeline {self.name}: {', '.join(sorted(remaining))}")
+            for name in ready:
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+
+
+def generation_pipeline(acquire: Callable[..., Any], segment_markers: bool = True) -> Pipeline:
+    """The simulation generation chain as a Pipeline
+
+    entity_names (EntityAgent task 1) -> prompt_entities (EntityAgent task 2) ->
+    prompt_context (PrepAgent) runs alongside scene_context (PrepAgent), both feed
+    context (PrepAgent prompt) -> generation (GeneratorAgent, simulation mode) ->
+    evaluation (marker segments, else paragraph segmentation, else EvalAgent).
+
+    acquire(agent_type, agent_task_id) is a context manager yielding an agent with
+    its own connection, e.g. AgentRegistry.acquire. Pipeline inputs: story_id,
+    scene_id, beat_id, user_input, request_context, stream_callback and
+    segment_callback (the last two may be None), plus run()'s cancel_event.
+    """
+
+    def prepare(agent, request_context, cancel_event):
+        agent.request_context = request_context
+        agent.cancel_event = cancel_event
+        return agent
+
+    def story_context(story_id, scene_id, beat_id):
+        return {'story_id': story_id, 'scene_id': scene_id, 'beat_id': beat_id,
+                'timeline_id': f"{story_id}:tl1"}
+
+    def extract_entity_names(story_id, scene_id, beat_id, user_input, request_context, cancel_event):
+        if not user_input.strip():
+            return []
+        with acquire('EntityAgent', 1) as agent:
+            result = prepare(agent, request_context, cancel_event).execute(
+                user_input, story_context(story_id, scene_id, beat_id), extract_only=True)
+        if not result['success']:
+            raise PipelineError(f"Entity extraction failed: {result['error']}")
+        return result['raw_names']
+
+    def match_prompt_entities(story_id, scene_id, beat_id, user_input, entity_names, request_context, cancel_event):
+        if not entity_names:
+            return []
+        with acquire('EntityAgent', 2) as agent:
+            result = prepare(agent, request_context, cancel_event).execute(
+                user_input, story_context(story_id, scene_id, beat_id), extract_only=True,
+                entity_names=entity_names)
+        if not result['success']:
+            raise PipelineError(f"Entity matching failed: {result['error']}")
+        return [{'entity_id': match['entity_id'], 'name': match.get('entity_name', name), 'mentions': [name]}
+                for name, match in result['matching_results'].items() if match.get('entity_id')]
+
+    def load_scene_context(story_id, scene_id, beat_id, request_context, cancel_event):
+        with acquire('PrepAgent', 1) as agent:
+            return prepare(agent, request_context, cancel_event).load_scene_context(story_id, scene_id, beat_id)
+
+    def load_prompt_context(story_id, scene_id, prompt_entities, request_context, cancel_event):
+        with acquire('PrepAgent', 1) as agent:
+            return prepare(agent, request_context, cancel_event).load_prompt_context(story_id, scene_id, prompt_entities)
+
+    def build_context(story_id, scene_id, beat_id, user_input, prompt_entities, scene_context, prompt_context,
+                      request_context, cancel_event):
+        with acquire('PrepAgent', 1) as agent:
+            result = prepare(agent, request_context, cancel_event).execute(
+                story_id, scene_id, beat_id, user_input, prompt_entities,
+                scene_context=scene_context, prompt_context=prompt_context)
+        if not result['success']:
+            raise PipelineError(f"Context preparation failed: {result['error']}")
+        return result
+
+    def generate(story_id, scene_id, beat_id, user_input, context, request_context, cancel_event,
+                 stream_callback, segment_callback):
+        with acquire('GeneratorAgent', 1) as agent:
+            result = prepare(agent, request_context, cancel_event).execute(
+                story_id=story_id, scene_id=scene_id, beat_id=beat_id, user_input=user_input,
+                context_prompt=context['prompt'], generation_mode="simulation",
+                stream_callback=stream_callback, segment_markers=segment_markers,
+                segment_callback=segment_callback)
+        if not result['success']:
+            raise PipelineError(result['error'])
+        return result
+
+    def evaluate(story_id, scene_id, beat_id, generation, request_context, cancel_event):
+        """Segmentation of the generated text in EvalAgent's format (with 'source')"""
+        if generation.get('segmented'):
+            return {'success': True, 'source': 'markers', 'processed_text': generation['generated_text'],
+                    'segments': generation['segments'], 'new_scene': generation['new_scene'],
+                    'new_beat': generation['new_beat']}
+        segmenter = StreamSegmenter()
+        segmenter.feed(generation['raw_text'])
+        segmenter.finish()
+        if segmenter.segments and not segmenter.ambiguous:
+            return dict(segmenter.evaluation(), success=True, source='paragraphs')
+        with acquire('EvalAgent', 1) as agent:
+            result = prepare(agent, request_context, cancel_event).execute(
+                story_id, scene_id, beat_id, generation['raw_text'])
+        return dict(result, source='eval_agent')
+
+    return Pipeline([
+        Stage('entity_names', extract_entity_names,
+              ['story_id', 'scene_id', 'beat_id', 'user_input', 'request_context', 'cancel_event']),
+        Stage('prompt_entities', match_prompt_entities,
+              ['story_id', 'scene_id', 'beat_id', 'user_input', 'entity_names', 'request_context', 'cancel_event']),
+        Stage('scene_context', load_scene_context,
+              ['story_id', 'scene_id', 'beat_id', 'request_context', 'cancel_event']),
+        Stage('prompt_context', load_prompt_context,
+              ['story_id', 'scene_id', 'prompt_entities', 'request_context', 'cancel_event']),
+        Stage('context', build_context,
+              ['story_id', 'scene_id', 'beat_id', 'user_input', 'prompt_entities', 'scene_context',
+               'prompt_context', 'request_context', 'cancel_event']),
+        Stage('generation', generate,
+              ['story_id', 'scene_id', 'beat_id', 'user_input', 'context', 'request_context', 'cancel_event',
+               'stream_callback', 'segment_callback']),
+        Stage('evaluation', evaluate,
+              ['story_id', 'scene_id', 'beat_id', 'generation', 'request_context', 'cancel_event']),
+    ], name='generation')
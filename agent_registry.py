@@ -0,0 +1,126 @@
+import importlib
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Any, Callable, Optional, Tuple
+from base_agent import load_agent_config
+
+
+# agent_type -> (module, class), imported on first use
+AGENT_CLASSES = {
+    'GeneratorAgent': ('generator_agent', 'GeneratorAgent'),
+    'EvalAgent': ('eval_agent', 'EvalAgent'),
+    'PrepAgent': ('prep_agent', 'PrepAgent'),
+    'EntityAgent': ('entity_agent', 'EntityAgent'),
+}
+
+
+class AgentRegistry:
+    """Process-wide pool of warm agent instances keyed by (agent_type, agent_task_id)
+
+    Agents are checked out for the duration of one request and returned afterwards,
+    so their shared LLM client and config survive between Socket.IO events. Each
+    checkout borrows a database connection from connect() and closes it again at
+    checkin, which returns it to the connection pool (db_pool.ConnectionPool).
+    Configs are cached and reloaded when the agents row's updated_at changes
+    (schema.sql bumps it on every UPDATE) or after invalidate().
+    """
+
+    def __init__(self, connect: Callable[[], Any], max_idle_per_key: int = 8):
+        """
+        Args:
+            connect: Returns a connection usable from any thread; close() releases it
+            max_idle_per_key: Idle instances kept per (agent_type, agent_task_id)
+        """
+        self._connect = connect
+        self.max_idle_per_key = max_idle_per_key
+        self._lock = threading.Lock()
+        self._configs: Dict[Tuple[str, int], Tuple[Any, Dict[str, Any]]] = {}
+        self._idle: Dict[Tuple[str, int], List[Any]] = {}
+
+    @contextmanager
+    def acquire(self, agent_type: str, agent_task_id: int = 1):
+        """Check out a warm agent for one request"""
+        key = (agent_type, agent_task_id)
+        agent = self._checkout(key)
+        try:
+            yield agent
+        finally:
+            self._checkin(key, agent)
+
+    def invalidate(self, agent_type: Optional[str] = None, agent_task_id: Optional[int] = None):
+        """Drop cached configs (all of them, or one agent type/task)"""
+        with self._lock:
+            if agent_type is None:
+                self._configs.clear()
+            else:
+                for key in list(self._configs):
+                    if key[0] == agent_type and (agent_task_id is None or key[1] == agent_task_id):
+                        del self._configs[key]
+
+    def close(self):
+        """Drop every idle agent"""
+        with self._lock:
+            self._idle.clear()
+
+    def _checkout(self, key: Tuple[str, int]):
+        with self._lock:
+            pool = self._idle.get(key)
+            agent = pool.pop() if pool else None
+
+        db = self._connect()
+        try:
+            config = self._current_config(key, db)
+            if agent is None:
+                agent = self._agent_class(key[0])(key[0], key[1], db, config=config)
+            else:
+                agent.db = db
+                agent.config = config
+                agent._reset_execution_state()
+        except BaseException:
+            db.close()
+            raise
+
+        return agent
+
+    def _checkin(self, key: Tuple[str, int], agent):
+        db, agent.db = agent.db, None
+        try:
+            if db.in_transaction:
+                print(f"Warning: {key[0]}:{key[1]} returned with an open transaction, rolling back")
+                db.rollback()
+        finally:
+            db.close()
+
+        with self._lock:
+            pool = self._idle.setdefault(key, [])
+            if len(pool) < self.max_idle_per_key:
+                pool.append(agent)
+
+    def _current_config(self, key: Tuple[str, int], db) -> Dict[str, Any]:
+        """Return the cached config for key, reloading it if the agents row changed"""
+        row = db.execute("""
+            SELECT updated_at FROM agents
+            WHERE agent_type = ? AND agent_task_id = ? AND is_active = TRUE
+        """, key).fetchone()
+        if not row:
+            raise ValueError(f"Agent {key[0]} task {key[1]} not found or inactive")
+
+        stamp = row['updated_at']
+        with self._lock:
+            cached = self._configs.get(key)
+        if cached and cached[0] == stamp:
+            return cached[1]
+
+        config = load_agent_config(db, key[0], key[1])
+
+        with self._lock:
+            self._configs[key] = (stamp, config)
+        print(f"[AgentRegistry] Loaded config for {key[0]}:{key[1]}")
+        return config
+
+    @staticmethod
+    def _agent_class(agent_type: str):
+        if agent_type not in AGENT_CLASSES:
+            raise ValueError(f"Unknown agent type: {agent_type}")
+        module_name, class_name = AGENT_CLASSES[agent_type]
+        return getattr(importlib.import_module(module_name), class_name)
@@ -17,7 +17,11 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from base_agent import BaseAgent
 from prep_agent import PrepAgent
+from request_context import RequestContext
 from entity_agent import EntityAgent
+from agent_pipeline import Pipeline, Stage, generation_pipeline
+from agent_registry import AgentRegistry
+from db_pool import ConnectionPool
 
 
 class AgentTestKit:
@@ -27,6 +31,8 @@ class AgentTestKit:
         self.db_path = db_path
         self.db = None
         self.agents = {}
+        self.pool = None
+        self.registry = None
         
     def __enter__(self):
         # Initialize database if it doesn't exist
@@ -41,9 +47,17 @@ class AgentTestKit:
         # Ensure test agents exist
         self._ensure_test_agents()
         
+        # Pipeline stages run on worker threads, each with its own pooled connection
+        self.pool = ConnectionPool(self.db_path)
+        self.registry = AgentRegistry(self.pool.acquire)
+        
         return self
         
     def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.registry:
+            self.registry.close()
+        if self.pool:
+            self.pool.close()
         if self.db:
             self.db.close()
     
@@ -100,6 +114,7 @@ class AgentTestKit:
                 agent_instructions TEXT,
                 agent_function_calls JSON,
                 model TEXT,
+                cache_ttl_seconds INTEGER DEFAULT 0,
                 is_active BOOLEAN DEFAULT TRUE,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -121,6 +136,18 @@ class AgentTestKit:
                 processing_duration_ms INTEGER,
                 status_message TEXT,
                 tokens INTEGER,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                time_to_first_token_ms INTEGER,
+                chunk_count INTEGER,
+                inter_chunk_p50_ms REAL,
+                inter_chunk_p95_ms REAL,
+                inter_chunk_max_ms REAL,
+                llm_attempts INTEGER,
+                hedged BOOLEAN,
+                coalesced BOOLEAN,
+                memo_hits INTEGER,
+                memo_misses INTEGER,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (agent_id) REFERENCES agents(agent_id)
@@ -149,6 +176,7 @@ Focus on:
 Be conservative - only include entities that are clearly present or referenced.''',
                 'agent_function_calls': '{}',
                 'model': 'gpt-4',
+                'cache_ttl_seconds': 86400,
                 'is_active': True
             },
             {
@@ -198,11 +226,12 @@ Be conservative - only include entities that are clearly present or referenced.'
             cursor = self.db.execute("""
                 INSERT INTO agents 
                 (agent_type, agent_task_id, agent_name, agent_description,
-                 agent_instructions, agent_function_calls, model, is_active)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                 agent_instructions, agent_function_calls, model, cache_ttl_seconds, is_active)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (agent['agent_type'], agent['agent_task_id'],
                   agent['agent_name'], agent['agent_description'], agent['agent_instructions'],
-                  agent['agent_function_calls'], agent['model'], agent['is_active']))
+                  agent['agent_function_calls'], agent['model'], agent.get('cache_ttl_seconds', 0),
+                  agent['is_active']))
             
             agent_id = cursor.lastrowid
             print(f"Created {agent['agent_type']} Task {agent['agent_task_id']} with ID: {agent_id}")
@@ -238,10 +267,14 @@ Be conservative - only include entities that are clearly present or referenced.'
         print("-" * 60)
         
         try:
+            # One request context for the whole chain, so repeated lookups are memoized
+            request_context = RequestContext()
+            
             # Extract entities from user input first
             prompt_entities = []
             if user_input.strip():
                 entity_agent = self.get_agent('entity')
+                entity_agent.request_context = request_context
                 entity_result = entity_agent.execute(
                     story_text=user_input,
                     story_context={'story_id': story_id, 'scene_id': scene_id, 'beat_id': beat_id, 'timeline_id': '1:tl1'},
@@ -253,6 +286,7 @@ Be conservative - only include entities that are clearly present or referenced.'
             
             # Run PrepAgent
             agent = self.get_agent('prep')
+            agent.request_context = request_context
             result = agent.execute(
                 story_id=story_id, scene_id=scene_id, beat_id=beat_id,
                 user_input=user_input, prompt_entities=prompt_entities
@@ -265,6 +299,9 @@ Be conservative - only include entities that are clearly present or referenced.'
                 print(result['prompt'])
             else:
                 print(f"✗ Error: {result['error']}")
+            
+            memo = request_context.stats()
+            print(f"\nRequest context: {memo['hits']} hits, {memo['misses']} misses")
                 
         except Exception as e:
             print(f"✗ Exception: {e}")
@@ -404,68 +441,95 @@ Be conservative - only include entities that are clearly present or referenced.'
         print(f"Text: '{story_text}'")
         print("=" * 60)
         
+        story_context = {'story_id': story_id, 'scene_id': 'test:s1', 'beat_id': 'test:b1', 'timeline_id': 'test:tl1'}
+        
+        def run_task(task_id, **kwargs):
+            with self.registry.acquire('EntityAgent', task_id) as agent:
+                result = agent.execute(story_text=story_text, story_context=story_context,
+                                       extract_only=True, **kwargs)
+            if not result.get('success'):
+                raise RuntimeError(f"Task {task_id} failed: {result.get('error')}")
+            return result
+        
+        def extract(story_text):
+            return run_task(1)['raw_names']
+        
+        def match(entity_names):
+            return run_task(2, entity_names=entity_names)['matching_results'] if entity_names else {}
+        
+        pipeline = Pipeline([
+            Stage('entity_names', extract, ['story_text']),
+            Stage('matching_results', match, ['entity_names']),
+        ], name='entity')
+        
         try:
-            # Task 1: Extract entity names
-            print("\n1. RUNNING TASK 1 (Entity Extraction)")
-            print("-" * 40)
-            agent1 = self.get_agent('entity', 1)
-            task1_result = agent1.execute(
-                story_text=story_text,
-                story_context={'story_id': story_id, 'scene_id': 'test:s1', 'beat_id': 'test:b1', 'timeline_id': 'test:tl1'},
-                extract_only=True
-            )
+            run = pipeline.run(story_text=story_text)
             
-            if not task1_result.get('success'):
-                print(f"✗ Task 1 failed: {task1_result.get('error')}")
-                return
-            
-            entity_names = task1_result.get('raw_names', [])
-            print(f"✓ Task 1 extracted {len(entity_names)} entities: {entity_names}")
-            
-            if not entity_names:
-                print("No entities found, stopping pipeline.")
-                return
-            
-            # Task 2: String matching
-            print("\n2. RUNNING TASK 2 (String Matching)")
-            print("-" * 40)
-            agent2 = self.get_agent('entity', 2)
-            task2_result = agent2.execute(
-                story_text=story_text,
-                story_context={'story_id': story_id, 'scene_id': 'test:s1', 'beat_id': 'test:b1', 'timeline_id': 'test:tl1'},
-                extract_only=True,
-                entity_names=entity_names
-            )
-            
-            if not task2_result.get('success'):
-                print(f"✗ Task 2 failed: {task2_result.get('error')}")
-                return
-            
-            matching_results = task2_result.get('matching_results', {})
+            entity_names = run.values.get('entity_names', [])
+            matching_results = run.values.get('matching_results', {})
+            print(f"\n✓ Task 1 extracted {len(entity_names)} entities: {entity_names}")
             print(f"✓ Task 2 matched {len(matching_results)} entities")
             
             # Show matching summary
-            for name, match in matching_results.items():
-                match_type = match.get('match_type', 'unknown')
+            for name, match_result in matching_results.items():
+                match_type = match_result.get('match_type', 'unknown')
                 if match_type == 'no_match':
                     print(f"  '{name}' -> No match")
                 elif match_type == 'ambiguous':
-                    print(f"  '{name}' -> Ambiguous ({len(match.get('candidates', []))} candidates)")
+                    print(f"  '{name}' -> Ambiguous ({len(match_result.get('candidates', []))} candidates)")
                 else:
-                    entity_name = match.get('entity_name', 'Unknown')
-                    confidence = match.get('confidence', 0)
+                    entity_name = match_result.get('entity_name', 'Unknown')
+                    confidence = match_result.get('confidence', 0)
                     print(f"  '{name}' -> {entity_name} ({match_type}, {confidence:.2f})")
             
             # Task 3: Disambiguation (when implemented)
             print("\n3. TASK 3 (Disambiguation) - Not yet implemented")
             
-            print(f"\n✓ Pipeline completed successfully!")
+            print()
+            print(run.report())
+            if run.ok:
+                print(f"\n✓ Pipeline completed successfully!")
+            else:
+                print(f"\n✗ Pipeline failed: {'; '.join(str(e) for e in run.errors.values())}")
             
         except Exception as e:
             print(f"✗ Pipeline failed: {e}")
             import traceback
             traceback.print_exc()
     
+    def test_generation_pipeline(self, user_input: str, story_id: str = "1",
+                                 scene_id: str = "1:s1", beat_id: str = "1:b3"):
+        """Test the full generation chain (entities -> context -> generation -> evaluation) with stage timings"""
+        print("=" * 60)
+        print("TESTING GENERATION PIPELINE")
+        print(f"User Input: '{user_input}'")
+        print("-" * 60)
+        
+        try:
+            request_context = RequestContext()
+            run = generation_pipeline(self.registry.acquire).run(
+                story_id=story_id, scene_id=scene_id, beat_id=beat_id, user_input=user_input,
+                request_context=request_context,
+                stream_callback=None, segment_callback=None
+            )
+            
+            if run.ok:
+                evaluation = run.values['evaluation']
+                print(f"✓ Generated {len(evaluation.get('segments', []))} segment(s) "
+                      f"(segmented by {evaluation.get('source')}):")
+                print("-" * 60)
+                print(evaluation.get('processed_text') or run.values['generation']['generated_text'])
+            else:
+                print(f"✗ Pipeline failed: {'; '.join(str(e) for e in run.errors.values())}")
+            
+            print("-" * 60)
+            print(run.report())
+            memo = request_context.stats()
+            print(f"Request context: {memo['hits']} hits, {memo['misses']} misses")
+                
+        except Exception as e:
+            print(f"✗ Exception: {e}")
+    
     def show_database_state(self, story_id: str = "1"):
         """Show database state"""
         print("=" * 60)
@@ -561,6 +625,7 @@ Be conservative - only include entities that are clearly present or referenced.'
         print("  entity1 <text>     - Test EntityAgent Task 1 (raw extraction)")
         print("  entity2 <text>     - Test EntityAgent Task 2 (string matching)")
         print("  pipeline <text>    - Test full entity pipeline (Task 1->2->3)")
+        print("  generate <text>    - Run the full generation pipeline with stage timings")
         print("  db                 - Show database state")
         print("  agents             - Show agent details")
         print("  agents <type>      - Show specific agent type details")
@@ -586,6 +651,8 @@ Be conservative - only include entities that are clearly present or referenced.'
                     self.test_specific_task(2, args)
                 elif cmd == 'pipeline':
                     self.test_entity_pipeline(args)
+                elif cmd == 'generate':
+                    self.test_generation_pipeline(args)
                 elif cmd == 'db':
                     self.show_database_state()
                 elif cmd == 'agents':
@@ -602,7 +669,7 @@ Be conservative - only include entities that are clearly present or referenced.'
 
 def main():
     parser = argparse.ArgumentParser(description='Test Storywriter agents')
-    parser.add_argument('--agent', choices=['prep', 'entity'], help='Agent to test')
+    parser.add_argument('--agent', choices=['prep', 'entity', 'pipeline', 'generate'], help='Agent to test')
     parser.add_argument('--task', type=int, help='Task ID for EntityAgent (1, 2, 3)')
     parser.add_argument('--input', help='Input text')
     parser.add_argument('--db', default='storywriter.db', help='Database path')
@@ -616,6 +683,10 @@ def main():
             elif args.agent == 'entity':
                 task_id = args.task or 1
                 testkit.test_specific_task(task_id, args.input)
+            elif args.agent == 'pipeline':
+                testkit.test_entity_pipeline(args.input)
+            elif args.agent == 'generate':
+                testkit.test_generation_pipeline(args.input)
         else:
             testkit.interactive_mode()
 
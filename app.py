@@ -1,9 +1,23 @@
 from flask import Flask, render_template, request
 from flask_socketio import SocketIO, emit
-import sqlite3
 import json
+import re
 from datetime import datetime
 import os
+import signal
+import time
+import sys
+from agent_registry import AgentRegistry
+from agent_pipeline import generation_pipeline
+from execution_logger import ExecutionLogger, set_execution_logger
+from stream_batcher import StreamBatcher
+from db_pool import ConnectionPool
+from job_manager import JobManager
+from job_queue import JobQueue, JOB_HANDLERS
+from stream_segmenter import StreamSegmenter
+from eval_agent import store_processed_text
+from speculation import SpeculationCache
+from request_context import RequestContext
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'storywriter_secret_key'
@@ -12,11 +26,53 @@ socketio = SocketIO(app, cors_allowed_origins="*")
 # Database configuration
 DATABASE = 'storywriter.db'
 
-def get_db():
-    """Get database connection"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Reused, tuned (WAL) connections; reads that never write use a separate read-only pool
+db_pool = ConnectionPool.from_env(DATABASE)
+read_pool = ConnectionPool.from_env(DATABASE, readonly=True)
+
+def get_db(readonly=False):
+    """Get a pooled database connection - close() returns it to the pool"""
+    return (read_pool if readonly else db_pool).acquire()
+
+# Warm agents shared across Socket.IO events; each checkout borrows a pooled connection
+agent_registry = AgentRegistry(db_pool.acquire)
+
+# Generations run as background tasks, at most one per session
+generation_jobs = JobManager(socketio.start_background_task)
+
+# 'inline': evaluate before generation_complete; 'deferred': send generation_complete as soon
+# as the raw text is stored and push evaluation_result when segmentation finishes
+EVAL_MODE = os.getenv('EVAL_MODE', 'inline')
+
+# Have the generator mark beat/scene boundaries inline so EvalAgent only runs when markers are missing
+SEGMENT_MARKERS = os.getenv('SEGMENT_MARKERS', '1') == '1'
+
+# Opt-in (SPECULATION=1 or a request's 'speculate' flag): once a generation completes,
+# pre-generate the next beat so a plain "continue" is answered from the cache
+SPECULATION = os.getenv('SPECULATION', '0') == '1'
+SPECULATION_WAIT_SECONDS = float(os.getenv('SPECULATION_WAIT_SECONDS', '30'))
+speculations = SpeculationCache.from_env(socketio.start_background_task)
+CONTINUE_REQUEST = re.compile(r"^\s*(continue|go on|keep going|next)?\s*[.!]*\s*$", re.IGNORECASE)
+
+# Upper bound on variants (roll1..rollN) per generate_variants request
+MAX_VARIANTS = int(os.getenv('MAX_VARIANTS', '5'))
+
+# Bulk agent work (job_queue.py) runs in separate worker processes; the server only
+# queues jobs and pushes their progress as job_progress events
+job_queue = JobQueue.from_env(db_pool.acquire)
+JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', '1.0'))
+job_progress_poller = None
+
+def generation_stream_batcher(sid, **fields):
+    """Batch streamed deltas into sequenced generation_stream events for one client
+
+    fields (e.g. the variant) are added to every event.
+    """
+    return StreamBatcher.from_env(lambda batch: socketio.emit('generation_stream', dict(batch, **fields), to=sid))
+
+def generation_segment_emitter(job, **fields):
+    """Send finalized beat segments to the job's session as generation_segment events"""
+    return lambda segment: socketio.emit('generation_segment', dict(segment, job_id=job.job_id, **fields), to=job.sid)
 
 def init_db():
     """Initialize database with schema only"""
@@ -32,22 +88,26 @@ def init_db():
         conn.commit()
         conn.close()
         print("Database initialized with schema only")
-        print("To add sample data, run: sqlite3 storywriter.db < sample_data.sql")
+        print("To add sample data, run: python generate_sample_data.py")
 
 # Socket.IO event handlers
 @socketio.on('connect')
 def handle_connect():
+    global job_progress_poller
     print(f'User connected: {request.sid}')
+    if job_progress_poller is None:
+        job_progress_poller = socketio.start_background_task(poll_job_progress)
 
 @socketio.on('disconnect')
 def handle_disconnect():
     print(f'User disconnected: {request.sid}')
+    generation_jobs.cancel(request.sid)
 
 @socketio.on('load_entities')
 def handle_load_entities():
     """Load all entities from database"""
     try:
-        conn = get_db()
+        conn = get_db(readonly=True)
         entities = conn.execute('''
             SELECT e.*, c.type as class_type, c.details as class_details 
             FROM entities e
@@ -70,181 +130,503 @@ def handle_evaluate_entry(data):
         emit('evaluation_result', {'success': False, 'error': 'No story_entry_id provided'})
         return
 
-    conn = get_db()
-    entry = conn.execute('SELECT story_id, scene_id, beat_id, raw_text FROM stories WHERE story_entry_id = ?', (story_entry_id,)).fetchone()
-    if not entry:
-        emit('evaluation_result', {'success': False, 'error': 'Entry not found'})
-        return
+    run_entry_evaluation(request.sid, story_entry_id)
 
-    from eval_agent import EvalAgent
-    eval_agent = EvalAgent('EvalAgent', 1, conn)
-    res = eval_agent.execute(entry['story_id'], entry['scene_id'], entry['beat_id'], entry['raw_text'])
+def run_entry_evaluation(sid, story_entry_id, job_id=None):
+    """Evaluate a stored entry, store the processed text and send evaluation_result to sid"""
+    with agent_registry.acquire('EvalAgent', 1) as eval_agent:
+        conn = eval_agent.db
+        entry = conn.execute('SELECT story_id, scene_id, beat_id, raw_text FROM stories WHERE story_entry_id = ?', (story_entry_id,)).fetchone()
+        if not entry:
+            socketio.emit('evaluation_result', {'success': False, 'error': 'Entry not found',
+                                                'story_entry_id': story_entry_id, 'job_id': job_id}, to=sid)
+            return
 
-    if res.get('success'):
-        conn.execute(
-            'UPDATE stories SET text_content = ?, updated_at = ? WHERE story_entry_id = ?',
-            (res['processed_text'], datetime.now().isoformat(), story_entry_id)
-        )
-        conn.commit()
+        res = eval_agent.execute(entry['story_id'], entry['scene_id'], entry['beat_id'], entry['raw_text'])
+
+        if res.get('success'):
+            res['updated'] = store_processed_text(conn, story_entry_id, entry['raw_text'], res['processed_text'])
 
     res['story_entry_id'] = story_entry_id
     res['raw_text'] = entry['raw_text']
-    emit('evaluation_result', res)
+    res['job_id'] = job_id
+    socketio.emit('evaluation_result', res, to=sid)
 
 @socketio.on('user_message')
 def handle_user_message(data):
-    """Process user message and respond with immediate generation"""
+    """Queue immediate generation for a user message; returns the job id as the ack"""
     content = data['content']
     story_id = data.get('story_id', '1')
     scene_id = data.get('scene_id', '1:s1')
     beat_id = data.get('beat_id', '1:b3')
     skip_eval = data.get('skip_eval', False)
-    skip_eval = data.get('skip_eval', False)
+    eval_mode = data.get('eval_mode', EVAL_MODE)
+    speculate = data.get('speculate', SPECULATION)
     
     print(f"=== USER MESSAGE REQUEST ===")
     print(f"User input: {content}")
     print(f"Story ID: {story_id}, Scene: {scene_id}, Beat: {beat_id}")
     
-    try:
-        # Import and create GeneratorAgent
-        from generator_agent import GeneratorAgent
-        
-        print("Creating GeneratorAgent for user message...")
-        generator = GeneratorAgent('GeneratorAgent', 1, get_db())
-        print(f"GeneratorAgent created successfully")
-        
-        # Generate story content using immediate mode
-        print("Calling generator.execute for user message with streaming...")
-        result = generator.execute(
-            story_id=story_id,
-            scene_id=scene_id,
-            beat_id=beat_id,
-            user_input=content,
-            generation_mode="immediate",
-            stream_callback=lambda chunk: socketio.emit('generation_stream', {'chunk': chunk}, to=request.sid)
-        )
+    job = generation_jobs.submit(request.sid, 'user_message', lambda job: run_user_message(
+        job, content, story_id, scene_id, beat_id, skip_eval, eval_mode, speculate))
+    emit('generation_started', {'job_id': job.job_id, 'generation_mode': 'chat'})
+    return {'job_id': job.job_id}
 
-        if not skip_eval:
-            # Evaluate with EvalAgent
-            from eval_agent import EvalAgent
-            eval_agent = EvalAgent('EvalAgent', 1, get_db())
-            eval_res = eval_agent.execute(story_id, scene_id, beat_id, result['generated_text'])
-            if eval_res.get('success'):
-                processed_text = eval_res['processed_text']
-                generator.update_story_entry_text(result['story_entry_id'], processed_text)
-                result['generated_text'] = processed_text
-                result['segments'] = eval_res.get('segments')
-                result['new_scene'] = eval_res.get('new_scene')
-                result['new_beat'] = eval_res.get('new_beat')
+def run_user_message(job, content, story_id, scene_id, beat_id, skip_eval, eval_mode, speculate=False):
+    """Background task: generate and evaluate a user message, then send story_response"""
+    try:
+        result = run_generation(job, content, story_id, scene_id, beat_id, skip_eval, eval_mode, speculate)
+        if job.cancelled:
+            socketio.emit('generation_cancelled', {'job_id': job.job_id, 'generation_mode': 'chat'}, to=job.sid)
+            return
         
         print(f"User message generation result: {result}")
         
         if result['success']:
             print("✓ User message generation successful, sending response...")
-            emit('story_response', {
+            socketio.emit('story_response', {
                 'content': result['generated_text'],
                 'success': True,
                 'generation_mode': 'chat',
+                'job_id': job.job_id,
                 'story_entry_id': result.get('story_entry_id'),
                 'new_scene': result.get('new_scene'),
                 'new_beat': result.get('new_beat'),
                 'raw_text': result.get('raw_text'),
-                'segments': result.get('segments')
-            })
+                'segments': result.get('segments'),
+                'evaluation_pending': result.get('evaluation_pending', False),
+                'speculative': result.get('speculative', False)
+            }, to=job.sid)
+            start_deferred_evaluation(job, result)
+            if speculate:
+                start_speculation(story_id, scene_id, beat_id)
         else:
             print(f"✗ User message generation failed: {result['error']}")
-            emit('story_response', {
+            socketio.emit('story_response', {
                 'success': False,
+                'job_id': job.job_id,
                 'error': result['error']
-            })
+            }, to=job.sid)
             
     except Exception as e:
         print(f"✗ Exception in handle_user_message: {e}")
         import traceback
         traceback.print_exc()
-        emit('story_response', {
+        socketio.emit('story_response', {
             'success': False,
+            'job_id': job.job_id,
             'error': f"Server error: {str(e)}"
-        })
+        }, to=job.sid)
 
 @socketio.on('generate_immediate')
 def handle_immediate_generation(data):
-    """Handle immediate story generation (red flash)"""
+    """Queue immediate story generation (red flash); returns the job id as the ack"""
     user_input = data.get('content', '')
     story_id = data.get('story_id', '1')
     scene_id = data.get('scene_id', '1:s1')
     beat_id = data.get('beat_id', '1:b3')
     skip_eval = data.get('skip_eval', False)
+    eval_mode = data.get('eval_mode', EVAL_MODE)
+    speculate = data.get('speculate', SPECULATION)
     
     print(f"=== IMMEDIATE GENERATION REQUEST ===")
     print(f"User input: {user_input}")
     print(f"Story ID: {story_id}, Scene: {scene_id}, Beat: {beat_id}")
     
-    try:
-        # Import and create GeneratorAgent
-        from generator_agent import GeneratorAgent
-        
-        print("Creating GeneratorAgent...")
-        generator = GeneratorAgent('GeneratorAgent', 1, get_db())
-        print(f"GeneratorAgent created successfully")
-        print(f"Agent config: {generator.config['name']}")
-        
-        # Generate story content with streaming
-        print("Calling generator.execute with streaming...")
-        result = generator.execute(
-            story_id=story_id,
-            scene_id=scene_id,
-            beat_id=beat_id,
-            user_input=user_input,
-            generation_mode="immediate",
-            stream_callback=lambda chunk: socketio.emit('generation_stream', {'chunk': chunk}, to=request.sid)
-        )
+    job = generation_jobs.submit(request.sid, 'generate_immediate', lambda job: run_immediate_generation(
+        job, user_input, story_id, scene_id, beat_id, skip_eval, eval_mode, speculate))
+    emit('generation_started', {'job_id': job.job_id, 'generation_mode': 'immediate'})
+    return {'job_id': job.job_id}
 
-        if not skip_eval:
-            # Evaluate the generated text for beat/scene boundaries
-            from eval_agent import EvalAgent
-            eval_agent = EvalAgent('EvalAgent', 1, get_db())
-            eval_res = eval_agent.execute(story_id, scene_id, beat_id, result['generated_text'])
-            if eval_res.get('success'):
-                processed_text = eval_res['processed_text']
-                generator.update_story_entry_text(result['story_entry_id'], processed_text)
-                result['generated_text'] = processed_text
-                result['segments'] = eval_res.get('segments')
-                result['new_scene'] = eval_res.get('new_scene')
-                result['new_beat'] = eval_res.get('new_beat')
+def run_immediate_generation(job, user_input, story_id, scene_id, beat_id, skip_eval, eval_mode, speculate=False):
+    """Background task: generate and evaluate, then send generation_complete"""
+    try:
+        result = run_generation(job, user_input, story_id, scene_id, beat_id, skip_eval, eval_mode, speculate)
+        if job.cancelled:
+            socketio.emit('generation_cancelled', {'job_id': job.job_id, 'generation_mode': 'immediate'}, to=job.sid)
+            return
         
         print(f"Generation result: {result}")
         
         if result['success']:
             print("✓ Generation successful, sending response...")
-            emit('generation_complete', {
+            socketio.emit('generation_complete', {
                 'success': True,
                 'generated_text': result['generated_text'],
                 'generation_mode': 'immediate',
+                'job_id': job.job_id,
                 'story_entry_id': result.get('story_entry_id'),
                 'flash_color': 'red',
                 'new_scene': result.get('new_scene'),
                 'new_beat': result.get('new_beat'),
                 'raw_text': result.get('raw_text'),
-                'segments': result.get('segments')
-            })
+                'segments': result.get('segments'),
+                'evaluation_pending': result.get('evaluation_pending', False),
+                'speculative': result.get('speculative', False)
+            }, to=job.sid)
+            start_deferred_evaluation(job, result)
+            if speculate:
+                start_speculation(story_id, scene_id, beat_id)
         else:
             print(f"✗ Generation failed: {result['error']}")
-            emit('generation_error', {
+            socketio.emit('generation_error', {
                 'success': False,
+                'job_id': job.job_id,
                 'error': result['error'],
                 'flash_color': 'red'
-            })
+            }, to=job.sid)
             
     except Exception as e:
         print(f"✗ Exception in handle_immediate_generation: {e}")
         import traceback
         traceback.print_exc()
-        emit('generation_error', {
+        socketio.emit('generation_error', {
             'success': False,
+            'job_id': job.job_id,
             'error': f"Server error: {str(e)}",
             'flash_color': 'red'
-        })
+        }, to=job.sid)
+
+@socketio.on('generate_variants')
+def handle_variant_generation(data):
+    """Queue generation of several alternative continuations (roll1..rollN); returns the job id"""
+    user_input = data.get('content', '')
+    story_id = data.get('story_id', '1')
+    scene_id = data.get('scene_id', '1:s1')
+    beat_id = data.get('beat_id', '1:b3')
+    n = max(1, min(int(data.get('n', 3)), MAX_VARIANTS))
+    
+    print(f"=== VARIANT GENERATION REQUEST ({n} variants) ===")
+    print(f"User input: {user_input}")
+    print(f"Story ID: {story_id}, Scene: {scene_id}, Beat: {beat_id}")
+    
+    job = generation_jobs.submit(request.sid, 'generate_variants', lambda job: run_variant_generation(
+        job, user_input, story_id, scene_id, beat_id, n))
+    emit('generation_started', {'job_id': job.job_id, 'generation_mode': 'variants', 'n': n})
+    return {'job_id': job.job_id, 'n': n}
+
+def run_variant_generation(job, user_input, story_id, scene_id, beat_id, n):
+    """Background task: stream n variants, each on its own generation_stream channel, then send variants_complete
+
+    Every generation_stream / generation_segment event carries its variant
+    ('roll1'..). Variants are not evaluated; a chosen one can be sent to evaluate_entry.
+    """
+    try:
+        speculations.invalidate(story_id, reason='new generation')
+        streams = [generation_stream_batcher(job.sid, variant=f"roll{index + 1}") for index in range(n)]
+        segment_emitters = [generation_segment_emitter(job, variant=f"roll{index + 1}") for index in range(n)]
+        with agent_registry.acquire('GeneratorAgent', 1) as generator:
+            generator.cancel_event = job.cancel_event
+            try:
+                result = generator.execute_variants(
+                    story_id=story_id,
+                    scene_id=scene_id,
+                    beat_id=beat_id,
+                    user_input=user_input,
+                    generation_mode="immediate",
+                    n=n,
+                    stream_callback=lambda index, delta: streams[index](delta),
+                    segment_markers=SEGMENT_MARKERS,
+                    segment_callback=lambda index, segment: segment_emitters[index](segment)
+                )
+            finally:
+                for stream in streams:
+                    stream.close()
+        
+        if job.cancelled:
+            socketio.emit('generation_cancelled', {'job_id': job.job_id, 'generation_mode': 'variants'}, to=job.sid)
+            return
+        
+        if result['success']:
+            print(f"✓ Generated {len(result['variants'])} variants, sending response...")
+            socketio.emit('variants_complete', {
+                'success': True,
+                'generation_mode': 'variants',
+                'job_id': job.job_id,
+                'flash_color': 'red',
+                'variants': [{k: variant.get(k) for k in ('variant', 'story_entry_id', 'generated_text', 'raw_text',
+                                                         'segments', 'new_scene', 'new_beat')}
+                             for variant in result['variants']]
+            }, to=job.sid)
+        else:
+            print(f"✗ Variant generation failed: {result['error']}")
+            socketio.emit('generation_error', {
+                'success': False,
+                'job_id': job.job_id,
+                'error': result['error'],
+                'flash_color': 'red'
+            }, to=job.sid)
+    
+    except Exception as e:
+        print(f"✗ Exception in handle_variant_generation: {e}")
+        import traceback
+        traceback.print_exc()
+        socketio.emit('generation_error', {
+            'success': False,
+            'job_id': job.job_id,
+            'error': f"Server error: {str(e)}",
+            'flash_color': 'red'
+        }, to=job.sid)
+
+@socketio.on('generate_simulation')
+def handle_simulation_generation(data):
+    """Queue simulation generation (yellow flash) through the agent pipeline; returns the job id"""
+    user_input = data.get('content', '')
+    story_id = data.get('story_id', '1')
+    scene_id = data.get('scene_id', '1:s1')
+    beat_id = data.get('beat_id', '1:b3')
+    
+    print(f"=== SIMULATION GENERATION REQUEST ===")
+    print(f"User input: {user_input}")
+    print(f"Story ID: {story_id}, Scene: {scene_id}, Beat: {beat_id}")
+    
+    job = generation_jobs.submit(request.sid, 'generate_simulation', lambda job: run_simulation_generation(
+        job, user_input, story_id, scene_id, beat_id))
+    emit('generation_started', {'job_id': job.job_id, 'generation_mode': 'simulation'})
+    return {'job_id': job.job_id}
+
+def run_simulation_generation(job, user_input, story_id, scene_id, beat_id):
+    """Background task: EntityAgent -> PrepAgent -> GeneratorAgent -> EvalAgent as one pipeline
+
+    Entity extraction and the scene context queries run concurrently; the stage
+    timings and critical path are sent with generation_complete as 'pipeline'.
+    """
+    try:
+        speculations.invalidate(story_id, reason='new generation')
+        stream = generation_stream_batcher(job.sid)
+        emit_segment = generation_segment_emitter(job)
+        try:
+            run = generation_pipeline(agent_registry.acquire, segment_markers=SEGMENT_MARKERS).run(
+                cancel_event=job.cancel_event,
+                story_id=story_id, scene_id=scene_id, beat_id=beat_id, user_input=user_input,
+                request_context=RequestContext(job.job_id),
+                stream_callback=stream, segment_callback=emit_segment
+            )
+        finally:
+            stream.close()
+        print(run.report())
+        
+        if job.cancelled:
+            socketio.emit('generation_cancelled', {'job_id': job.job_id, 'generation_mode': 'simulation'}, to=job.sid)
+            return
+        
+        result = run.values.get('generation')
+        if not run.ok and result is None:
+            raise Exception('; '.join(str(e) for e in run.errors.values()))
+        
+        eval_res = run.values.get('evaluation')
+        if eval_res and eval_res.get('success') and eval_res['source'] != 'markers':
+            for index, segment in enumerate(eval_res.get('segments') or []):
+                emit_segment(dict(segment, index=index, ambiguous=False))
+            conn = get_db()
+            try:
+                store_processed_text(conn, result['story_entry_id'], result['raw_text'], eval_res['processed_text'])
+            finally:
+                conn.close()
+            apply_evaluation(result, eval_res)
+        
+        print("✓ Simulation generation successful, sending response...")
+        socketio.emit('generation_complete', {
+            'success': True,
+            'generated_text': result['generated_text'],
+            'generation_mode': 'simulation',
+            'job_id': job.job_id,
+            'story_entry_id': result.get('story_entry_id'),
+            'flash_color': 'yellow',
+            'new_scene': result.get('new_scene'),
+            'new_beat': result.get('new_beat'),
+            'raw_text': result.get('raw_text'),
+            'segments': result.get('segments'),
+            'pipeline': run.as_dict()
+        }, to=job.sid)
+    
+    except Exception as e:
+        print(f"✗ Exception in handle_simulation_generation: {e}")
+        import traceback
+        traceback.print_exc()
+        socketio.emit('generation_error', {
+            'success': False,
+            'job_id': job.job_id,
+            'error': f"Server error: {str(e)}",
+            'flash_color': 'yellow'
+        }, to=job.sid)
+
+def story_state_key(conn, story_id, scene_id, beat_id):
+    """Speculation key for the story as it stands: ids plus a hash of its latest entry"""
+    latest = conn.execute('SELECT story_entry_id, raw_text FROM stories WHERE story_id = ? ORDER BY story_entry_id DESC LIMIT 1',
+                          (story_id,)).fetchone()
+    state = f"{latest['story_entry_id']}:{latest['raw_text']}" if latest else ""
+    return SpeculationCache.key(story_id, scene_id, beat_id, state)
+
+def start_speculation(story_id, scene_id, beat_id):
+    """Pre-generate the likely next "continue" for the story in the background"""
+    conn = get_db(readonly=True)
+    try:
+        key = story_state_key(conn, story_id, scene_id, beat_id)
+    finally:
+        conn.close()
+    speculations.start(key, lambda speculation: speculate_continuation(speculation, story_id, scene_id, beat_id))
+
+def speculate_continuation(speculation, story_id, scene_id, beat_id):
+    """Speculative work: PrepAgent context plus an unstored, pre-segmented continuation"""
+    request_context = RequestContext()
+    try:
+        with agent_registry.acquire('PrepAgent', 1) as prep:
+            prep.cancel_event = speculation.cancel_event
+            prep.request_context = request_context
+            context = prep.execute(story_id, scene_id, beat_id)
+    except Exception as e:
+        # Databases without a PrepAgent row still speculate with the generator's own scene context
+        print(f"Warning: [Speculation] PrepAgent unavailable ({e}), speculating in immediate mode")
+        context = None
+    if context is not None and not context['success']:
+        raise Exception(f"Context preparation failed: {context['error']}")
+    if speculation.cancelled:
+        return None
+
+    with agent_registry.acquire('GeneratorAgent', 1) as generator:
+        generator.cancel_event = speculation.cancel_event
+        generator.request_context = request_context
+        result = generator.execute(
+            story_id=story_id,
+            scene_id=scene_id,
+            beat_id=beat_id,
+            context_prompt=context['prompt'] if context else "",
+            generation_mode="simulation" if context else "immediate",
+            segment_markers=SEGMENT_MARKERS,
+            store=False
+        )
+    if not result['success']:
+        raise Exception(result['error'])
+
+    if not result.get('segmented'):
+        segmenter = StreamSegmenter()
+        segmenter.feed(result['raw_text'])
+        segmenter.finish()
+        if segmenter.segments and not segmenter.ambiguous:
+            apply_evaluation(result, segmenter.evaluation())
+        else:
+            result['evaluation_pending'] = True
+    print(f"[Speculation] Continuation ready for story {story_id} ({len(result['generated_text'])} chars)")
+    return result
+
+def serve_speculation(job, story_id, scene_id, beat_id):
+    """Store and stream a speculative continuation matching the story's current state, if any"""
+    conn = get_db(readonly=True)
+    try:
+        key = story_state_key(conn, story_id, scene_id, beat_id)
+    finally:
+        conn.close()
+    result = speculations.take(key, timeout=SPECULATION_WAIT_SECONDS)
+    if result is None:
+        return None
+
+    with agent_registry.acquire('GeneratorAgent', 1) as generator:
+        generator.store_generation(result, story_id, scene_id, beat_id)
+    stream = generation_stream_batcher(job.sid)
+    stream(result['raw_text'])
+    stream.close()
+    emit_segment = generation_segment_emitter(job)
+    for index, segment in enumerate(result.get('segments') or []):
+        emit_segment(dict(segment, index=index, ambiguous=False))
+    result['speculative'] = True
+    return result
+
+def run_generation(job, user_input, story_id, scene_id, beat_id, skip_eval, eval_mode='inline', speculate=False):
+    """Stream an immediate generation to the job's session and evaluate it unless cancelled
+
+    With SEGMENT_MARKERS the generator marks beat/scene boundaries itself and its
+    segments are stored with the entry. Otherwise (or when the model wrote no
+    markers) beats are segmented on paragraph breaks; when no segment boundary is
+    ambiguous that segmentation is stored as the evaluation, else EvalAgent refines
+    it, inline or, with eval_mode 'deferred', in start_deferred_evaluation (result
+    flagged evaluation_pending). Segments are sent as generation_segment events.
+
+    With speculate, a plain "continue" is served from a matching speculative result.
+    """
+    if speculate and CONTINUE_REQUEST.match(user_input):
+        result = serve_speculation(job, story_id, scene_id, beat_id)
+        if result is not None:
+            return result
+    # Any other generation moves the story on from what was speculated
+    speculations.invalidate(story_id, reason='new generation')
+
+    segment_markers = SEGMENT_MARKERS and not skip_eval
+    emit_segment = generation_segment_emitter(job)
+    with agent_registry.acquire('GeneratorAgent', 1) as generator:
+        generator.cancel_event = job.cancel_event
+        print(f"Agent config: {generator.config['name']}")
+        
+        # Generate story content with streaming
+        print("Calling generator.execute with streaming...")
+        stream = generation_stream_batcher(job.sid)
+        # With markers the generator emits segments; paragraph segmentation is the fallback
+        segmenter = StreamSegmenter(None if segment_markers else emit_segment)
+
+        def on_chunk(delta):
+            stream(delta)
+            segmenter.feed(delta)
+
+        try:
+            result = generator.execute(
+                story_id=story_id,
+                scene_id=scene_id,
+                beat_id=beat_id,
+                user_input=user_input,
+                generation_mode="immediate",
+                stream_callback=on_chunk,
+                segment_markers=segment_markers,
+                segment_callback=emit_segment
+            )
+        finally:
+            stream.close()
+        segmenter.finish()
+
+        if result['success'] and not skip_eval and not job.cancelled and not result.get('segmented'):
+            if segment_markers:
+                for segment in segmenter.segments:
+                    emit_segment(segment)
+            if segmenter.segments and not segmenter.ambiguous:
+                # Paragraph boundaries settled the segmentation while streaming
+                eval_res = segmenter.evaluation()
+                print(f"[Segmenter] {len(segmenter.segments)} segments from stream, skipping LLM evaluation")
+                store_processed_text(generator.db, result['story_entry_id'], result['raw_text'], eval_res['processed_text'])
+                apply_evaluation(result, eval_res)
+            elif eval_mode == 'deferred':
+                result['evaluation_pending'] = True
+            else:
+                # Ambiguous boundaries: refine with the LLM evaluation
+                with agent_registry.acquire('EvalAgent', 1) as eval_agent:
+                    eval_agent.cancel_event = job.cancel_event
+                    eval_res = eval_agent.execute(story_id, scene_id, beat_id, result['generated_text'])
+                if eval_res.get('success') and not job.cancelled:
+                    store_processed_text(generator.db, result['story_entry_id'], result['raw_text'], eval_res['processed_text'])
+                    apply_evaluation(result, eval_res)
+    
+    return result
+
+def apply_evaluation(result, eval_res):
+    """Copy an evaluation's processed text and boundaries into a generation result"""
+    result['generated_text'] = eval_res['processed_text']
+    result['segments'] = eval_res.get('segments')
+    result['new_scene'] = eval_res.get('new_scene')
+    result['new_beat'] = eval_res.get('new_beat')
+
+def start_deferred_evaluation(job, result):
+    """Evaluate a completed generation in its own background task (eval_mode 'deferred')
+
+    Runs outside the generation job, so a newer message does not cancel the
+    segmentation of the entry that was already delivered.
+    """
+    if result.get('evaluation_pending'):
+        socketio.start_background_task(run_entry_evaluation, job.sid, result['story_entry_id'], job.job_id)
+
+@socketio.on('cancel_generation')
+def handle_cancel_generation(data=None):
+    """Cancel this session's in-flight generation (optionally only a given job_id)"""
+    job_id = (data or {}).get('job_id')
+    cancelled = generation_jobs.cancel(request.sid, job_id)
+    return {'cancelled': cancelled, 'job_id': job_id}
 
 @socketio.on('update_entity')
 def handle_update_entity(data):
@@ -270,6 +652,7 @@ def handle_update_entity(data):
             query = f"UPDATE entities SET {', '.join(set_clauses)} WHERE entity_id = ?"
             conn.execute(query, values)
             conn.commit()
+            speculations.invalidate(reason='entity state changed')
             
             updated_entity = conn.execute('SELECT * FROM entities WHERE entity_id = ?', (entity_id,)).fetchone()
             emit('entity_updated', dict(updated_entity))
@@ -279,6 +662,35 @@ def handle_update_entity(data):
     except Exception as e:
         emit('error', {'message': str(e)})
 
+@socketio.on('enqueue_job')
+def handle_enqueue_job(data):
+    """Queue bulk agent work (e.g. reextract_entities for a story); returns the job id as the ack"""
+    kind = data.get('kind')
+    if kind not in JOB_HANDLERS:
+        return {'success': False, 'error': f"Unknown job kind: {kind}"}
+    job_id = job_queue.enqueue(kind, data.get('payload') or {}, int(data.get('priority', 0)),
+                               int(data.get('max_attempts', 3)))
+    return {'success': True, 'job_id': job_id}
+
+@socketio.on('cancel_job')
+def handle_cancel_job(data):
+    """Cancel a queued job, or ask the worker running it to stop"""
+    return {'success': job_queue.cancel(int(data['job_id']))}
+
+def poll_job_progress():
+    """Background task: broadcast every job_queue change as a job_progress event"""
+    since = time.time()
+    while True:
+        socketio.sleep(JOB_POLL_SECONDS)
+        try:
+            for job in job_queue.changes(since):
+                since = max(since, job['updated_at'])
+                socketio.emit('job_progress', {k: job[k] for k in (
+                    'job_id', 'kind', 'status', 'attempts', 'max_attempts', 'progress_done',
+                    'progress_total', 'result', 'error', 'updated_at')})
+        except Exception as e:
+            print(f"Warning: job progress poll failed: {e}")
+
 def get_class_hierarchy(conn, class_id):
     """Get the full inheritance chain for a class"""
     hierarchy = []
@@ -301,7 +713,7 @@ def handle_get_class_attributes(data):
     entity_id = data['entity_id']
     
     try:
-        conn = get_db()
+        conn = get_db(readonly=True)
         
         # Get merged attributes from class hierarchy (these are the available keys)
         class_hierarchy_attributes = merge_class_attributes(conn, class_id)
@@ -374,6 +786,7 @@ def handle_add_entity_attribute(data):
         })
         
         conn.commit()
+        speculations.invalidate(reason='entity state changed')
         conn.close()
         
     except Exception as e:
@@ -460,6 +873,7 @@ def handle_update_entity_attribute(data):
         })
         
         conn.commit()
+        speculations.invalidate(reason='entity state changed')
         conn.close()
         
     except Exception as e:
@@ -499,6 +913,7 @@ def handle_remove_entity_attribute(data):
                 })
         
         conn.commit()
+        speculations.invalidate(reason='entity state changed')
         conn.close()
         
     except Exception as e:
@@ -555,7 +970,7 @@ def index():
 def get_entities():
     """Get all entities"""
     try:
-        conn = get_db()
+        conn = get_db(readonly=True)
         entities = conn.execute('''
             SELECT e.*, c.type as class_type, c.details as class_details 
             FROM entities e
@@ -571,7 +986,7 @@ def get_entities():
 def get_entity(entity_id):
     """Get specific entity"""
     try:
-        conn = get_db()
+        conn = get_db(readonly=True)
         entity = conn.execute('SELECT * FROM entities WHERE entity_id = ?', (entity_id,)).fetchone()
         conn.close()
         
@@ -586,7 +1001,7 @@ def get_entity(entity_id):
 def get_relationships():
     """Get relationships with entity details"""
     try:
-        conn = get_db()
+        conn = get_db(readonly=True)
         relationships = conn.execute('''
             SELECT r.*, 
                    e1.name as entity1_name, e1.base_type as entity1_base_type,
@@ -603,8 +1018,40 @@ def get_relationships():
     except Exception as e:
         return {'error': str(e)}, 500
 
+@app.route('/api/llm_cache/stats')
+def get_llm_cache_stats():
+    """Get LLM response cache hit/miss counters"""
+    try:
+        from llm_cache import get_response_cache
+        return get_response_cache().stats()
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+@app.route('/api/jobs/stats')
+def get_job_stats():
+    """Get background generation job counters"""
+    return generation_jobs.stats()
+
+@app.route('/api/job_queue')
+def get_job_queue():
+    """Get recent bulk jobs, optionally filtered by ?status="""
+    return {'jobs': job_queue.list_jobs(request.args.get('status'), int(request.args.get('limit', 50)))}
+
+@app.route('/api/speculation/stats')
+def get_speculation_stats():
+    """Get speculative pre-generation counters"""
+    return speculations.stats()
+
+@app.route('/api/db_pool/stats')
+def get_db_pool_stats():
+    """Get connection pool usage and leak counters"""
+    return {'write': db_pool.stats(), 'read': read_pool.stats()}
+
 if __name__ == '__main__':
     init_db()
+    # Buffer agent_executions writes off the generation path; flushed at exit
+    set_execution_logger(ExecutionLogger(DATABASE))
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     print("Starting Storywriter Flask-SocketIO server...")
     print("Visit http://localhost:5000 to view the storytelling application")
     socketio.run(app, debug=True, host='0.0.0.0', port=5000)
@@ -2,8 +2,17 @@ import sqlite3
 import json
 import uuid
 import os
+import inspect
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, AsyncIterator
+from llm_cache import get_response_cache, request_key
+from execution_logger import get_execution_logger
+from llm_resilience import get_resilient_caller
+from llm_singleflight import single_flight_enabled, get_single_flight, get_async_single_flight
 
 # Load environment variables from .env file
 try:
@@ -13,48 +22,133 @@ except ImportError:
     pass
 
 
+# Sync LLM clients are thread-safe and keep their HTTP connections alive, so one
+# client per (api_key, base_url) is shared by every agent in the process
+_shared_llm_clients: Dict[tuple, Any] = {}
+_shared_llm_clients_lock = threading.Lock()
+
+
+def load_agent_config(db, agent_type: str, agent_task_id: int) -> Dict[str, Any]:
+    """Load an agent configuration row from the agents table"""
+    # SELECT * so databases created before optional columns were added still load
+    cursor = db.execute("""
+        SELECT * FROM agents WHERE agent_type = ? AND agent_task_id = ? AND is_active = TRUE
+    """, (agent_type, agent_task_id))
+    
+    row = cursor.fetchone()
+    if not row:
+        raise ValueError(f"Agent {agent_type} task {agent_task_id} not found or inactive")
+    columns = row.keys()
+        
+    return {
+        'agent_id': int(row['agent_id']),
+        'type': row['agent_type'],
+        'task_id': row['agent_task_id'],
+        'name': row['agent_name'],
+        'description': row['agent_description'],
+        'instructions': row['agent_instructions'],
+        'function_calls': json.loads(row['agent_function_calls'] or '{}'),
+        'model': row['model'],
+        'is_active': row['is_active'],
+        'cache_ttl_seconds': int(row['cache_ttl_seconds'] or 0) if 'cache_ttl_seconds' in columns else 0
+    }
+
+
+class GenerationCancelled(Exception):
+    """Raised inside LLM calls once the agent's cancel_event is set
+
+    Fallback wrappers re-raise it instead of substituting fallback text.
+    """
+
+
+class StreamMetrics:
+    """Latency and usage measurements for one streamed completion"""
+    
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token_at = None
+        self.last_chunk_at = None
+        self.chunk_count = 0
+        self.gaps_ms: List[float] = []
+        self.usage = None
+    
+    def on_chunk(self):
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        else:
+            self.gaps_ms.append((now - self.last_chunk_at) * 1000)
+        self.last_chunk_at = now
+        self.chunk_count += 1
+    
+    def on_usage(self, usage):
+        self.usage = usage
+    
+    def as_record(self) -> Dict[str, Any]:
+        """Columns for agent_executions"""
+        record = {
+            'time_to_first_token_ms': int((self.first_token_at - self.start) * 1000) if self.first_token_at else None,
+            'chunk_count': self.chunk_count,
+            'inter_chunk_p50_ms': None,
+            'inter_chunk_p95_ms': None,
+            'inter_chunk_max_ms': None
+        }
+        if self.gaps_ms:
+            gaps = sorted(self.gaps_ms)
+            record['inter_chunk_p50_ms'] = round(gaps[len(gaps) // 2], 2)
+            record['inter_chunk_p95_ms'] = round(gaps[min(len(gaps) - 1, int(len(gaps) * 0.95))], 2)
+            record['inter_chunk_max_ms'] = round(gaps[-1], 2)
+        if self.usage is not None:
+            record['prompt_tokens'] = getattr(self.usage, 'prompt_tokens', None)
+            record['completion_tokens'] = getattr(self.usage, 'completion_tokens', None)
+        return record
+    
+    def total_tokens(self) -> int:
+        if self.usage is None:
+            return 0
+        return getattr(self.usage, 'total_tokens', 0) or 0
+
+
 class BaseAgent:
     """Base class for all agents - loads configuration dynamically from database and manages LLM client"""
     
-    def __init__(self, agent_type: str, agent_task_id: int, db_connection):
+    def __init__(self, agent_type: str, agent_task_id: int, db_connection,
+                 config: Optional[Dict[str, Any]] = None):
         self.agent_type = agent_type
         self.agent_task_id = agent_task_id
         self.db = db_connection
-        self.config = self._load_config()
+        # Callers that cache configs (see AgentRegistry) pass them in to skip the query
+        self.config = config or self._load_config()
         self.llm_client = self._init_llm_client()
+        self._async_llm_client = None
+        self._async_llm_client_loop = None
         
+        self._reset_execution_state()
+    
+    def _reset_execution_state(self):
+        """Clear per-execution tracking so a pooled agent starts clean"""
         # Execution tracking variables - MUST be initialized
         self.execution_id = None
         self.db_execution_id = None
         self.execution_start_time = None
+        self._execution_record = None
+        self._execution_metrics = {}
         self._current_tokens = 0
+        # Set by the caller (e.g. job_manager) to abort in-flight LLM calls; anything with is_set()
+        self.cancel_event = None
+        # Set by the caller to share memoized lookups across one pipeline run (RequestContext)
+        self.request_context = None
         
     def _load_config(self) -> Dict[str, Any]:
         """Load agent configuration from database based on type and task_id"""
-        cursor = self.db.execute("""
-            SELECT agent_id, agent_type, agent_task_id, agent_name, agent_description,
-                   agent_instructions, agent_function_calls, model, is_active
-            FROM agents WHERE agent_type = ? AND agent_task_id = ? AND is_active = TRUE
-        """, (self.agent_type, self.agent_task_id))
-        
-        row = cursor.fetchone()
-        if not row:
-            raise ValueError(f"Agent {self.agent_type} task {self.agent_task_id} not found or inactive")
-            
-        return {
-            'agent_id': int(row['agent_id']),
-            'type': row['agent_type'],
-            'task_id': row['agent_task_id'],
-            'name': row['agent_name'],
-            'description': row['agent_description'],
-            'instructions': row['agent_instructions'],
-            'function_calls': json.loads(row['agent_function_calls'] or '{}'),
-            'model': row['model'],
-            'is_active': row['is_active']
-        }
+        return load_agent_config(self.db, self.agent_type, self.agent_task_id)
     
-    def _init_llm_client(self):
-        """Initialize LLM client based on environment configuration"""
+    def _init_llm_client(self, async_client: bool = False):
+        """Initialize LLM client based on environment configuration
+        
+        Sync clients are shared process-wide; async clients are bound to the
+        event loop that created them, so each agent creates its own.
+        """
         try:
             import openai
             
@@ -65,10 +159,20 @@ class BaseAgent:
             
             base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
             
-            client = openai.OpenAI(
-                api_key=api_key,
-                base_url=base_url
-            )
+            # Retries are handled by llm_resilience, so the SDK's own retry loop is disabled
+            if async_client:
+                return openai.AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+            
+            client_key = (api_key, base_url)
+            with _shared_llm_clients_lock:
+                client = _shared_llm_clients.get(client_key)
+                if client is None:
+                    client = openai.OpenAI(
+                        api_key=api_key,
+                        base_url=base_url,
+                        max_retries=0
+                    )
+                    _shared_llm_clients[client_key] = client
             
             return client
             
@@ -79,6 +183,19 @@ class BaseAgent:
             print(f"Warning: Failed to initialize LLM client for {self.agent_type}:{self.agent_task_id}: {e}")
             return None
     
+    @property
+    def async_llm_client(self):
+        """Async LLM client, created on first use so sync-only callers never pay for it.
+        
+        Pooled agents can outlive an event loop (e.g. successive asyncio.run calls),
+        so the client is recreated whenever the running loop changes.
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_llm_client_loop is not loop:
+            self._async_llm_client = self._init_llm_client(async_client=True)
+            self._async_llm_client_loop = loop
+        return self._async_llm_client
+    
     def _start_execution(self, story_id: str, story_entry_id: Optional[int] = None, 
                     source_text: str = "") -> str:
         """Start new agent execution and return execution_id"""
@@ -91,6 +208,23 @@ class BaseAgent:
         final_story_id = "test" if story_id in ["1", "test"] else story_id
         final_story_entry_id = story_entry_id 
 
+        self._execution_metrics = {}
+        self._execution_record = {
+            'agent_id': self.config['agent_id'],
+            'story_id': final_story_id,
+            'story_entry_id': final_story_entry_id,
+            'source_text': source_text,
+            'request_time': self.execution_start_time.isoformat()
+        }
+
+        logger = get_execution_logger()
+        if logger:
+            # Write-behind: the row is inserted once, when the execution finishes
+            logger.open(self.execution_id, self._execution_record)
+            self.db_execution_id = None
+            print(f"[{self.agent_type}:{self.agent_task_id}] Started execution tracking (buffered: {self.execution_id})")
+            return self.execution_id
+
         print(f"DEBUG: About to insert execution record with agent_id={self.config['agent_id']}")
 
         # REMOVE THE TRY/CATCH TO SEE THE REAL ERROR
@@ -107,12 +241,18 @@ class BaseAgent:
         print(f"DEBUG: Successfully set self.db_execution_id = {self.db_execution_id}")
         return self.execution_id
     
+    def _update_execution_source(self, source_text: str):
+        """Replace the source text of the running execution (written when it finishes)"""
+        if getattr(self, '_execution_record', None) is not None:
+            self._execution_record['source_text'] = source_text
+    
     def _finish_execution(self, output_text: str, status_message: str = "Success", 
                          tokens: int = 0):
         """Complete agent execution with results"""
-        print(f"DEBUG: _finish_execution called with db_execution_id={getattr(self, 'db_execution_id', 'NOT SET')}")
+        print(f"DEBUG: _finish_execution called with execution_id={getattr(self, 'execution_id', 'NOT SET')}")
         
-        if not hasattr(self, 'db_execution_id') or self.db_execution_id is None:
+        record = getattr(self, '_execution_record', None)
+        if record is None:
             print(f"Warning: No execution ID to finish for {self.agent_type}:{self.agent_task_id}")
             return
             
@@ -127,18 +267,33 @@ class BaseAgent:
             # Use tokens from LLM call if available
             final_tokens = tokens or getattr(self, '_current_tokens', 0)
             
-            print(f"DEBUG: Updating execution record {self.db_execution_id}")
-            
-            # Update the specific execution record
-            self.db.execute("""
-                UPDATE agent_executions 
-                SET output_text = ?, output_time = ?, processing_duration_ms = ?,
-                    status_message = ?, tokens = ?, updated_at = ?
-                WHERE agent_execution_id = ?
-            """, (output_text, end_time.isoformat(), processing_duration,
-                  status_message, final_tokens, end_time.isoformat(), self.db_execution_id))
+            record.update(self._execution_metrics)
+            record.update({
+                'output_text': output_text,
+                'output_time': end_time.isoformat(),
+                'processing_duration_ms': processing_duration,
+                'status_message': status_message,
+                'tokens': final_tokens,
+                'updated_at': end_time.isoformat()
+            })
+            self._execution_record = None
             
-            self.db.commit()
+            logger = get_execution_logger()
+            if logger:
+                logger.submit(self.execution_id, record)
+            else:
+                print(f"DEBUG: Updating execution record {self.db_execution_id}")
+                
+                # Update the specific execution record (metric columns only if the table has them)
+                columns = [c for c in record
+                           if c in self._execution_columns() and c not in ('agent_id', 'story_id', 'request_time')]
+                self.db.execute(f"""
+                    UPDATE agent_executions 
+                    SET {', '.join(f'{c} = ?' for c in columns)}
+                    WHERE agent_execution_id = ?
+                """, [record[c] for c in columns] + [self.db_execution_id])
+                
+                self.db.commit()
             print(f"[{self.agent_type}:{self.agent_task_id}] Finished execution tracking (Duration: {processing_duration}ms, Tokens: {final_tokens})")
             
         except Exception as e:
@@ -146,69 +301,198 @@ class BaseAgent:
             import traceback
             traceback.print_exc()
     
+    def _execution_columns(self) -> set:
+        """Columns present in agent_executions (older databases lack the metric columns)"""
+        if getattr(self, '_execution_columns_cache', None) is None:
+            self._execution_columns_cache = {
+                row[1] for row in self.db.execute("PRAGMA table_info(agent_executions)")
+            }
+        return self._execution_columns_cache
+    
+    def _check_cancelled(self):
+        """Raise GenerationCancelled if this run has been cancelled"""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise GenerationCancelled(f"{self.agent_type}:{self.agent_task_id} generation cancelled")
+    
+    def _record_metrics(self, **metrics):
+        """Attach extra agent_executions columns to the running execution"""
+        self._execution_metrics.update(metrics)
+    
+    def _memo(self, name: str, key: tuple, compute):
+        """Run a story-scoped lookup once per request context, counting hits in the execution"""
+        if self.request_context is None:
+            return compute()
+        value, hit = self.request_context.get_or_compute(name, key, compute)
+        metric = 'memo_hits' if hit else 'memo_misses'
+        self._execution_metrics[metric] = self._execution_metrics.get(metric, 0) + 1
+        return value
+    
+    def _get_all_scene_relationships(self, story_id: str, scene_id: str) -> List[Dict]:
+        """All relationships in a scene with entity names, newest first (memoized per request context)
+        
+        Shared by PrepAgent (beat and scene context) and GeneratorAgent (recent relationships).
+        """
+        def query():
+            cursor = self.db.execute("""
+                SELECT r.*, 
+                       e1.name as entity1_name, e1.base_type as entity1_type,
+                       e2.name as entity2_name, e2.base_type as entity2_type,
+                       s1.entity_id as entity1_id, s2.entity_id as entity2_id
+                FROM relationships r
+                JOIN states s1 ON r.state_id1 = s1.state_id
+                JOIN states s2 ON r.state_id2 = s2.state_id  
+                JOIN entities e1 ON s1.entity_id = e1.entity_id
+                JOIN entities e2 ON s2.entity_id = e2.entity_id
+                WHERE r.story_id = ? AND r.scene_id = ?
+                ORDER BY r.created_at DESC
+            """, (story_id, scene_id))
+            
+            return [dict(row) for row in cursor.fetchall()]
+        
+        return self._memo('scene_relationships', (story_id, scene_id), query)
+    
+    def _invalidate_memo(self, *names: str):
+        """Drop memoized lookups this agent's writes have made stale"""
+        if self.request_context is not None:
+            self.request_context.invalidate(*names)
+    
     def call_llm(self, messages: List[Dict], **kwargs) -> str:
         """Shared LLM calling method with error handling and token tracking"""
         if not self.llm_client:
             raise Exception("LLM client not available - check API key and openai installation")
         
         try:
-            # Get model from environment variable or fall back to config
-            model = os.getenv("OPENAI_MODEL", self.config['model'])
-            
-            # Set default parameters
-            call_params = {
-                'model': model,
-                'messages': messages,
-                'max_tokens': kwargs.get('max_tokens', 1000),
-                'temperature': kwargs.get('temperature', 0.3)
-            }
-            
-            # Add any additional parameters
-            call_params.update({k: v for k, v in kwargs.items() if k not in ['max_tokens', 'temperature']})
-            
-            print(f"[{self.agent_type}:{self.agent_task_id}] Making LLM call:")
-            print(f"  Model: {call_params['model']}")
-            print(f"  Max tokens: {call_params['max_tokens']}")
-            print(f"  Temperature: {call_params['temperature']}")
-            print(f"  Message length: {len(str(messages))} chars")
-            print(f"  First 200 chars: {str(messages)[:200]}...")
-            
-            print(f"[{self.agent_type}:{self.agent_task_id}] Sending request to LLM...")
-            llm_start_time = datetime.now()
-            
-            response = self.llm_client.chat.completions.create(**call_params)
+            self._check_cancelled()
+            call_params = self._build_call_params(messages, **kwargs)
+            cached = self._get_cached_response(call_params)
+            if cached is not None:
+                return cached
             
-            llm_end_time = datetime.now()
-            llm_duration = int((llm_end_time - llm_start_time).total_seconds() * 1000)
+            def request():
+                self._log_llm_request(call_params)
+                llm_start_time = datetime.now()
+                
+                response = get_resilient_caller().call(
+                    lambda: self.llm_client.chat.completions.create(**call_params),
+                    call_params['model'], stats=self._execution_metrics
+                )
+                
+                result = self._handle_llm_response(response, llm_start_time)
+                self._store_cached_response(call_params, result)
+                return result
             
-            result = response.choices[0].message.content
-            
-            # Extract token usage if available
-            tokens_used = 0
-            if hasattr(response, 'usage') and response.usage:
-                tokens_used = getattr(response.usage, 'total_tokens', 0)
-            
-            print(f"[{self.agent_type}:{self.agent_task_id}] LLM response received:")
-            print(f"  Response length: {len(result)} chars")
-            print(f"  First 200 chars: {result[:200]}...")
-            print(f"  LLM duration: {llm_duration}ms")
-            print(f"  Tokens used: {tokens_used}")
-            
-            # Store tokens for finish_execution
-            self._current_tokens = tokens_used
+            if not single_flight_enabled():
+                return request()
             
+            # Identical concurrent requests share one upstream call
+            result, leader = get_single_flight().do(request_key(call_params), request)
+            if not leader:
+                self._mark_coalesced()
             return result
             
+        except GenerationCancelled:
+            raise
         except Exception as e:
             print(f"[{self.agent_type}:{self.agent_task_id}] LLM call failed: {str(e)}")
             self._current_tokens = 0
             raise Exception(f"LLM call failed for {self.agent_type}:{self.agent_task_id}: {str(e)}")
     
+    def _build_call_params(self, messages: List[Dict], stream: bool = False, **kwargs) -> Dict[str, Any]:
+        """Build chat completion parameters shared by the sync and async call paths"""
+        # Get model from environment variable or fall back to config
+        model = os.getenv("OPENAI_MODEL", self.config['model'])
+        
+        # Set default parameters
+        call_params = {
+            'model': model,
+            'messages': messages,
+            'max_tokens': kwargs.get('max_tokens', 1000),
+            'temperature': kwargs.get('temperature', 0.3)
+        }
+        if stream:
+            call_params['stream'] = True
+            # Ask for a final usage chunk so streamed runs record tokens (OPENAI_STREAM_USAGE=0 to disable)
+            if os.getenv("OPENAI_STREAM_USAGE", "1") != "0":
+                call_params['stream_options'] = {'include_usage': True}
+        
+        # Add any additional parameters
+        call_params.update({k: v for k, v in kwargs.items() if k not in ['max_tokens', 'temperature']})
+        return call_params
+    
+    def _get_cached_response(self, call_params: Dict[str, Any]) -> Optional[str]:
+        """Return a cached response when this agent opted into caching (agents.cache_ttl_seconds)"""
+        if not self.config.get('cache_ttl_seconds'):
+            return None
+        
+        cached = get_response_cache().get(request_key(call_params))
+        if cached is not None:
+            print(f"[{self.agent_type}:{self.agent_task_id}] LLM response served from cache")
+            # Cached responses consume no tokens
+            self._current_tokens = 0
+        return cached
+    
+    def _store_cached_response(self, call_params: Dict[str, Any], result: str):
+        """Remember a fresh response for agents that opted into caching"""
+        ttl_seconds = self.config.get('cache_ttl_seconds')
+        if not ttl_seconds or not result:
+            return
+        
+        try:
+            get_response_cache().put(request_key(call_params), result, ttl_seconds,
+                                     model=call_params['model'], tokens=self._current_tokens)
+        except Exception as e:
+            print(f"Warning: Could not cache LLM response for {self.agent_type}:{self.agent_task_id}: {e}")
+    
+    def _mark_coalesced(self):
+        """Record that this call reused another caller's in-flight LLM request"""
+        # The leader's execution owns the token usage
+        self._current_tokens = 0
+        self._record_metrics(coalesced=True)
+        print(f"[{self.agent_type}:{self.agent_task_id}] Joined identical in-flight LLM request")
+    
+    def _log_llm_request(self, call_params: Dict[str, Any]):
+        """Print request details before sending a non-streaming LLM call"""
+        messages = call_params['messages']
+        print(f"[{self.agent_type}:{self.agent_task_id}] Making LLM call:")
+        print(f"  Model: {call_params['model']}")
+        print(f"  Max tokens: {call_params['max_tokens']}")
+        print(f"  Temperature: {call_params['temperature']}")
+        print(f"  Message length: {len(str(messages))} chars")
+        print(f"  First 200 chars: {str(messages)[:200]}...")
+        print(f"[{self.agent_type}:{self.agent_task_id}] Sending request to LLM...")
+    
+    def _handle_llm_response(self, response, llm_start_time: datetime) -> str:
+        """Extract text and token usage from a non-streaming completion response"""
+        llm_end_time = datetime.now()
+        llm_duration = int((llm_end_time - llm_start_time).total_seconds() * 1000)
+        
+        result = response.choices[0].message.content
+        
+        # Extract token usage if available
+        tokens_used = 0
+        if hasattr(response, 'usage') and response.usage:
+            tokens_used = getattr(response.usage, 'total_tokens', 0)
+            self._record_metrics(prompt_tokens=getattr(response.usage, 'prompt_tokens', None),
+                                 completion_tokens=getattr(response.usage, 'completion_tokens', None))
+        
+        print(f"[{self.agent_type}:{self.agent_task_id}] LLM response received:")
+        print(f"  Response length: {len(result)} chars")
+        print(f"  First 200 chars: {result[:200]}...")
+        print(f"  LLM duration: {llm_duration}ms")
+        print(f"  Tokens used: {tokens_used}")
+        
+        # Store tokens for finish_execution
+        self._current_tokens = tokens_used
+        
+        return result
+    
     def call_llm_with_fallback(self, messages: List[Dict], fallback_func, **kwargs) -> str:
         """Call LLM with fallback function if LLM fails"""
         try:
             print(f"[{self.agent_type}:{self.agent_task_id}] Attempting LLM call with fallback...")
             return self.call_llm(messages, **kwargs)
+        except GenerationCancelled:
+            raise
         except Exception as e:
             print(f"[{self.agent_type}:{self.agent_task_id}] LLM call failed: {e}, using fallback")
             print(f"[{self.agent_type}:{self.agent_task_id}] Executing fallback function...")
@@ -226,39 +510,111 @@ class BaseAgent:
             raise Exception("LLM client not available - check API key and openai installation")
 
         try:
-            model = os.getenv("OPENAI_MODEL", self.config['model'])
-            call_params = {
-                'model': model,
-                'messages': messages,
-                'max_tokens': kwargs.get('max_tokens', 1000),
-                'temperature': kwargs.get('temperature', 0.3),
-                'stream': True
-            }
+            self._check_cancelled()
+            call_params = self._build_call_params(messages, stream=True, **kwargs)
 
-            call_params.update({k: v for k, v in kwargs.items() if k not in ['max_tokens', 'temperature']})
+            flight, leader = None, True
+            if single_flight_enabled():
+                key = request_key(call_params)
+                flight, leader = get_single_flight().join_stream(key)
+            if not leader:
+                return self._follow_stream(flight, on_chunk)
 
             print(f"[{self.agent_type}:{self.agent_task_id}] Starting streaming LLM call...")
 
-            response = self.llm_client.chat.completions.create(**call_params)
-
+            metrics = StreamMetrics()
             collected = []
-            for chunk in response:
-                delta = chunk.choices[0].delta.content
-                if delta:
-                    collected.append(delta)
-                    on_chunk(delta)
+            error = None
+            try:
+                # Retries cover opening the stream; a stream that breaks mid-way goes to the fallback
+                response = get_resilient_caller().call(
+                    lambda: self.llm_client.chat.completions.create(**call_params),
+                    call_params['model'], hedge=False, stats=self._execution_metrics
+                )
+                try:
+                    for chunk in response:
+                        if self.cancel_event is not None and self.cancel_event.is_set():
+                            # Closing the response stops the upstream HTTP read
+                            self._close_stream(response)
+                            self._check_cancelled()
+                        delta = self._stream_chunk_delta(chunk, metrics)
+                        if delta:
+                            collected.append(delta)
+                            if flight:
+                                flight.publish(delta)
+                            on_chunk(delta)
+                finally:
+                    self._finish_stream_metrics(metrics)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                if flight:
+                    get_single_flight().end_stream(key, flight, error)
 
             full_text = ''.join(collected)
             return full_text
 
+        except GenerationCancelled:
+            print(f"[{self.agent_type}:{self.agent_task_id}] Streaming LLM call cancelled")
+            raise
         except Exception as e:
             print(f"[{self.agent_type}:{self.agent_task_id}] Streaming LLM call failed: {str(e)}")
             raise
 
+    def _close_stream(self, response):
+        """Close a streamed response early (sync or async SDK streams); returns an awaitable for async ones"""
+        close = getattr(response, 'close', None) or getattr(response, 'aclose', None)
+        if close is None:
+            return None
+        try:
+            return close()
+        except Exception as e:
+            print(f"[{self.agent_type}:{self.agent_task_id}] Failed to close stream: {e}")
+            return None
+
+    def _follow_stream(self, flight, on_chunk) -> str:
+        """Replay another caller's identical stream: received prefix first, then the live tail"""
+        print(f"[{self.agent_type}:{self.agent_task_id}] Following identical in-flight stream "
+              f"({len(flight.chunks)} chunks already received)")
+        metrics = StreamMetrics()
+        collected = []
+        try:
+            for delta in flight.replay():
+                self._check_cancelled()
+                metrics.on_chunk()
+                collected.append(delta)
+                on_chunk(delta)
+        finally:
+            self._finish_stream_metrics(metrics)
+            self._record_metrics(coalesced=True)
+        return ''.join(collected)
+
+    def _stream_chunk_delta(self, chunk, metrics: StreamMetrics) -> Optional[str]:
+        """Return the content delta of a stream chunk, recording timing and usage"""
+        if getattr(chunk, 'usage', None):
+            metrics.on_usage(chunk.usage)
+        if not chunk.choices:
+            return None
+        delta = chunk.choices[0].delta.content
+        if delta:
+            metrics.on_chunk()
+        return delta
+    
+    def _finish_stream_metrics(self, metrics: StreamMetrics):
+        """Store stream metrics on the running execution and set token usage"""
+        self._current_tokens = metrics.total_tokens()
+        record = metrics.as_record()
+        self._record_metrics(**record)
+        print(f"[{self.agent_type}:{self.agent_task_id}] Stream finished: TTFT {record['time_to_first_token_ms']}ms, "
+              f"{record['chunk_count']} chunks, p95 gap {record['inter_chunk_p95_ms']}ms, tokens {self._current_tokens}")
+    
     def call_llm_stream_with_fallback(self, messages: List[Dict], on_chunk, fallback_func, **kwargs) -> str:
         """Call LLM in streaming mode with fallback"""
         try:
             return self.call_llm_stream(messages, on_chunk, **kwargs)
+        except GenerationCancelled:
+            raise
         except Exception:
             self._current_tokens = 0
             result = fallback_func()
@@ -266,6 +622,231 @@ class BaseAgent:
                 on_chunk(result)
             return result
     
+    def call_llm_stream_variants(self, messages: List[Dict], n: int, on_chunk, **kwargs) -> List[str]:
+        """Stream n independent completions of one prompt concurrently
+
+        on_chunk(index, delta) receives every delta tagged with its variant index.
+        LLM_VARIANT_STRATEGY picks how the variants are requested: 'n' (default) asks
+        for n choices in a single streamed request and demultiplexes them by
+        choice.index; 'parallel' opens n streams at once, for providers without n.
+        Variants are meant to differ, so they bypass the response cache and
+        single-flight coalescing.
+        """
+        if not self.llm_client:
+            raise Exception("LLM client not available - check API key and openai installation")
+
+        try:
+            self._check_cancelled()
+            strategy = os.getenv("LLM_VARIANT_STRATEGY", "n")
+            print(f"[{self.agent_type}:{self.agent_task_id}] Starting {n} streamed variants ({strategy})...")
+
+            metrics = StreamMetrics()
+            collected: List[List[str]] = [[] for _ in range(n)]
+            lock = threading.Lock()
+            tokens = []
+
+            def consume(params: Dict[str, Any], index_offset: int):
+                # Retries cover opening the stream; a stream that breaks mid-way fails the call
+                response = get_resilient_caller().call(
+                    lambda: self.llm_client.chat.completions.create(**params),
+                    params['model'], hedge=False, stats=self._execution_metrics
+                )
+                for chunk in response:
+                    if self.cancel_event is not None and self.cancel_event.is_set():
+                        self._close_stream(response)
+                        self._check_cancelled()
+                    with lock:
+                        if getattr(chunk, 'usage', None):
+                            tokens.append(getattr(chunk.usage, 'total_tokens', 0) or 0)
+                            metrics.on_usage(chunk.usage)
+                        deltas = [(index_offset + choice.index, choice.delta.content)
+                                  for choice in chunk.choices or [] if choice.delta.content]
+                        if deltas:
+                            metrics.on_chunk()
+                        for index, delta in deltas:
+                            if index < n:
+                                collected[index].append(delta)
+                                on_chunk(index, delta)
+
+            try:
+                if strategy == "parallel":
+                    call_params = self._build_call_params(messages, stream=True, **kwargs)
+                    with ThreadPoolExecutor(max_workers=n) as pool:
+                        futures = [pool.submit(consume, call_params, index) for index in range(n)]
+                        for future in futures:
+                            future.result()
+                else:
+                    consume(self._build_call_params(messages, stream=True, n=n, **kwargs), 0)
+            finally:
+                self._finish_stream_metrics(metrics)
+                # Parallel streams each report their own usage
+                self._current_tokens = sum(tokens)
+
+            return [''.join(parts) for parts in collected]
+
+        except GenerationCancelled:
+            print(f"[{self.agent_type}:{self.agent_task_id}] Streaming variants cancelled")
+            raise
+        except Exception as e:
+            print(f"[{self.agent_type}:{self.agent_task_id}] Streaming variants failed: {str(e)}")
+            raise
+    
+    async def call_llm_async(self, messages: List[Dict], **kwargs) -> str:
+        """Async counterpart of call_llm - awaits the completion without holding a worker thread"""
+        client = self.async_llm_client
+        if not client:
+            raise Exception("LLM client not available - check API key and openai installation")
+        
+        try:
+            self._check_cancelled()
+            call_params = self._build_call_params(messages, **kwargs)
+            cached = self._get_cached_response(call_params)
+            if cached is not None:
+                return cached
+            
+            async def request():
+                self._log_llm_request(call_params)
+                llm_start_time = datetime.now()
+                
+                response = await get_resilient_caller().call_async(
+                    lambda: client.chat.completions.create(**call_params),
+                    call_params['model'], stats=self._execution_metrics
+                )
+                
+                result = self._handle_llm_response(response, llm_start_time)
+                self._store_cached_response(call_params, result)
+                return result
+            
+            if not single_flight_enabled():
+                return await request()
+            
+            result, leader = await get_async_single_flight().do(request_key(call_params), request)
+            if not leader:
+                self._mark_coalesced()
+            return result
+            
+        except GenerationCancelled:
+            raise
+        except Exception as e:
+            print(f"[{self.agent_type}:{self.agent_task_id}] Async LLM call failed: {str(e)}")
+            self._current_tokens = 0
+            raise Exception(f"LLM call failed for {self.agent_type}:{self.agent_task_id}: {str(e)}")
+    
+    async def call_llm_with_fallback_async(self, messages: List[Dict], fallback_func, **kwargs) -> str:
+        """Async call_llm_with_fallback - fallback_func may be a plain function or a coroutine function"""
+        try:
+            print(f"[{self.agent_type}:{self.agent_task_id}] Attempting async LLM call with fallback...")
+            return await self.call_llm_async(messages, **kwargs)
+        except GenerationCancelled:
+            raise
+        except Exception as e:
+            print(f"[{self.agent_type}:{self.agent_task_id}] Async LLM call failed: {e}, using fallback")
+            self._current_tokens = 0
+            
+            result = fallback_func()
+            if inspect.isawaitable(result):
+                result = await result
+            print(f"[{self.agent_type}:{self.agent_task_id}] Fallback completed, returned: {type(result)} with {len(str(result))} chars")
+            return result
+    
+    async def stream_llm_async(self, messages: List[Dict], **kwargs) -> AsyncIterator[str]:
+        """Async iterator over streamed content deltas"""
+        client = self.async_llm_client
+        if not client:
+            raise Exception("LLM client not available - check API key and openai installation")
+        
+        self._check_cancelled()
+        call_params = self._build_call_params(messages, stream=True, **kwargs)
+        
+        flight, leader = None, True
+        if single_flight_enabled():
+            key = request_key(call_params)
+            single_flight = get_async_single_flight()
+            flight, leader = single_flight.join_stream(key)
+        
+        metrics = StreamMetrics()
+        if not leader:
+            print(f"[{self.agent_type}:{self.agent_task_id}] Following identical in-flight stream "
+                  f"({len(flight.chunks)} chunks already received)")
+            try:
+                async for delta in flight.replay():
+                    self._check_cancelled()
+                    metrics.on_chunk()
+                    yield delta
+            finally:
+                self._finish_stream_metrics(metrics)
+                self._record_metrics(coalesced=True)
+            return
+        
+        print(f"[{self.agent_type}:{self.agent_task_id}] Starting async streaming LLM call...")
+        error = None
+        try:
+            response = await get_resilient_caller().call_async(
+                lambda: client.chat.completions.create(**call_params),
+                call_params['model'], hedge=False, stats=self._execution_metrics
+            )
+            try:
+                async for chunk in response:
+                    if self.cancel_event is not None and self.cancel_event.is_set():
+                        closing = self._close_stream(response)
+                        if inspect.isawaitable(closing):
+                            await closing
+                        self._check_cancelled()
+                    delta = self._stream_chunk_delta(chunk, metrics)
+                    if delta:
+                        if flight:
+                            flight.publish(delta)
+                        yield delta
+            finally:
+                self._finish_stream_metrics(metrics)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if flight:
+                single_flight.end_stream(key, flight, error)
+    
+    async def call_llm_stream_async(self, messages: List[Dict], on_chunk, **kwargs) -> str:
+        """Async call_llm_stream - on_chunk may be a plain callback or a coroutine function"""
+        try:
+            collected = []
+            async for delta in self.stream_llm_async(messages, **kwargs):
+                collected.append(delta)
+                result = on_chunk(delta)
+                if inspect.isawaitable(result):
+                    await result
+            
+            return ''.join(collected)
+            
+        except Exception as e:
+            print(f"[{self.agent_type}:{self.agent_task_id}] Async streaming LLM call failed: {str(e)}")
+            raise
+    
+    async def call_llm_stream_with_fallback_async(self, messages: List[Dict], on_chunk, fallback_func, **kwargs) -> str:
+        """Async call_llm_stream_with_fallback"""
+        try:
+            return await self.call_llm_stream_async(messages, on_chunk, **kwargs)
+        except GenerationCancelled:
+            raise
+        except Exception:
+            self._current_tokens = 0
+            result = fallback_func()
+            if inspect.isawaitable(result):
+                result = await result
+            if result:
+                chunk_result = on_chunk(result)
+                if inspect.isawaitable(chunk_result):
+                    await chunk_result
+            return result
+    
     def execute(self, **kwargs) -> Dict[str, Any]:
         """Main execution method - override in subclasses"""
-        raise NotImplementedError("Subclasses must implement execute method")
\ No newline at end of file
+        raise NotImplementedError("Subclasses must implement execute method")
+    
+    async def execute_async(self, **kwargs) -> Dict[str, Any]:
+        """Async execution entry point - agents that call the LLM override this.
+        
+        Agents without LLM calls (e.g. PrepAgent) only do short SQLite reads, so the
+        default simply runs execute() in the calling coroutine.
+        """
+        return self.execute(**kwargs)
\ No newline at end of file
@@ -0,0 +1,222 @@
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import weakref
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional
+
+
+class PoolExhaustedError(Exception):
+    """Raised when no pooled connection frees up within the acquire timeout"""
+
+
+class PooledConnection:
+    """sqlite3 connection checked out of a ConnectionPool
+
+    Behaves like the wrapped connection; close() hands it back to the pool
+    instead of closing it. Using it after close() raises ProgrammingError.
+    """
+
+    def __init__(self, pool: 'ConnectionPool', conn: sqlite3.Connection):
+        self._pool = pool
+        self._conn = conn
+        self.checked_out_at = time.monotonic()
+        self.checked_out_by = threading.current_thread().name
+        self.checkout_stack = traceback.format_stack(limit=8)[:-2] if pool.track_stacks else None
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get('_conn')
+        if conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a connection returned to the pool")
+        return getattr(conn, name)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return self._conn.__exit__(exc_type, exc_val, exc_tb)
+
+    def close(self):
+        """Return the connection to its pool"""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool._release(self, conn)
+
+    def __del__(self):
+        if self.__dict__.get('_conn') is not None:
+            print(f"Warning: [ConnectionPool:{self._pool.name}] connection from {self.checked_out_by} "
+                  f"was garbage collected without close(), reclaiming it")
+            self.close()
+
+
+class ConnectionPool:
+    """Bounded pool of reused, tuned SQLite connections
+
+    Every connection runs in WAL mode with synchronous=NORMAL, a larger page cache,
+    memory-mapped I/O and an enlarged prepared-statement cache, so readers keep
+    reading while a generation commits. Read-only pools open the database with
+    mode=ro and query_only so REST reads can never take the write lock.
+
+    Connections held longer than leak_seconds are reported (with the checkout
+    stack when track_stacks is on) whenever the pool runs dry, and by leaks().
+    """
+
+    def __init__(self, db_path: str, max_size: int = 8, readonly: bool = False,
+                 acquire_timeout: float = 10.0, busy_timeout_ms: int = 5000,
+                 cache_size_kb: int = 32768, mmap_size: int = 256 * 1024 * 1024,
+                 cached_statements: int = 256, leak_seconds: float = 30.0,
+                 track_stacks: bool = True, name: Optional[str] = None):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.readonly = readonly
+        self.acquire_timeout = acquire_timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+        self.leak_seconds = leak_seconds
+        self.track_stacks = track_stacks
+        self.name = name or ('read' if readonly else 'write')
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._idle: List[sqlite3.Connection] = []
+        # Weak references, so a connection dropped without close() is reclaimed by __del__
+        self._in_use: Dict[int, weakref.ref] = {}
+        self._closed = False
+        self._stats = {'created': 0, 'acquired': 0, 'reused': 0, 'waits': 0, 'timeouts': 0,
+                       'rollbacks': 0, 'leaks_reported': 0}
+
+    @classmethod
+    def from_env(cls, db_path: str, readonly: bool = False) -> 'ConnectionPool':
+        """Pool sized from DB_POOL_SIZE / DB_READ_POOL_SIZE, tuned by DB_CACHE_SIZE_KB / DB_MMAP_SIZE"""
+        size_var = "DB_READ_POOL_SIZE" if readonly else "DB_POOL_SIZE"
+        return cls(db_path,
+                   max_size=int(os.getenv(size_var, "8")),
+                   readonly=readonly,
+                   cache_size_kb=int(os.getenv("DB_CACHE_SIZE_KB", "32768")),
+                   mmap_size=int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024))),
+                   leak_seconds=float(os.getenv("DB_LEAK_SECONDS", "30")))
+
+    def acquire(self) -> PooledConnection:
+        """Check out a connection; call close() on it (or use connection()) to return it"""
+        if self._closed:
+            raise sqlite3.ProgrammingError(f"Connection pool {self.name} is closed")
+
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['waits'] += 1
+            self.report_leaks()
+            if not self._slots.acquire(timeout=self.acquire_timeout):
+                with self._lock:
+                    self._stats['timeouts'] += 1
+                raise PoolExhaustedError(
+                    f"No {self.name} connection available after {self.acquire_timeout}s "
+                    f"({self.max_size} in use)")
+
+        try:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self._connect()
+            else:
+                with self._lock:
+                    self._stats['reused'] += 1
+        except BaseException:
+            self._slots.release()
+            raise
+
+        pooled = PooledConnection(self, conn)
+        with self._lock:
+            self._in_use[id(pooled)] = weakref.ref(pooled)
+            self._stats['acquired'] += 1
+        return pooled
+
+    @contextmanager
+    def connection(self):
+        """Context manager around acquire()/close()"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def leaks(self) -> List[PooledConnection]:
+        """Checked-out connections held longer than leak_seconds"""
+        now = time.monotonic()
+        with self._lock:
+            held = [ref() for ref in self._in_use.values()]
+        return [c for c in held if c is not None and now - c.checked_out_at > self.leak_seconds]
+
+    def report_leaks(self):
+        """Print every connection held longer than leak_seconds"""
+        now = time.monotonic()
+        for conn in self.leaks():
+            with self._lock:
+                self._stats['leaks_reported'] += 1
+            print(f"Warning: [ConnectionPool:{self.name}] connection held by {conn.checked_out_by} "
+                  f"for {now - conn.checked_out_at:.1f}s, possible leak")
+            if conn.checkout_stack:
+                print(''.join(conn.checkout_stack).rstrip())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(name=self.name, max_size=self.max_size, idle=len(self._idle),
+                         in_use=len(self._in_use))
+        return stats
+
+    def close(self):
+        """Close idle connections; connections still checked out are closed when returned"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.readonly:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False,
+                                   timeout=self.busy_timeout_ms / 1000.0,
+                                   cached_statements=self.cached_statements)
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                                   timeout=self.busy_timeout_ms / 1000.0,
+                                   cached_statements=self.cached_statements)
+            # WAL is a property of the database file; readers inherit it
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        if self.readonly:
+            conn.execute("PRAGMA query_only=1")
+        with self._lock:
+            self._stats['created'] += 1
+        return conn
+
+    def _release(self, pooled: PooledConnection, conn: sqlite3.Connection):
+        with self._lock:
+            self._in_use.pop(id(pooled), None)
+        try:
+            if conn.in_transaction:
+                print(f"Warning: [ConnectionPool:{self.name}] connection from {pooled.checked_out_by} "
+                      f"returned with an open transaction, rolling back")
+                conn.rollback()
+                with self._lock:
+                    self._stats['rollbacks'] += 1
+            with self._lock:
+                keep = not self._closed
+                if keep:
+                    self._idle.append(conn)
+            if not keep:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Warning: [ConnectionPool:{self.name}] dropping broken connection: {e}")
+            conn.close()
+        finally:
+            self._slots.release()
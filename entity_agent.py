@@ -44,7 +44,30 @@ class EntityAgent(BaseAgent):
             self._finish_execution("", f"Error: {str(e)}")
             return {'success': False, 'error': str(e)}
     
-    def _task1_raw_extraction(self, story_text: str, story_context: Dict, extract_only: bool) -> Dict[str, Any]:
+    async def execute_async(self, story_text: str, story_context: Dict, extract_only: bool = False,
+                            entity_names: List[str] = None) -> Dict[str, Any]:
+        """Async execute - only Task 1 calls the LLM, the other tasks run as in execute()"""
+        if self.agent_task_id != 1:
+            return self.execute(story_text, story_context, extract_only, entity_names)
+        
+        self._start_execution(
+            story_context['story_id'], 
+            None,
+            f"Task {self.agent_task_id}: {story_text[:100]}..."
+        )
+        
+        try:
+            extracted_names = await self._extract_entities_with_database_prompt_async(
+                story_text, story_context['story_id']
+            )
+            return self._task1_raw_extraction(story_text, story_context, extract_only, extracted_names)
+                
+        except Exception as e:
+            self._finish_execution("", f"Error: {str(e)}")
+            return {'success': False, 'error': str(e)}
+    
+    def _task1_raw_extraction(self, story_text: str, story_context: Dict, extract_only: bool,
+                              extracted_names: Optional[List[str]] = None) -> Dict[str, Any]:
        """Task 1: Extract raw entity names from text using LLM"""
        print(f"[EntityAgent:1] Starting raw entity extraction")
        
@@ -54,15 +77,14 @@ class EntityAgent(BaseAgent):
            existing_names = [e['name'] for e in existing_entities]
            extraction_prompt = self._build_database_prompt(story_text, existing_names)
            
-           # NOW start execution tracking with the actual LLM prompt
-           execution_id = self._start_execution(
-               story_context['story_id'], 
-               None,
-               extraction_prompt  # ✅ Full LLM prompt as source_text
-           )
+           # Record the actual LLM prompt on the execution execute() already started
+           self._update_execution_source(extraction_prompt)  # ✅ Full LLM prompt as source_text
            
-           # Extract entity names using LLM with database prompt
-           entity_names = self._extract_entities_with_database_prompt(story_text, story_context['story_id'])
+           # Extract entity names using LLM with database prompt (async callers extract up front)
+           if extracted_names is not None:
+               entity_names = extracted_names
+           else:
+               entity_names = self._extract_entities_with_database_prompt(story_text, story_context['story_id'])
            
            # Get tokens used from LLM call
            tokens_used = getattr(self, '_current_tokens', 0)
@@ -171,17 +193,20 @@ class EntityAgent(BaseAgent):
     # Remove _enhanced_simple_extraction method
 
     def _get_entity_aliases_for_matching(self, story_id: str) -> List[Dict]:
-        """Get entity aliases with metadata for matching"""
-        cursor = self.db.execute("""
-            SELECT ea.alias_name, ea.entity_id, ea.alias_type,
-                   e.name as entity_name, e.base_type, e.type
-            FROM entity_aliases ea
-            JOIN entities e ON ea.entity_id = e.entity_id
-            WHERE e.story_id = ?
-            ORDER BY ea.alias_type, ea.alias_name
-        """, (story_id,))
-        
-        return [dict(row) for row in cursor.fetchall()]
+        """Get entity aliases with metadata for matching (memoized per request context)"""
+        def query():
+            cursor = self.db.execute("""
+                SELECT ea.alias_name, ea.entity_id, ea.alias_type,
+                       e.name as entity_name, e.base_type, e.type
+                FROM entity_aliases ea
+                JOIN entities e ON ea.entity_id = e.entity_id
+                WHERE e.story_id = ?
+                ORDER BY ea.alias_type, ea.alias_name
+            """, (story_id,))
+            
+            return [dict(row) for row in cursor.fetchall()]
+        
+        return self._memo('entity_aliases', (story_id,), query)
 
     def _find_best_string_match(self, entity_name: str, entity_aliases: List[Dict]) -> Dict:
         """Find best string match using multiple strategies"""
@@ -337,22 +362,7 @@ class EntityAgent(BaseAgent):
         print(f"[EntityAgent:1] Using database prompt for extraction")
         
         try:
-            # Get existing entities for context
-            existing_entities = self._get_existing_entities(story_id)
-            existing_names = [e['name'] for e in existing_entities]
-            
-            # Build prompt using database instructions + context
-            extraction_prompt = self._build_database_prompt(text, existing_names)
-            
-            print(f"[EntityAgent:1] Built prompt with {len(extraction_prompt)} characters")
-            print(f"[EntityAgent:1] Database instructions: {self.config['instructions'][:100]}...")
-            
-            # Prepare fallback function
-            def fallback_extraction():
-                print(f"[EntityAgent:1] Using fallback extraction")
-                return self._fallback_raw_extraction(text, existing_entities)
-            
-            messages = [{"role": "user", "content": extraction_prompt}]
+            messages, fallback_extraction = self._prepare_extraction(text, story_id)
             
             # Use LLM with fallback
             llm_response = self.call_llm_with_fallback(
@@ -362,29 +372,78 @@ class EntityAgent(BaseAgent):
                 temperature=0.3
             )
             
-            print(f"[EntityAgent:1] LLM response received: {len(str(llm_response))} chars")
+            return self._parse_extraction_response(llm_response, fallback_extraction)
             
-            # Parse response to extract entity names AND preserve raw data
-            # After getting llm_response, store it for debugging
-            if isinstance(llm_response, str) and llm_response.strip():
-                self._last_llm_response = llm_response  # Store raw response
-                entity_names, raw_entities = self._parse_entity_names_with_metadata(llm_response)
-                if entity_names:
-                    print(f"[EntityAgent:1] Successfully extracted {len(entity_names)} entities: {entity_names}")
-                    if raw_entities:
-                        print(f"[EntityAgent:1] Raw entity data: {raw_entities}")
-                    return entity_names
+        except Exception as e:
+            print(f"[EntityAgent:1] LLM extraction failed: {e}, falling back")
+            return self._fallback_raw_extraction(text, self._get_existing_entities(story_id))
+    
+    async def _extract_entities_with_database_prompt_async(self, text: str, story_id: str) -> List[str]:
+        """Async _extract_entities_with_database_prompt"""
+        print(f"[EntityAgent:1] Using database prompt for async extraction")
+        
+        try:
+            messages, fallback_extraction = self._prepare_extraction(text, story_id)
             
-            # Fall back if parsing failed
-            print(f"[EntityAgent:1] LLM parsing failed, using fallback")
-            return fallback_extraction()
+            llm_response = await self.call_llm_with_fallback_async(
+                messages=messages,
+                fallback_func=fallback_extraction,
+                max_tokens=500,
+                temperature=0.3
+            )
+            
+            return self._parse_extraction_response(llm_response, fallback_extraction)
             
         except Exception as e:
-            print(f"[EntityAgent:1] LLM extraction failed: {e}, falling back")
+            print(f"[EntityAgent:1] Async LLM extraction failed: {e}, falling back")
             return self._fallback_raw_extraction(text, self._get_existing_entities(story_id))
     
+    def _prepare_extraction(self, text: str, story_id: str):
+        """Build extraction messages and fallback function for Task 1"""
+        # Get existing entities for context
+        existing_entities = self._get_existing_entities(story_id)
+        existing_names = [e['name'] for e in existing_entities]
+        
+        # Build prompt using database instructions + context
+        extraction_prompt = self._build_database_prompt(text, existing_names)
+        
+        print(f"[EntityAgent:1] Built prompt with {len(extraction_prompt)} characters")
+        print(f"[EntityAgent:1] Database instructions: {self.config['instructions'][:100]}...")
+        
+        # Prepare fallback function
+        def fallback_extraction():
+            print(f"[EntityAgent:1] Using fallback extraction")
+            return self._fallback_raw_extraction(text, existing_entities)
+        
+        messages = [{"role": "user", "content": extraction_prompt}]
+        return messages, fallback_extraction
+    
+    def _parse_extraction_response(self, llm_response, fallback_extraction) -> List[str]:
+        """Parse the Task 1 LLM response into entity names, falling back if parsing fails"""
+        print(f"[EntityAgent:1] LLM response received: {len(str(llm_response))} chars")
+        
+        # Parse response to extract entity names AND preserve raw data
+        # After getting llm_response, store it for debugging
+        if isinstance(llm_response, str) and llm_response.strip():
+            self._last_llm_response = llm_response  # Store raw response
+            entity_names, raw_entities = self._parse_entity_names_with_metadata(llm_response)
+            if entity_names:
+                print(f"[EntityAgent:1] Successfully extracted {len(entity_names)} entities: {entity_names}")
+                if raw_entities:
+                    print(f"[EntityAgent:1] Raw entity data: {raw_entities}")
+                return entity_names
+        
+        # Fall back if parsing failed
+        print(f"[EntityAgent:1] LLM parsing failed, using fallback")
+        return fallback_extraction()
+    
     def _build_database_prompt(self, text: str, existing_names: List[str]) -> str:
-        """Build prompt using database instructions plus context"""
+        """Build prompt using database instructions plus context (memoized per request context)"""
+        return self._memo('extraction_prompt', (text, tuple(existing_names[:10])),
+                          lambda: self._compose_database_prompt(text, existing_names))
+    
+    def _compose_database_prompt(self, text: str, existing_names: List[str]) -> str:
+        """Combine database instructions, existing entity names and the text to analyze"""
         context_parts = []
         
         # Add existing entities context if available
@@ -586,25 +645,31 @@ class EntityAgent(BaseAgent):
         }
     
     def _get_existing_entities(self, story_id: str) -> List[Dict]:
-        """Get all existing entities in the story"""
-        cursor = self.db.execute("""
-            SELECT entity_id, name, type, base_type, description
-            FROM entities 
-            WHERE story_id = ?
-            ORDER BY name
-        """, (story_id,))
+        """Get all existing entities in the story (memoized per request context)"""
+        def query():
+            cursor = self.db.execute("""
+                SELECT entity_id, name, type, base_type, description
+                FROM entities 
+                WHERE story_id = ?
+                ORDER BY name
+            """, (story_id,))
+            
+            return [dict(row) for row in cursor.fetchall()]
         
-        return [dict(row) for row in cursor.fetchall()]
+        return self._memo('existing_entities', (story_id,), query)
     
     def _find_existing_entity_by_name(self, name: str, story_id: str) -> Optional[Dict]:
-        """Find existing entity by exact name match"""
-        cursor = self.db.execute("""
-            SELECT * FROM entities 
-            WHERE story_id = ? AND LOWER(name) = LOWER(?)
-        """, (story_id, name))
+        """Find existing entity by exact name match (memoized per request context)"""
+        def query():
+            cursor = self.db.execute("""
+                SELECT * FROM entities 
+                WHERE story_id = ? AND LOWER(name) = LOWER(?)
+            """, (story_id, name))
+            
+            existing = cursor.fetchone()
+            return dict(existing) if existing else None
         
-        existing = cursor.fetchone()
-        return dict(existing) if existing else None
+        return self._memo('entity_by_name', (story_id, name.lower()), query)
     
     def _create_simple_entity(self, name: str, story_id: str) -> int:
         """Create simple entity with default class"""
@@ -636,18 +701,14 @@ class EntityAgent(BaseAgent):
         """, (entity_id, name, 'primary'))
         
         self.db.commit()
+        self._invalidate_memo('existing_entities', 'entity_by_name', 'entity_aliases', 'extraction_prompt')
         return entity_id
     
     # String matching methods (used by Task 2)
     def resolve_entities_step1_string_matching(self, extracted_names: List[str], story_id: str) -> Dict[str, Any]:
         """String-based entity resolution against aliases table"""
-        # Get all entity aliases
-        entity_aliases = self.db.execute("""
-            SELECT ea.alias_name, ea.entity_id, e.name as entity_name 
-            FROM entity_aliases ea
-            JOIN entities e ON ea.entity_id = e.entity_id
-            WHERE e.story_id = ?
-        """, (story_id,)).fetchall()
+        # Get all entity aliases (shared with Task 2's matching lookup)
+        entity_aliases = self._get_entity_aliases_for_matching(story_id)
         
         results = {}
         
@@ -1,7 +1,8 @@
 import json
-import re
+from datetime import datetime
 from typing import Dict, Any, List
 from base_agent import BaseAgent
+from stream_segmenter import PARAGRAPH_BREAK, SCENE_HEADER
 
 class EvalAgent(BaseAgent):
     """Evaluates raw generation output and determines scene/beat boundaries."""
@@ -10,51 +11,90 @@ class EvalAgent(BaseAgent):
         """Evaluate raw text and determine beat/scene boundaries."""
         execution_id = self._start_execution(story_id, source_text=text)
         try:
-            prompt = f"{self.config['instructions']}\n\n{text}"
-
-            def heuristic_eval() -> str:
-                """Local evaluation fallback breaking text into paragraphs."""
-                paragraphs: List[str] = [p.strip() for p in re.split(r"\n\s*\n", text.strip()) if p.strip()]
-                segments = []
-                for para in paragraphs:
-                    is_scene = bool(re.match(r"^(scene|\#\s*scene)\b", para, re.IGNORECASE))
-                    segments.append({"text": para, "new_scene": is_scene})
-                processed = "\n\n".join(seg["text"] for seg in segments)
-                return json.dumps({
-                    "processed_text": processed,
-                    "segments": segments,
-                    "new_scene": segments[0]["new_scene"] if segments else False,
-                    "new_beat": len(segments) > 1
-                })
-
-            messages = [{"role": "user", "content": prompt}]
+            messages, heuristic_eval = self._prepare_evaluation(text)
             result = self.call_llm_with_fallback(
                 messages=messages,
                 fallback_func=heuristic_eval,
                 max_tokens=400,
                 temperature=0.2,
             )
+            return self._complete_evaluation(result, text)
+        except Exception as e:
+            self._finish_execution("", f"Error: {str(e)}")
+            return {"success": False, "error": str(e)}
 
-            try:
-                data = json.loads(result)
-                processed_text = data.get("processed_text", text)
-                new_scene = bool(data.get("new_scene"))
-                new_beat = bool(data.get("new_beat"))
-                segments = data.get("segments")
-            except Exception:
-                processed_text = text
-                new_scene = False
-                new_beat = False
-                segments = None
-
-            self._finish_execution(result, "Evaluation complete", getattr(self, "_current_tokens", 0))
-            return {
-                "success": True,
-                "processed_text": processed_text,
-                "new_scene": new_scene,
-                "new_beat": new_beat,
-                "segments": segments,
-            }
+    async def execute_async(self, story_id: str, scene_id: str, beat_id: str, text: str) -> Dict[str, Any]:
+        """Async execute - awaits the evaluation LLM call."""
+        execution_id = self._start_execution(story_id, source_text=text)
+        try:
+            messages, heuristic_eval = self._prepare_evaluation(text)
+            result = await self.call_llm_with_fallback_async(
+                messages=messages,
+                fallback_func=heuristic_eval,
+                max_tokens=400,
+                temperature=0.2,
+            )
+            return self._complete_evaluation(result, text)
         except Exception as e:
             self._finish_execution("", f"Error: {str(e)}")
             return {"success": False, "error": str(e)}
+
+    def _prepare_evaluation(self, text: str):
+        """Build evaluation messages and the heuristic fallback for text."""
+        prompt = f"{self.config['instructions']}\n\n{text}"
+
+        def heuristic_eval() -> str:
+            """Local evaluation fallback breaking text into paragraphs."""
+            paragraphs: List[str] = [p.strip() for p in PARAGRAPH_BREAK.split(text.strip()) if p.strip()]
+            segments = []
+            for para in paragraphs:
+                is_scene = bool(SCENE_HEADER.match(para))
+                segments.append({"text": para, "new_scene": is_scene})
+            processed = "\n\n".join(seg["text"] for seg in segments)
+            return json.dumps({
+                "processed_text": processed,
+                "segments": segments,
+                "new_scene": segments[0]["new_scene"] if segments else False,
+                "new_beat": len(segments) > 1
+            })
+
+        messages = [{"role": "user", "content": prompt}]
+        return messages, heuristic_eval
+
+    def _complete_evaluation(self, result: str, text: str) -> Dict[str, Any]:
+        """Parse the evaluation response and close execution tracking."""
+        try:
+            data = json.loads(result)
+            processed_text = data.get("processed_text", text)
+            new_scene = bool(data.get("new_scene"))
+            new_beat = bool(data.get("new_beat"))
+            segments = data.get("segments")
+        except Exception:
+            processed_text = text
+            new_scene = False
+            new_beat = False
+            segments = None
+
+        self._finish_execution(result, "Evaluation complete", getattr(self, "_current_tokens", 0))
+        return {
+            "success": True,
+            "processed_text": processed_text,
+            "new_scene": new_scene,
+            "new_beat": new_beat,
+            "segments": segments,
+        }
+
+
+def store_processed_text(conn, story_entry_id, raw_text, processed_text):
+    """Idempotently store evaluated text; returns False when nothing changed
+
+    The update only applies while the entry still holds the raw text that was
+    evaluated, and skips the write when the processed text is already stored, so
+    repeated or late evaluations are harmless.
+    """
+    cursor = conn.execute('''
+        UPDATE stories SET text_content = ?, character_count = ?, updated_at = ?
+        WHERE story_entry_id = ? AND raw_text = ? AND text_content IS NOT ?
+    ''', (processed_text, len(processed_text), datetime.now().isoformat(), story_entry_id, raw_text, processed_text))
+    conn.commit()
+    return cursor.rowcount > 0
@@ -0,0 +1,110 @@
+import atexit
+import sqlite3
+import threading
+from typing import Dict, List, Any, Optional
+
+
+class ExecutionLogger:
+    """Write-behind writer for agent_executions
+
+    Agents hand over one complete record per execution when it finishes. Records
+    are buffered in memory and written by a background thread in a single
+    transaction every flush_interval seconds, or sooner once max_batch records
+    are waiting, so execution tracking adds no commits to the generation path.
+    Executions still running at shutdown are written without output so they stay
+    visible, matching the rows the synchronous path leaves behind.
+    """
+
+    def __init__(self, db_path: str, flush_interval: float = 1.0, max_batch: int = 50):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._pending: List[Dict[str, Any]] = []
+        self._open: Dict[str, Dict[str, Any]] = {}
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self.records_written = 0
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._columns = {row[1] for row in self._db.execute("PRAGMA table_info(agent_executions)")}
+
+        self._thread = threading.Thread(target=self._run, name="execution-logger", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def open(self, execution_id: str, record: Dict[str, Any]):
+        """Track a started execution so a clean shutdown can still record it"""
+        with self._lock:
+            self._open[execution_id] = record
+
+    def submit(self, execution_id: str, record: Dict[str, Any]):
+        """Queue a finished execution record for the next flush"""
+        with self._lock:
+            self._open.pop(execution_id, None)
+            self._pending.append(record)
+            batch_full = len(self._pending) >= self.max_batch
+        if batch_full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write every queued record in one transaction"""
+        with self._lock:
+            records, self._pending = self._pending, []
+        if records:
+            self._write(records)
+
+    def close(self):
+        """Stop the writer thread and persist queued and still-open executions"""
+        if self._stopped:
+            return
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+
+        with self._lock:
+            records = self._pending + list(self._open.values())
+            self._pending, self._open = [], {}
+        if records:
+            self._write(records)
+        self._db.close()
+        print(f"[ExecutionLogger] Closed after writing {self.records_written} execution records")
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"ERROR: ExecutionLogger flush failed: {e}")
+
+    def _write(self, records: List[Dict[str, Any]]):
+        # Group by column set so each group is a single executemany
+        groups: Dict[tuple, List[tuple]] = {}
+        for record in records:
+            columns = tuple(sorted(k for k in record if k in self._columns))
+            groups.setdefault(columns, []).append(tuple(record[c] for c in columns))
+
+        with self._db:
+            for columns, rows in groups.items():
+                placeholders = ', '.join('?' for _ in columns)
+                self._db.executemany(
+                    f"INSERT INTO agent_executions ({', '.join(columns)}) VALUES ({placeholders})",
+                    rows
+                )
+        self.records_written += len(records)
+
+
+_execution_logger: Optional[ExecutionLogger] = None
+
+
+def get_execution_logger() -> Optional[ExecutionLogger]:
+    """Process-wide execution logger, or None when agents write executions directly"""
+    return _execution_logger
+
+
+def set_execution_logger(logger: Optional[ExecutionLogger]):
+    """Install (or remove, with None) the process-wide execution logger"""
+    global _execution_logger
+    _execution_logger = logger
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+Synthetic story dataset generator for Storywriter
+Fills schema.sql with stories, scenes, beats, entities, aliases, states,
+relationships, perceptions, awareness rows and story entries at benchmark scale.
+
+Popularity is Zipf-skewed the way real stories are: a few stories hold most of
+the entities, and a few main characters appear in most states, relationships
+and perceptions. Everything is bulk-loaded in a single transaction, with the
+secondary indexes of the loaded tables rebuilt once at the end.
+
+    python generate_sample_data.py --preset large --db storywriter.db
+"""
+
+import os
+import json
+import time
+import random
+import sqlite3
+import argparse
+import bisect
+import itertools
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Iterable, Optional
+
+
+PRESETS = {
+    'small': {'stories': 3, 'scenes': 6, 'beats': 5, 'entities': 300, 'states': 5000,
+              'relationships': 3000, 'perceptions': 2000, 'awareness': 4000, 'entries': 300},
+    'medium': {'stories': 10, 'scenes': 20, 'beats': 8, 'entities': 2000, 'states': 100000,
+               'relationships': 50000, 'perceptions': 30000, 'awareness': 60000, 'entries': 5000},
+    'large': {'stories': 25, 'scenes': 40, 'beats': 10, 'entities': 10000, 'states': 1000000,
+              'relationships': 400000, 'perceptions': 250000, 'awareness': 500000, 'entries': 50000},
+}
+
+# Tables whose secondary indexes are dropped during the load and rebuilt afterwards
+LOADED_TABLES = ('entities', 'entity_aliases', 'states', 'relationships', 'perceptions', 'awareness', 'stories')
+
+# Share of entities per base class type (classes rows 1-9 from schema.sql)
+BASE_TYPE_WEIGHTS = {
+    'actor': 0.32, 'object': 0.22, 'location': 0.14, 'dialogue': 0.04, 'time': 0.04,
+    'thought': 0.06, 'feeling': 0.07, 'action': 0.06, 'activity': 0.05,
+}
+
+FIRST_NAMES = ['Tom', 'Mara', 'Elias', 'Sarah', 'Jonah', 'Ines', 'Victor', 'Lena', 'Otis', 'Greta',
+               'Felix', 'Nadia', 'Hugo', 'Clara', 'Rafael', 'Ada', 'Milo', 'Iris', 'Bruno', 'Vera',
+               'Caleb', 'June', 'Silas', 'Nora', 'Arlo', 'Maeve', 'Desmond', 'Pia', 'Ezra', 'Lotte']
+LAST_NAMES = ['Hale', 'Okafor', 'Lindqvist', 'Moreau', 'Castellan', 'Reyes', 'Whitlock', 'Novak',
+              'Ashby', 'Kowalski', 'Brandt', 'Sato', 'Quinn', 'Ferreira', 'Mercer', 'Adeyemi']
+ADJECTIVES = ['brass', 'silent', 'crimson', 'forgotten', 'salt-stained', 'hollow', 'gilded', 'broken',
+              'northern', 'quiet', 'ancient', 'restless', 'pale', 'narrow', 'iron', 'velvet']
+NOUNS = {
+    'object': ['compass', 'letter', 'lantern', 'key', 'ledger', 'pistol', 'locket', 'map', 'violin', 'coin'],
+    'location': ['harbor', 'tavern', 'lighthouse', 'market', 'chapel', 'dockyard', 'library', 'alley', 'manor', 'bridge'],
+    'dialogue': ['warning', 'confession', 'promise', 'rumor', 'apology', 'threat', 'question', 'toast'],
+    'time': ['dawn', 'midnight', 'winter', 'festival night', 'low tide', 'the long evening'],
+    'thought': ['doubt', 'plan', 'memory', 'suspicion', 'hope', 'regret'],
+    'feeling': ['dread', 'longing', 'anger', 'relief', 'guilt', 'joy'],
+    'action': ['escape', 'theft', 'duel', 'rescue', 'betrayal', 'search'],
+    'activity': ['card game', 'voyage', 'repair work', 'night watch', 'trial', 'harvest'],
+}
+TITLES = ['the Captain', 'the Accountant', 'the Widow', 'the Stranger', 'the Doctor', 'the Smuggler']
+SENTENCES = [
+    "The lantern light trembled across the wet cobblestones.",
+    "Somewhere beyond the harbor wall, a bell began to toll.",
+    "{a} pulled a coat tighter and listened for footsteps.",
+    "{a} laughed, but never took their eyes off {b}.",
+    "A gull cried once and the street fell silent again.",
+    "Rain traced slow lines down the tavern window while {a} waited.",
+    "Nobody spoke of the ship that had not come home.",
+    "{a} set the letter down and looked at {b} for a long moment.",
+    "The fog rolled in thick enough to swallow the lamps.",
+    "{b} answered quietly, as if the walls could hear.",
+]
+RELATION_PHRASES = ['distrusts', 'owes a debt to', 'is protecting', 'is searching for', 'once loved',
+                    'works alongside', 'is hiding something from', 'fears', 'admires', 'is bound to']
+
+
+class ZipfSampler:
+    """Samples ranks 0..n-1 with P(rank k) proportional to 1 / (k + 1) ** s"""
+
+    def __init__(self, n: int, s: float, rng: random.Random):
+        self.rng = rng
+        self.cumulative = list(itertools.accumulate(1.0 / (k + 1) ** s for k in range(n)))
+
+    def sample(self) -> int:
+        point = self.rng.random() * self.cumulative[-1]
+        return min(bisect.bisect_left(self.cumulative, point), len(self.cumulative) - 1)
+
+
+class SampleDataGenerator:
+    """Builds and bulk-loads a synthetic dataset into an existing Storywriter database"""
+
+    def __init__(self, db: sqlite3.Connection, sizes: Dict[str, int], zipf: float = 1.1,
+                 seed: Optional[int] = None, batch_size: int = 10000):
+        self.db = db
+        self.sizes = sizes
+        self.zipf = zipf
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.now = datetime.now()
+        self.counts: Dict[str, int] = {}
+
+        # story_id -> generated structure
+        self.story_ids: List[str] = []
+        self.beats: Dict[str, List[tuple]] = {}  # story_id -> [(scene_id, beat_id)]
+        self.story_entities: Dict[str, List[tuple]] = {}  # story_id -> [(entity_id, name, base_type)] by popularity
+        self.beat_states: Dict[tuple, List[int]] = {}  # (story_id, scene_id, beat_id) -> state ids
+        self.story_states: Dict[str, List[tuple]] = {}  # story_id -> [(state_id, scene_id, beat_id)]
+        self.relationship_ids: List[tuple] = []  # (relationship_id, story_id, scene_id, beat_id)
+        self.perception_ids: List[tuple] = []
+
+    def run(self) -> Dict[str, int]:
+        """Generate everything in one transaction and return row counts per table"""
+        self.db.execute("PRAGMA foreign_keys = OFF")
+        self.db.execute("PRAGMA synchronous = OFF")
+        self.db.execute("PRAGMA cache_size = -200000")
+
+        self.db.execute("BEGIN")
+        try:
+            # DDL is transactional in SQLite, so a failed load also restores the indexes
+            indexes = self._drop_indexes()
+            self._plan_stories()
+            self._load_entities()
+            self._load_aliases()
+            self._load_states()
+            self._load_relationships()
+            self._load_perceptions()
+            self._load_awareness()
+            self._load_story_entries()
+
+            print(f"Rebuilding {len(indexes)} indexes...")
+            for sql in indexes:
+                self.db.execute(sql)
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+
+        self.db.execute("ANALYZE")
+        self.db.execute("PRAGMA synchronous = FULL")
+        return self.counts
+
+    def _drop_indexes(self) -> List[str]:
+        """Drop secondary indexes of the loaded tables, returning their CREATE statements"""
+        placeholders = ','.join('?' for _ in LOADED_TABLES)
+        rows = self.db.execute(f"""
+            SELECT name, sql FROM sqlite_master
+            WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({placeholders})
+        """, LOADED_TABLES).fetchall()
+        for name, _ in rows:
+            self.db.execute(f'DROP INDEX "{name}"')
+        return [sql for _, sql in rows]
+
+    def _insert(self, table: str, columns: List[str], rows: Iterable[tuple]):
+        """executemany in batches of batch_size"""
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+        batch, total = [], 0
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                self.db.executemany(sql, batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            self.db.executemany(sql, batch)
+            total += len(batch)
+        self.counts[table] = self.counts.get(table, 0) + total
+        print(f"  {table}: {total} rows")
+
+    def _next_id(self, table: str, column: str) -> int:
+        return (self.db.execute(f"SELECT MAX({column}) FROM {table}").fetchone()[0] or 0) + 1
+
+    def _timestamp(self, max_days_ago: float = 60) -> str:
+        return (self.now - timedelta(seconds=self.rng.random() * max_days_ago * 86400)).isoformat(sep=' ')
+
+    def _plan_stories(self):
+        """Pick story ids (after any numeric ids already present) and their scene/beat layout"""
+        row = self.db.execute("""
+            SELECT MAX(CAST(story_id AS INTEGER)) FROM (
+                SELECT story_id FROM entities UNION SELECT story_id FROM stories
+            )
+        """).fetchone()
+        first = (row[0] or 0) + 1
+        for n in range(first, first + self.sizes['stories']):
+            story_id = str(n)
+            self.story_ids.append(story_id)
+            beats, beat_number = [], 1
+            for scene in range(1, self.sizes['scenes'] + 1):
+                for _ in range(self.sizes['beats']):
+                    beats.append((f"{story_id}:s{scene}", f"{story_id}:b{beat_number}"))
+                    beat_number += 1
+            self.beats[story_id] = beats
+
+    def _story_sampler(self) -> ZipfSampler:
+        return ZipfSampler(len(self.story_ids), self.zipf, self.rng)
+
+    def _load_entities(self):
+        class_ids = dict(self.db.execute("SELECT type, class_id FROM classes WHERE parent_class_id IS NULL").fetchall())
+        types = list(BASE_TYPE_WEIGHTS)
+        type_weights = list(itertools.accumulate(BASE_TYPE_WEIGHTS.values()))
+        stories = self._story_sampler()
+        entity_id = self._next_id('entities', 'entity_id')
+
+        def rows():
+            nonlocal entity_id
+            for _ in range(self.sizes['entities']):
+                story_id = self.story_ids[stories.sample()]
+                base_type = self.rng.choices(types, cum_weights=type_weights)[0]
+                name = self._entity_name(base_type)
+                self.story_entities.setdefault(story_id, []).append((entity_id, name, base_type))
+                created = self._timestamp()
+                yield (entity_id, story_id, class_ids[base_type], base_type, base_type, name,
+                       f"{name}, a {base_type} in story {story_id}",
+                       f"A {self.rng.choice(ADJECTIVES)} {base_type} who matters to the plot",
+                       json.dumps([self.rng.choice(ADJECTIVES)]),
+                       f"Drives the story through {self.rng.choice(RELATION_PHRASES)} others",
+                       f"Wants to {self.rng.choice(['escape', 'be forgiven', 'find the truth', 'keep a secret', 'win'])}",
+                       created, created)
+                entity_id += 1
+
+        self._insert('entities', ['entity_id', 'story_id', 'class_id', 'type', 'base_type', 'name',
+                                  'description', 'form_description', 'form_tags', 'function_description',
+                                  'goal_description', 'created_at', 'updated_at'], rows())
+
+    def _entity_name(self, base_type: str) -> str:
+        if base_type == 'actor':
+            return f"{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}"
+        return f"the {self.rng.choice(ADJECTIVES)} {self.rng.choice(NOUNS[base_type])}"
+
+    def _load_aliases(self):
+        def rows():
+            for entities in self.story_entities.values():
+                for entity_id, name, base_type in entities:
+                    aliases = set()
+                    if base_type == 'actor':
+                        first, last = name.split(' ', 1)
+                        aliases.update([first, last])
+                        if self.rng.random() < 0.3:
+                            aliases.add(self.rng.choice(TITLES))
+                    elif self.rng.random() < 0.4:
+                        aliases.add(name.split(' ')[-1])
+                    for alias in aliases:
+                        alias_type = 'title' if alias in TITLES else 'auto_generated'
+                        yield (entity_id, alias, alias_type)
+
+        self._insert('entity_aliases', ['entity_id', 'alias_name', 'alias_type'], rows())
+
+    def _load_states(self):
+        """States follow entity popularity: main characters appear in most beats"""
+        stories = [s for s in self.story_ids if s in self.story_entities]
+        # Stories with more entities get proportionally more states
+        story_weights = list(itertools.accumulate(len(self.story_entities[s]) for s in stories))
+        entity_samplers = {s: ZipfSampler(len(self.story_entities[s]), self.zipf, self.rng) for s in stories}
+        state_id = self._next_id('states', 'state_id')
+
+        def rows():
+            nonlocal state_id
+            for _ in range(self.sizes['states']):
+                story_id = self.rng.choices(stories, cum_weights=story_weights)[0]
+                entity_id, name, _ = self.story_entities[story_id][entity_samplers[story_id].sample()]
+                scene_id, beat_id = self.rng.choice(self.beats[story_id])
+                self.beat_states.setdefault((story_id, scene_id, beat_id), []).append(state_id)
+                self.story_states.setdefault(story_id, []).append((state_id, scene_id, beat_id))
+                created = self._timestamp()
+                yield (state_id, story_id, f"{story_id}:tl1", scene_id, beat_id, entity_id,
+                       json.dumps({'mood': self.rng.choice(NOUNS['feeling'])}),
+                       f"{name} looks {self.rng.choice(ADJECTIVES)}",
+                       f"{name} is {self.rng.choice(['wary', 'determined', 'exhausted', 'amused', 'grieving'])}",
+                       f"{name} wants to {self.rng.choice(['leave', 'confront someone', 'stay hidden', 'help'])}",
+                       created, created)
+                state_id += 1
+
+        self._insert('states', ['state_id', 'story_id', 'timeline_id', 'scene_id', 'beat_id', 'entity_id',
+                                'attributes', 'current_form_description', 'current_character_description',
+                                'current_goal_description', 'created_at', 'updated_at'], rows())
+
+    def _state_pairs(self, count: int):
+        """Yield (story_id, scene_id, beat_id, state_a, state_b), pairing states of the same beat when possible"""
+        stories = list(self.story_states)
+        if not stories:
+            return
+        story_weights = list(itertools.accumulate(len(self.story_states[s]) for s in stories))
+        for _ in range(count):
+            story_id = self.rng.choices(stories, cum_weights=story_weights)[0]
+            state_a, scene_id, beat_id = self.rng.choice(self.story_states[story_id])
+            same_beat = self.beat_states[(story_id, scene_id, beat_id)]
+            if len(same_beat) > 1:
+                state_b = self.rng.choice(same_beat)
+                while state_b == state_a:
+                    state_b = self.rng.choice(same_beat)
+            else:
+                state_b = self.rng.choice(self.story_states[story_id])[0]
+            yield story_id, scene_id, beat_id, state_a, state_b
+
+    def _load_relationships(self):
+        relationship_id = self._next_id('relationships', 'relationship_id')
+
+        def rows():
+            nonlocal relationship_id
+            for story_id, scene_id, beat_id, state_a, state_b in self._state_pairs(self.sizes['relationships']):
+                self.relationship_ids.append((relationship_id, story_id, scene_id, beat_id))
+                phrase = self.rng.choice(RELATION_PHRASES)
+                created = self._timestamp()
+                yield (relationship_id, story_id, f"{story_id}:tl1", scene_id, beat_id, state_a, state_b,
+                       f"One {phrase} the other",
+                       f"Since an earlier scene, one of them {phrase} the other, which colors every exchange.",
+                       created, created)
+                relationship_id += 1
+
+        self._insert('relationships', ['relationship_id', 'story_id', 'timeline_id', 'scene_id', 'beat_id',
+                                       'state_id1', 'state_id2', 'description', 'description_detail',
+                                       'created_at', 'updated_at'], rows())
+
+    def _load_perceptions(self):
+        perception_id = self._next_id('perceptions', 'perception_id')
+
+        def rows():
+            nonlocal perception_id
+            for story_id, scene_id, beat_id, state_a, state_b in self._state_pairs(self.sizes['perceptions']):
+                self.perception_ids.append((perception_id, story_id, scene_id, beat_id))
+                created = self._timestamp()
+                yield (perception_id, story_id, f"{story_id}:tl1", scene_id, beat_id, state_a, state_b,
+                       f"Sees them as {self.rng.choice(['a threat', 'an ally', 'a fool', 'a mystery', 'family'])}",
+                       round(self.rng.random(), 3), round(self.rng.uniform(-1, 1), 3),
+                       round(self.rng.random(), 3), round(self.rng.uniform(-1, 1), 3),
+                       created, created)
+                perception_id += 1
+
+        self._insert('perceptions', ['perception_id', 'story_id', 'timeline_id', 'scene_id', 'beat_id',
+                                     'perceiver_state_id', 'perceived_state_id', 'perception_description',
+                                     'confidence_level', 'emotional_valence', 'attention_priority',
+                                     'goal_alignment_score', 'created_at', 'updated_at'], rows())
+
+    def _load_awareness(self):
+        """Awareness rows over states, relationships and perceptions with skewed weights and ages"""
+        states = [(sid, story, scene, beat) for story, items in self.story_states.items()
+                  for sid, scene, beat in items]
+        sources = [('state', states), ('relationship', self.relationship_ids), ('perception', self.perception_ids)]
+        sources = [(kind, items) for kind, items in sources if items]
+        if not sources:
+            return
+
+        def rows():
+            for _ in range(self.sizes['awareness']):
+                kind, items = self.rng.choices(sources, weights=[0.6, 0.25, 0.15][:len(sources)])[0]
+                ref_id, story_id, scene_id, beat_id = self.rng.choice(items)
+                refs = (ref_id if kind == 'state' else None,
+                        ref_id if kind == 'relationship' else None,
+                        ref_id if kind == 'perception' else None)
+                # Most context is faint; a few items hold most of the attention
+                weight = round(min(1.0, self.rng.paretovariate(2.5) / 6), 4)
+                mentions = int(self.rng.paretovariate(1.5)) - 1
+                updated = self._timestamp(30)
+                status = 'active' if weight > 0.3 else ('fading' if weight > 0.15 else 'dormant')
+                yield (story_id, f"{story_id}:tl1", scene_id, beat_id) + refs + (
+                    weight, round(self.rng.uniform(0.85, 0.99), 3), mentions,
+                    self.rng.randint(0, mentions + 3), status, kind,
+                    updated if mentions else None, updated, updated, updated)
+
+        self._insert('awareness', ['story_id', 'timeline_id', 'scene_id', 'beat_id', 'state_id',
+                                   'relationship_id', 'perception_id', 'weight', 'decay_rate', 'mention_count',
+                                   'story_inclusion_count', 'status', 'context_type', 'last_user_mention',
+                                   'created_at', 'updated_at', 'last_weight_update'], rows())
+
+    def _load_story_entries(self):
+        stories = self._story_sampler()
+
+        def rows():
+            for _ in range(self.sizes['entries']):
+                story_id = self.story_ids[stories.sample()]
+                scene_id, beat_id = self.rng.choice(self.beats[story_id])
+                names = [name for _, name, base_type in self.story_entities.get(story_id, [])[:20]
+                         if base_type == 'actor'] or ['Someone', 'Another']
+                text = self._prose(names)
+                variant = self.rng.choices(['immediate', 'simulation', 'user_input'], weights=[6, 2, 2])[0]
+                created = self._timestamp()
+                yield (story_id, f"{story_id}:tl1", scene_id, beat_id, text, text, variant,
+                       f"rev{int(self.rng.paretovariate(3))}", len(text),
+                       self.rng.choice(['draft', 'draft', 'reviewed', 'approved']), created, created)
+
+        self._insert('stories', ['story_id', 'timeline_id', 'scene_id', 'beat_id', 'raw_text', 'text_content',
+                                 'variant', 'revision', 'character_count', 'status', 'created_at', 'updated_at'],
+                     rows())
+
+    def _prose(self, names: List[str]) -> str:
+        paragraphs = []
+        for _ in range(self.rng.randint(1, 3)):
+            sentences = [self.rng.choice(SENTENCES).format(a=self.rng.choice(names), b=self.rng.choice(names))
+                         for _ in range(self.rng.randint(2, 5))]
+            paragraphs.append(' '.join(sentences))
+        return '\n\n'.join(paragraphs)
+
+
+def create_database(db_path: str, schema_path: str):
+    """Create db_path from schema.sql"""
+    conn = sqlite3.connect(db_path)
+    try:
+        with open(schema_path, 'r') as f:
+            conn.executescript(f.read())
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic Storywriter dataset')
+    parser.add_argument('--db', default='storywriter.db', help='Database path')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='small', help='Base sizes')
+    parser.add_argument('--reset', action='store_true', help='Delete the database and recreate it from schema.sql first')
+    for name in PRESETS['small']:
+        parser.add_argument(f'--{name}', type=int, help=f'Override the preset number of {name}')
+    parser.add_argument('--zipf', type=float, default=1.1, help='Popularity skew exponent (0 = uniform)')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible datasets')
+    parser.add_argument('--batch-size', type=int, default=10000, help='Rows per executemany batch')
+
+    args = parser.parse_args()
+
+    sizes = dict(PRESETS[args.preset])
+    for name in sizes:
+        if getattr(args, name) is not None:
+            sizes[name] = getattr(args, name)
+    if sizes['stories'] < 1 or sizes['scenes'] < 1 or sizes['beats'] < 1:
+        parser.error("--stories, --scenes and --beats must be at least 1")
+
+    schema_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+    if args.reset and os.path.exists(args.db):
+        os.remove(args.db)
+    if not os.path.exists(args.db):
+        print(f"Creating {args.db} from schema.sql...")
+        create_database(args.db, schema_path)
+
+    print(f"Generating dataset into {args.db}: {sizes}")
+    started = time.time()
+    db = sqlite3.connect(args.db, isolation_level=None)
+    try:
+        counts = SampleDataGenerator(db, sizes, zipf=args.zipf, seed=args.seed, batch_size=args.batch_size).run()
+    finally:
+        db.close()
+
+    total = sum(counts.values())
+    elapsed = time.time() - started
+    print(f"Loaded {total} rows in {elapsed:.1f}s ({total / max(elapsed, 0.001):.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
+import inspect
 import json
 from typing import Dict, List, Any, Optional
 from datetime import datetime
-from base_agent import BaseAgent
+from base_agent import BaseAgent, GenerationCancelled
+from stream_segmenter import MarkerParser, MARKER_INSTRUCTIONS
 
 
 class GeneratorAgent(BaseAgent):
@@ -9,7 +11,9 @@ class GeneratorAgent(BaseAgent):
     
     def execute(self, story_id: str, scene_id: str, beat_id: str,
                 user_input: str = "", context_prompt: str = "",
-                generation_mode: str = "immediate", stream_callback=None) -> Dict[str, Any]:
+                generation_mode: str = "immediate", stream_callback=None,
+                segment_markers: bool = False, segment_callback=None,
+                store: bool = True) -> Dict[str, Any]:
         """
         Generate story content:
         
@@ -17,164 +21,378 @@ class GeneratorAgent(BaseAgent):
             generation_mode: 'immediate' (red flash) or 'simulation' (yellow flash)
             context_prompt: Pre-built prompt from PrepAgent, or empty for immediate mode
             user_input: User's story direction
+            segment_markers: Ask the model for inline beat/scene markers and return
+                EvalAgent-style segments parsed from them (result['segmented'])
+            segment_callback: Called with each marker segment as soon as it is closed
+            store: Write the entry to stories; speculative runs pass False and call
+                store_generation() if the result is used
         """
         execution_id = self._start_execution(story_id, source_text=f"Mode: {generation_mode}, Input: {user_input}")
         
         try:
-            if generation_mode == "immediate":
-                result = self._immediate_generation(story_id, scene_id, beat_id, user_input, stream_callback)
-            elif generation_mode == "simulation":
-                result = self._simulation_generation(story_id, scene_id, beat_id, user_input, context_prompt, stream_callback)
+            request = self._prepare_generation(story_id, scene_id, beat_id, user_input,
+                                               context_prompt, generation_mode, segment_markers)
+            if request.get('error'):
+                result = {'success': False, 'error': request['error']}
             else:
-                raise ValueError(f"Unknown generation mode: {generation_mode}")
+                result = self._run_generation(request, stream_callback, segment_callback)
+            return self._complete_generation(result, story_id, scene_id, beat_id, generation_mode, store)
             
-            if result['success']:
-                raw_text = result.get('raw_text', result['generated_text'])
-                # Store the generated story (processed text may be updated later)
-                story_entry_id = self._store_story_entry(
-                    story_id, scene_id, beat_id,
-                    raw_text,
-                    raw_text,
-                    generation_mode
-                )
-                result['story_entry_id'] = story_entry_id
-                
-                self._finish_execution(
-                    result['generated_text'], 
-                    f"{generation_mode.title()} generation completed", 
-                    result.get('tokens', 0)
-                )
+        except Exception as e:
+            self._finish_execution("", f"Error: {str(e)}")
+            return {'success': False, 'error': str(e)}
+    
+    async def execute_async(self, story_id: str, scene_id: str, beat_id: str,
+                            user_input: str = "", context_prompt: str = "",
+                            generation_mode: str = "immediate", stream_callback=None,
+                            segment_markers: bool = False, segment_callback=None) -> Dict[str, Any]:
+        """Async execute - same flow as execute() but awaits the LLM call.
+        
+        stream_callback may be a plain function or a coroutine function.
+        """
+        execution_id = self._start_execution(story_id, source_text=f"Mode: {generation_mode}, Input: {user_input}")
+        
+        try:
+            request = self._prepare_generation(story_id, scene_id, beat_id, user_input,
+                                               context_prompt, generation_mode, segment_markers)
+            if request.get('error'):
+                result = {'success': False, 'error': request['error']}
             else:
-                self._finish_execution("", f"Generation failed: {result['error']}")
-            
-            return result
+                result = await self._run_generation_async(request, stream_callback, segment_callback)
+            return self._complete_generation(result, story_id, scene_id, beat_id, generation_mode)
             
         except Exception as e:
             self._finish_execution("", f"Error: {str(e)}")
             return {'success': False, 'error': str(e)}
     
-    def _immediate_generation(self, story_id: str, scene_id: str, beat_id: str,
-                              user_input: str, stream_callback=None) -> Dict[str, Any]:
-        """Quick generation with minimal context (red flash)"""
-        print(f"[GeneratorAgent] Starting immediate generation")
+    def execute_variants(self, story_id: str, scene_id: str, beat_id: str,
+                         user_input: str = "", context_prompt: str = "",
+                         generation_mode: str = "immediate", n: int = 3, stream_callback=None,
+                         segment_markers: bool = False, segment_callback=None) -> Dict[str, Any]:
+        """
+        Generate n alternative continuations (variants roll1..rollN) concurrently:
+        
+        Args:
+            n: Number of variants
+            stream_callback: Called as stream_callback(index, delta) for each variant's deltas
+            segment_callback: Called as segment_callback(index, segment) in segment-marker mode
+        
+        All variants are stored in one transaction; result['variants'] lists them in order.
+        """
+        execution_id = self._start_execution(story_id, source_text=f"Mode: {generation_mode} x{n}, Input: {user_input}")
         
         try:
-            # Get basic scene context without heavy processing
-            scene_context = self._get_basic_scene_context(story_id, scene_id, beat_id)
+            request = self._prepare_generation(story_id, scene_id, beat_id, user_input,
+                                               context_prompt, generation_mode, segment_markers)
+            if request.get('error'):
+                self._finish_execution("", f"Generation failed: {request['error']}")
+                return {'success': False, 'error': request['error']}
             
-            # Build simple prompt
-            prompt = self._build_immediate_prompt(scene_context, user_input)
+            parsers = [MarkerParser(self._variant_callback(segment_callback, index)) if segment_markers else None
+                       for index in range(n)]
             
-            # Generate with fallback
-            def fallback_generation():
-                return self._fallback_immediate_generation(user_input, scene_context)
+            def on_chunk(index: int, delta: str):
+                text = parsers[index].feed(delta) if parsers[index] else delta
+                if text and stream_callback:
+                    stream_callback(index, text)
             
-            messages = [{"role": "user", "content": prompt}]
+            try:
+                texts = self.call_llm_stream_variants(request['messages'], n, on_chunk, **request['params'])
+            except GenerationCancelled:
+                raise
+            except Exception:
+                # One fallback variant rather than n identical ones
+                self._current_tokens = 0
+                texts, parsers = [request['fallback_func']()], parsers[:1]
+                on_chunk(0, texts[0])
             
-            if stream_callback:
-                generated_text = self.call_llm_stream_with_fallback(
-                    messages=messages,
-                    on_chunk=stream_callback,
-                    fallback_func=fallback_generation,
-                    max_tokens=800,
-                    temperature=0.7
-                )
-            else:
-                generated_text = self.call_llm_with_fallback(
-                    messages=messages,
-                    fallback_func=fallback_generation,
-                    max_tokens=800,
-                    temperature=0.7
-                )
+            results = []
+            for index, text in enumerate(texts):
+                tail = self._finish_markers(parsers[index], text, streamed=True)
+                if tail and stream_callback:
+                    stream_callback(index, tail)
+                result = self._generation_result(request, text, parsers[index])
+                result['variant'] = f"roll{index + 1}"
+                results.append(result)
             
+            entry_ids = self._store_variant_entries(story_id, scene_id, beat_id, results)
+            for result, story_entry_id in zip(results, entry_ids):
+                result['story_entry_id'] = story_entry_id
+                result.pop('tokens', None)
+            
+            self._finish_execution(
+                "\n\n".join(f"[{r['variant']}]\n{r['generated_text']}" for r in results),
+                f"{generation_mode.title()} generation completed ({len(results)} variants)",
+                self._current_tokens
+            )
             return {
                 'success': True,
-                'generated_text': generated_text,
-                'raw_text': generated_text,
-                'generation_mode': 'immediate',
-                'context_size': len(prompt),
-                'tokens': getattr(self, '_current_tokens', 0)
+                'variants': results,
+                'generation_mode': generation_mode,
+                'context_size': request['context_size'],
+                'tokens': self._current_tokens
             }
-            
+        
+        except GenerationCancelled:
+            self._finish_execution("", "Generation cancelled")
+            return {'success': False, 'cancelled': True, 'error': 'Generation cancelled'}
         except Exception as e:
+            self._finish_execution("", f"Error: {str(e)}")
             return {'success': False, 'error': str(e)}
     
-    def _simulation_generation(self, story_id: str, scene_id: str, beat_id: str,
-                             user_input: str, context_prompt: str, stream_callback=None) -> Dict[str, Any]:
+    @staticmethod
+    def _variant_callback(segment_callback, index: int):
+        """Bind a variant index to segment_callback(index, segment)"""
+        if segment_callback is None:
+            return None
+        return lambda segment: segment_callback(index, segment)
+    
+    def _complete_generation(self, result: Dict[str, Any], story_id: str, scene_id: str, beat_id: str,
+                             generation_mode: str, store: bool = True) -> Dict[str, Any]:
+        """Store a successful generation and close execution tracking"""
+        if result['success']:
+            if store:
+                self.store_generation(result, story_id, scene_id, beat_id)
+            
+            self._finish_execution(
+                result['generated_text'], 
+                f"{generation_mode.title()} generation completed", 
+                result.get('tokens', 0)
+            )
+        else:
+            self._finish_execution("", f"Generation failed: {result['error']}")
+        
+        return result
+    
+    def store_generation(self, result: Dict[str, Any], story_id: str, scene_id: str, beat_id: str) -> int:
+        """Store a successful generation result as a stories entry and set its story_entry_id"""
+        raw_text = result.get('raw_text', result['generated_text'])
+        # Store the generated story (processed text may be updated later unless segmented)
+        result['story_entry_id'] = self._store_story_entry(
+            story_id, scene_id, beat_id,
+            raw_text,
+            result['generated_text'],
+            result['generation_mode']
+        )
+        return result['story_entry_id']
+    
+    def _prepare_generation(self, story_id: str, scene_id: str, beat_id: str, user_input: str,
+                            context_prompt: str, generation_mode: str,
+                            segment_markers: bool = False) -> Dict[str, Any]:
+        """Build the LLM request for the given generation mode"""
+        if generation_mode == "immediate":
+            request = self._prepare_immediate_generation(story_id, scene_id, beat_id, user_input)
+        elif generation_mode == "simulation":
+            request = self._prepare_simulation_generation(user_input, context_prompt)
+        else:
+            raise ValueError(f"Unknown generation mode: {generation_mode}")
+
+        request['segment_markers'] = segment_markers
+        if segment_markers and not request.get('error'):
+            # Fused generate-and-segment: the model marks beat/scene boundaries itself
+            message = request['messages'][-1]
+            message['content'] += f"\n\n### SEGMENT MARKERS\n{MARKER_INSTRUCTIONS}"
+            request['context_size'] = len(message['content'])
+        return request
+    
+    def _prepare_immediate_generation(self, story_id: str, scene_id: str, beat_id: str,
+                                      user_input: str) -> Dict[str, Any]:
+        """Quick generation with minimal context (red flash)"""
+        print(f"[GeneratorAgent] Starting immediate generation")
+        
+        # Get basic scene context without heavy processing
+        scene_context = self._get_basic_scene_context(story_id, scene_id, beat_id)
+        
+        # Build simple prompt
+        prompt = self._build_immediate_prompt(scene_context, user_input)
+        
+        # Generate with fallback
+        def fallback_generation():
+            return self._fallback_immediate_generation(user_input, scene_context)
+        
+        return {
+            'generation_mode': 'immediate',
+            'messages': [{"role": "user", "content": prompt}],
+            'fallback_func': fallback_generation,
+            'context_size': len(prompt),
+            'params': {'max_tokens': 800, 'temperature': 0.7}
+        }
+    
+    def _prepare_simulation_generation(self, user_input: str, context_prompt: str) -> Dict[str, Any]:
         """Full generation with PrepAgent context (yellow flash)"""
         print(f"[GeneratorAgent] Starting simulation generation")
         
+        # Use the context prompt from PrepAgent
+        if not context_prompt:
+            return {'error': 'No context prompt provided for simulation mode'}
+        
+        # Add user input to the prepared context
+        full_prompt = self._build_simulation_prompt(context_prompt, user_input)
+        
+        # Generate with fallback
+        def fallback_generation():
+            return self._fallback_simulation_generation(user_input, context_prompt)
+        
+        return {
+            'generation_mode': 'simulation',
+            'messages': [{"role": "user", "content": full_prompt}],
+            'fallback_func': fallback_generation,
+            'context_size': len(full_prompt),
+            'params': {'max_tokens': 1200, 'temperature': 0.6}
+        }
+    
+    def _run_generation(self, request: Dict[str, Any], stream_callback=None,
+                        segment_callback=None) -> Dict[str, Any]:
+        """Run a prepared generation request, streaming when a callback is given"""
+        parser = MarkerParser(segment_callback) if request['segment_markers'] else None
+        client_callback, stream_callback = stream_callback, self._marker_stream(parser, stream_callback)
         try:
-            # Use the context prompt from PrepAgent
-            if not context_prompt:
-                return {'success': False, 'error': 'No context prompt provided for simulation mode'}
-            
-            # Add user input to the prepared context
-            full_prompt = self._build_simulation_prompt(context_prompt, user_input)
-            
-            # Generate with fallback
-            def fallback_generation():
-                return self._fallback_simulation_generation(user_input, context_prompt)
-            
-            messages = [{"role": "user", "content": full_prompt}]
-            
             if stream_callback:
                 generated_text = self.call_llm_stream_with_fallback(
-                    messages=messages,
+                    messages=request['messages'],
                     on_chunk=stream_callback,
-                    fallback_func=fallback_generation,
-                    max_tokens=1200,
-                    temperature=0.6
+                    fallback_func=request['fallback_func'],
+                    **request['params']
                 )
             else:
                 generated_text = self.call_llm_with_fallback(
-                    messages=messages,
-                    fallback_func=fallback_generation,
-                    max_tokens=1200,
-                    temperature=0.6
+                    messages=request['messages'],
+                    fallback_func=request['fallback_func'],
+                    **request['params']
                 )
             
-            return {
-                'success': True,
-                'generated_text': generated_text,
-                'raw_text': generated_text,
-                'generation_mode': 'simulation',
-                'context_size': len(full_prompt),
-                'tokens': getattr(self, '_current_tokens', 0)
-            }
+            tail = self._finish_markers(parser, generated_text, streamed=client_callback is not None)
+            if tail and client_callback:
+                client_callback(tail)
+            return self._generation_result(request, generated_text, parser)
+            
+        except GenerationCancelled:
+            return {'success': False, 'cancelled': True, 'error': 'Generation cancelled'}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+    
+    async def _run_generation_async(self, request: Dict[str, Any], stream_callback=None,
+                                    segment_callback=None) -> Dict[str, Any]:
+        """Async _run_generation"""
+        parser = MarkerParser(segment_callback) if request['segment_markers'] else None
+        client_callback, stream_callback = stream_callback, self._marker_stream(parser, stream_callback)
+        try:
+            if stream_callback:
+                generated_text = await self.call_llm_stream_with_fallback_async(
+                    messages=request['messages'],
+                    on_chunk=stream_callback,
+                    fallback_func=request['fallback_func'],
+                    **request['params']
+                )
+            else:
+                generated_text = await self.call_llm_with_fallback_async(
+                    messages=request['messages'],
+                    fallback_func=request['fallback_func'],
+                    **request['params']
+                )
+            
+            tail = self._finish_markers(parser, generated_text, streamed=client_callback is not None)
+            if tail and client_callback:
+                chunk_result = client_callback(tail)
+                if inspect.isawaitable(chunk_result):
+                    await chunk_result
+            return self._generation_result(request, generated_text, parser)
             
+        except GenerationCancelled:
+            return {'success': False, 'cancelled': True, 'error': 'Generation cancelled'}
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
+    @staticmethod
+    def _marker_stream(parser: Optional[MarkerParser], stream_callback):
+        """Wrap stream_callback so the client only receives marker-free text"""
+        if parser is None or stream_callback is None:
+            return stream_callback
+
+        def on_chunk(delta: str):
+            text = parser.feed(delta)
+            if text:
+                return stream_callback(text)
+        return on_chunk
+
+    @staticmethod
+    def _finish_markers(parser: Optional[MarkerParser], generated_text: str, streamed: bool) -> str:
+        """Close the marker parser; returns held-back text the client has not received yet"""
+        if parser is None:
+            return ""
+        if not streamed:
+            parser.feed(generated_text)
+        return parser.finish()
+    
+    def _generation_result(self, request: Dict[str, Any], generated_text: str,
+                           parser: Optional[MarkerParser] = None) -> Dict[str, Any]:
+        """Package generated text into the result dict returned by execute()
+
+        With segment markers the markers are stripped from the stored text and, when
+        the model wrote any, the segmentation is returned in EvalAgent's format with
+        segmented=True so no separate evaluation is needed.
+        """
+        result = {
+            'success': True,
+            'generated_text': generated_text,
+            'raw_text': generated_text,
+            'generation_mode': request['generation_mode'],
+            'context_size': request['context_size'],
+            'tokens': getattr(self, '_current_tokens', 0)
+        }
+        if parser is not None:
+            result['raw_text'] = result['generated_text'] = parser.text
+            result['segmented'] = parser.found
+            if parser.found:
+                evaluation = parser.evaluation()
+                result['generated_text'] = evaluation['processed_text']
+                result['segments'] = evaluation['segments']
+                result['new_scene'] = evaluation['new_scene']
+                result['new_beat'] = evaluation['new_beat']
+            else:
+                print("[GeneratorAgent] No segment markers in output, leaving segmentation to EvalAgent")
+        return result
+    
     def _get_basic_scene_context(self, story_id: str, scene_id: str, beat_id: str) -> Dict[str, Any]:
-        """Get minimal scene context for immediate generation"""
+        """Get minimal scene context for immediate generation (memoized per request context)"""
         
         # Get entities in current scene
-        entities = self.db.execute("""
-            SELECT DISTINCT e.entity_id, e.name, e.base_type, e.description,
-                   e.form_description, e.character_description
-            FROM entities e
-            JOIN states s ON e.entity_id = s.entity_id
-            WHERE s.story_id = ? AND s.scene_id = ?
-            ORDER BY e.base_type, e.name
-        """, (story_id, scene_id)).fetchall()
+        def query_entities():
+            entities = self.db.execute("""
+                SELECT DISTINCT e.entity_id, e.name, e.base_type, e.description,
+                       e.form_description, e.character_description
+                FROM entities e
+                JOIN states s ON e.entity_id = s.entity_id
+                WHERE s.story_id = ? AND s.scene_id = ?
+                ORDER BY e.base_type, e.name
+            """, (story_id, scene_id)).fetchall()
+            return [dict(row) for row in entities]
+        
+        entities = self._memo('scene_entities', (story_id, scene_id), query_entities)
         
         # Get recent relationships in this beat/scene
-        relationships = self.db.execute("""
-            SELECT r.description, e1.name as entity1_name, e2.name as entity2_name
-            FROM relationships r
-            JOIN states s1 ON r.state_id1 = s1.state_id
-            JOIN states s2 ON r.state_id2 = s2.state_id
-            JOIN entities e1 ON s1.entity_id = e1.entity_id
-            JOIN entities e2 ON s2.entity_id = e2.entity_id
-            WHERE r.story_id = ? AND r.scene_id = ?
-            ORDER BY r.beat_id DESC, r.created_at DESC
-            LIMIT 10
-        """, (story_id, scene_id)).fetchall()
+        if self.request_context is not None:
+            # Reuse the scene relationships PrepAgent already loaded in this run
+            scene_relationships = sorted(self._get_all_scene_relationships(story_id, scene_id),
+                                         key=lambda r: r['beat_id'], reverse=True)
+            relationships = [{'description': r['description'], 'entity1_name': r['entity1_name'],
+                              'entity2_name': r['entity2_name']} for r in scene_relationships[:10]]
+        else:
+            relationships = [dict(row) for row in self.db.execute("""
+                SELECT r.description, e1.name as entity1_name, e2.name as entity2_name
+                FROM relationships r
+                JOIN states s1 ON r.state_id1 = s1.state_id
+                JOIN states s2 ON r.state_id2 = s2.state_id
+                JOIN entities e1 ON s1.entity_id = e1.entity_id
+                JOIN entities e2 ON s2.entity_id = e2.entity_id
+                WHERE r.story_id = ? AND r.scene_id = ?
+                ORDER BY r.beat_id DESC, r.created_at DESC
+                LIMIT 10
+            """, (story_id, scene_id)).fetchall()]
         
         return {
-            'entities': [dict(row) for row in entities],
-            'relationships': [dict(row) for row in relationships],
+            'entities': entities,
+            'relationships': relationships,
             'scene_id': scene_id,
             'beat_id': beat_id
         }
@@ -264,6 +482,29 @@ class GeneratorAgent(BaseAgent):
 
         return story_entry_id
 
+    def _store_variant_entries(self, story_id: str, scene_id: str, beat_id: str,
+                               results: List[Dict[str, Any]]) -> List[int]:
+        """Store all variants of one generation in a single transaction"""
+        entry_ids = []
+        try:
+            for result in results:
+                processed_text = result['generated_text']
+                cursor = self.db.execute("""
+                    INSERT INTO stories
+                    (story_id, timeline_id, scene_id, beat_id, raw_text, text_content, variant, revision, character_count)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    story_id, '1:tl1', scene_id, beat_id,
+                    result['raw_text'], processed_text, result['variant'], 'rev1', len(processed_text)
+                ))
+                entry_ids.append(cursor.lastrowid)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        
+        return entry_ids
+
     def update_story_entry_text(self, story_entry_id: int, processed_text: str):
         """Update processed text for an existing story entry"""
         self.db.execute(
@@ -0,0 +1,97 @@
+import threading
+import time
+import traceback
+import uuid
+from typing import Dict, Any, Callable, Optional
+
+
+class GenerationJob:
+    """One background generation for a Socket.IO session"""
+
+    def __init__(self, sid: str, kind: str):
+        self.job_id = uuid.uuid4().hex
+        self.sid = sid
+        self.kind = kind
+        self.status = 'queued'  # queued, running, completed, failed, cancelled
+        self.cancel_event = threading.Event()
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        """Ask the job to stop; agents given cancel_event abort at the next stream chunk"""
+        self.cancel_event.set()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {'job_id': self.job_id, 'kind': self.kind, 'status': self.status,
+                'created_at': self.created_at, 'finished_at': self.finished_at}
+
+
+class JobManager:
+    """Per-session table of background generation jobs
+
+    Each Socket.IO session has at most one active job: submitting a new one
+    cancels the previous job, and disconnecting cancels it too. Work runs through
+    start_task (socketio.start_background_task), so event handlers return at once.
+    """
+
+    def __init__(self, start_task: Callable[..., Any]):
+        self._start_task = start_task
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, GenerationJob] = {}
+        self._stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'cancelled': 0}
+
+    def submit(self, sid: str, kind: str, work: Callable[[GenerationJob], None]) -> GenerationJob:
+        """Start work(job) in the background, cancelling the session's previous job"""
+        job = GenerationJob(sid, kind)
+        with self._lock:
+            previous = self._jobs.get(sid)
+            self._jobs[sid] = job
+            self._stats['submitted'] += 1
+        if previous is not None:
+            print(f"[JobManager] Cancelling {previous.kind} job {previous.job_id} for {sid}: superseded")
+            previous.cancel()
+
+        self._start_task(self._run, job, work)
+        return job
+
+    def cancel(self, sid: str, job_id: Optional[str] = None) -> bool:
+        """Cancel the session's active job (only if it is job_id, when given)"""
+        with self._lock:
+            job = self._jobs.get(sid)
+        if job is None or (job_id is not None and job.job_id != job_id):
+            return False
+        print(f"[JobManager] Cancelling {job.kind} job {job.job_id} for {sid}")
+        job.cancel()
+        return True
+
+    def active(self, sid: str) -> Optional[GenerationJob]:
+        with self._lock:
+            return self._jobs.get(sid)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['active'] = len(self._jobs)
+        return stats
+
+    def _run(self, job: GenerationJob, work: Callable[[GenerationJob], None]):
+        job.status = 'running'
+        try:
+            work(job)
+            job.status = 'cancelled' if job.cancelled else 'completed'
+        except Exception as e:
+            job.status = 'cancelled' if job.cancelled else 'failed'
+            print(f"✗ {job.kind} job {job.job_id} failed: {e}")
+            traceback.print_exc()
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                if self._jobs.get(job.sid) is job:
+                    del self._jobs[job.sid]
+                self._stats[job.status] += 1
+            print(f"[JobManager] {job.kind} job {job.job_id} {job.status} "
+                  f"in {int((job.finished_at - job.created_at) * 1000)}ms")
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+Durable job queue for bulk agent work
+Jobs live in the job_queue table, so they survive restarts; worker processes
+lease them, report progress with checkpoints and retry failures with backoff.
+
+    python job_queue.py enqueue reextract_entities --payload '{"story_id": "1"}'
+    python job_queue.py worker --processes 4 --db storywriter.db
+    python job_queue.py list
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import argparse
+import traceback
+import multiprocessing
+from contextlib import closing
+from typing import Dict, List, Any, Callable, Iterable, Optional
+
+# Add current directory to path for imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from agent_registry import AgentRegistry
+from db_pool import ConnectionPool
+from eval_agent import store_processed_text
+
+
+JOB_COLUMNS = ('job_id', 'kind', 'payload', 'status', 'priority', 'attempts', 'max_attempts', 'available_at',
+               'lease_owner', 'lease_expires_at', 'cancel_requested', 'progress_done', 'progress_total',
+               'checkpoint', 'result', 'error', 'created_at', 'started_at', 'finished_at', 'updated_at')
+JSON_COLUMNS = ('payload', 'checkpoint', 'result')
+
+
+class JobCancelled(Exception):
+    """Raised by JobContext.progress() when the job was cancelled while running"""
+
+
+class JobLeaseLost(Exception):
+    """Raised by JobContext.progress() when another worker has taken the job over"""
+
+
+class JobQueue:
+    """The job_queue table: enqueue, lease, progress, complete/fail, cancel
+
+    A lease is one atomic UPDATE ... RETURNING of the next available job, so
+    concurrent workers never receive the same job. Running jobs hold their lease
+    for lease_seconds and extend it with every progress report; a job whose worker
+    crashed is leased again once its lease expires and resumes from the last
+    checkpoint. Failures are retried with exponential backoff until max_attempts.
+    """
+
+    def __init__(self, connect: Callable[[], Any], lease_seconds: float = 120.0, retry_backoff_seconds: float = 5.0):
+        """
+        Args:
+            connect: Returns a connection with sqlite3.Row rows; close() releases it
+            lease_seconds: How long a worker may go without a progress report
+            retry_backoff_seconds: Delay before the first retry, doubled per attempt
+        """
+        self._connect = connect
+        self.lease_seconds = lease_seconds
+        self.retry_backoff_seconds = retry_backoff_seconds
+
+    @classmethod
+    def from_env(cls, connect: Callable[[], Any]) -> 'JobQueue':
+        """Queue with JOB_LEASE_SECONDS leases and JOB_RETRY_BACKOFF_SECONDS backoff"""
+        return cls(connect,
+                   lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", "120")),
+                   retry_backoff_seconds=float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", "5")))
+
+    def enqueue(self, kind: str, payload: Optional[Dict[str, Any]] = None, priority: int = 0,
+                max_attempts: int = 3) -> int:
+        """Add a job; returns its job_id"""
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        now = time.time()
+        with self._connection() as conn:
+            cursor = conn.execute('''
+                INSERT INTO job_queue (kind, payload, priority, max_attempts, available_at, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (kind, json.dumps(payload or {}), priority, max_attempts, now, now, now))
+            conn.commit()
+        print(f"[JobQueue] Queued {kind} job {cursor.lastrowid}")
+        return cursor.lastrowid
+
+    def lease(self, worker_id: str, kinds: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+        """Lease the next queued (or abandoned) job for worker_id, or None when there is none"""
+        now = time.time()
+        kinds = list(kinds or [])
+        kind_filter = f"AND kind IN ({','.join('?' for _ in kinds)})" if kinds else ""
+        with self._connection() as conn:
+            # Abandoned jobs that used up their attempts fail instead of being leased again
+            conn.execute('''
+                UPDATE job_queue SET status = 'failed', lease_owner = NULL, finished_at = ?, updated_at = ?,
+                       error = COALESCE(error, 'Lease expired')
+                WHERE status = 'running' AND lease_expires_at < ? AND attempts >= max_attempts
+            ''', (now, now, now))
+            row = conn.execute(f'''
+                UPDATE job_queue
+                SET status = 'running', lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1,
+                    started_at = COALESCE(started_at, ?), updated_at = ?
+                WHERE job_id = (
+                    SELECT job_id FROM job_queue
+                    WHERE ((status = 'queued' AND available_at <= ?) OR (status = 'running' AND lease_expires_at < ?))
+                      {kind_filter}
+                    ORDER BY priority DESC, job_id
+                    LIMIT 1
+                )
+                RETURNING {', '.join(JOB_COLUMNS)}
+            ''', (worker_id, now + self.lease_seconds, now, now, now, now, *kinds)).fetchone()
+            conn.commit()
+        return self._job(row) if row else None
+
+    def progress(self, job_id: int, worker_id: str, done: int, total: Optional[int] = None,
+                 checkpoint: Optional[Dict[str, Any]] = None):
+        """Record progress (and a checkpoint to resume from) and extend the lease
+
+        Raises JobLeaseLost when worker_id no longer holds the job and JobCancelled
+        when a cancel was requested.
+        """
+        now = time.time()
+        with self._connection() as conn:
+            row = conn.execute('''
+                UPDATE job_queue
+                SET progress_done = ?, progress_total = COALESCE(?, progress_total),
+                    checkpoint = COALESCE(?, checkpoint), lease_expires_at = ?, updated_at = ?
+                WHERE job_id = ? AND lease_owner = ? AND status = 'running'
+                RETURNING cancel_requested
+            ''', (done, total, json.dumps(checkpoint) if checkpoint is not None else None,
+                  now + self.lease_seconds, now, job_id, worker_id)).fetchone()
+            conn.commit()
+        if row is None:
+            raise JobLeaseLost(f"Job {job_id} is no longer leased by {worker_id}")
+        if row['cancel_requested']:
+            raise JobCancelled(f"Job {job_id} was cancelled")
+
+    def complete(self, job_id: int, worker_id: str, result: Any = None) -> bool:
+        now = time.time()
+        return self._finish(job_id, worker_id, '''
+            UPDATE job_queue SET status = 'completed', result = ?, error = NULL, lease_owner = NULL,
+                   finished_at = ?, updated_at = ?
+            WHERE job_id = ? AND lease_owner = ? AND status = 'running'
+        ''', (json.dumps(result), now, now, job_id, worker_id))
+
+    def fail(self, job_id: int, worker_id: str, error: str) -> bool:
+        """Requeue the job with backoff, or mark it failed once it has used up its attempts"""
+        now = time.time()
+        return self._finish(job_id, worker_id, '''
+            UPDATE job_queue
+            SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+                available_at = ? + ? * (1 << (attempts - 1)),
+                finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE ? END,
+                error = ?, lease_owner = NULL, lease_expires_at = NULL, updated_at = ?
+            WHERE job_id = ? AND lease_owner = ? AND status = 'running'
+        ''', (now, self.retry_backoff_seconds, now, error, now, job_id, worker_id))
+
+    def mark_cancelled(self, job_id: int, worker_id: str) -> bool:
+        now = time.time()
+        return self._finish(job_id, worker_id, '''
+            UPDATE job_queue SET status = 'cancelled', lease_owner = NULL, finished_at = ?, updated_at = ?
+            WHERE job_id = ? AND lease_owner = ? AND status = 'running'
+        ''', (now, now, job_id, worker_id))
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a queued job at once, or ask the worker running it to stop"""
+        now = time.time()
+        with self._connection() as conn:
+            cursor = conn.execute('''
+                UPDATE job_queue
+                SET status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END,
+                    finished_at = CASE WHEN status = 'queued' THEN ? ELSE finished_at END,
+                    cancel_requested = TRUE, updated_at = ?
+                WHERE job_id = ? AND status IN ('queued', 'running')
+            ''', (now, now, job_id))
+            conn.commit()
+        return cursor.rowcount > 0
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self._connection() as conn:
+            row = conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM job_queue WHERE job_id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Most recent jobs first, optionally only those with status"""
+        with self._connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {', '.join(JOB_COLUMNS)} FROM job_queue
+                WHERE ? IS NULL OR status = ?
+                ORDER BY job_id DESC LIMIT ?
+            ''', (status, status, limit)).fetchall()
+        return [self._job(row) for row in rows]
+
+    def changes(self, since: float) -> List[Dict[str, Any]]:
+        """Jobs updated after since, oldest change first (for progress polling)"""
+        with self._connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {', '.join(JOB_COLUMNS)} FROM job_queue WHERE updated_at > ? ORDER BY updated_at
+            ''', (since,)).fetchall()
+        return [self._job(row) for row in rows]
+
+    def _finish(self, job_id: int, worker_id: str, sql: str, params: tuple) -> bool:
+        with self._connection() as conn:
+            cursor = conn.execute(sql, params)
+            conn.commit()
+        if cursor.rowcount == 0:
+            print(f"Warning: [JobQueue] Job {job_id} was no longer leased by {worker_id}, result dropped")
+        return cursor.rowcount > 0
+
+    def _connection(self):
+        # Closing returns a pooled connection, rolling back anything left uncommitted
+        return closing(self._connect())
+
+    @staticmethod
+    def _job(row) -> Dict[str, Any]:
+        job = dict(zip(JOB_COLUMNS, row))
+        for column in JSON_COLUMNS:
+            job[column] = json.loads(job[column]) if job[column] else None
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        return job
+
+
+class JobContext:
+    """What a job handler gets: its payload and checkpoint, agents, connections, progress()"""
+
+    def __init__(self, queue: JobQueue, job: Dict[str, Any], worker_id: str,
+                 registry: AgentRegistry, connect: Callable[[], Any]):
+        self.queue = queue
+        self.job = job
+        self.worker_id = worker_id
+        self.payload = job['payload'] or {}
+        self.checkpoint = job['checkpoint'] or {}
+        self.acquire = registry.acquire
+        self.connect = connect
+
+    def progress(self, done: int, total: Optional[int] = None, checkpoint: Optional[Dict[str, Any]] = None):
+        """Report progress; pass the checkpoint a retry should resume from after this step"""
+        if checkpoint is not None:
+            self.checkpoint = checkpoint
+        self.queue.progress(self.job['job_id'], self.worker_id, done, total, checkpoint)
+
+
+def story_entries_after(ctx: JobContext) -> tuple:
+    """(entries of the payload's story not yet processed, entries already done, total entries)"""
+    story_id = ctx.payload['story_id']
+    last_entry_id = ctx.checkpoint.get('last_entry_id', 0)
+    conn = ctx.connect()
+    try:
+        rows = conn.execute('''
+            SELECT story_entry_id, story_id, timeline_id, scene_id, beat_id, raw_text, text_content
+            FROM stories WHERE story_id = ? ORDER BY story_entry_id
+        ''', (story_id,)).fetchall()
+    finally:
+        conn.close()
+    pending = [dict(row) for row in rows if row['story_entry_id'] > last_entry_id]
+    return pending, len(rows) - len(pending), len(rows)
+
+
+def reextract_entities(ctx: JobContext) -> Dict[str, Any]:
+    """Run EntityAgent (task 1, full processing) over every entry of a story"""
+    entries, done, total = story_entries_after(ctx)
+    ctx.progress(done, total)
+    for entry in entries:
+        story_context = {k: entry[k] for k in ('story_id', 'scene_id', 'beat_id', 'timeline_id')}
+        with ctx.acquire('EntityAgent', 1) as agent:
+            result = agent.execute(entry['text_content'], story_context)
+        if not result.get('success'):
+            raise Exception(f"Entity extraction failed for entry {entry['story_entry_id']}: {result.get('error')}")
+        done += 1
+        ctx.progress(done, total, {'last_entry_id': entry['story_entry_id']})
+    return {'entries': total}
+
+
+def reevaluate_story(ctx: JobContext) -> Dict[str, Any]:
+    """Re-run EvalAgent segmentation over every entry of a story"""
+    entries, done, total = story_entries_after(ctx)
+    ctx.progress(done, total)
+    updated = ctx.checkpoint.get('updated', 0)
+    for entry in entries:
+        with ctx.acquire('EvalAgent', 1) as agent:
+            result = agent.execute(entry['story_id'], entry['scene_id'], entry['beat_id'], entry['raw_text'])
+            if not result.get('success'):
+                raise Exception(f"Evaluation failed for entry {entry['story_entry_id']}: {result.get('error')}")
+            updated += store_processed_text(agent.db, entry['story_entry_id'], entry['raw_text'], result['processed_text'])
+        done += 1
+        ctx.progress(done, total, {'last_entry_id': entry['story_entry_id'], 'updated': updated})
+    return {'entries': total, 'updated': updated}
+
+
+# kind -> handler(JobContext) returning a JSON-serializable result
+JOB_HANDLERS: Dict[str, Callable[[JobContext], Any]] = {
+    'reextract_entities': reextract_entities,
+    'reevaluate_story': reevaluate_story,
+}
+
+
+def run_worker(db_path: str, worker_id: str, kinds: Optional[List[str]] = None, poll_interval: float = 1.0,
+               stop_event=None):
+    """Lease and run jobs until stop_event is set (one worker process)"""
+    pool = ConnectionPool(db_path, max_size=4)
+    registry = AgentRegistry(pool.acquire)
+    queue = JobQueue.from_env(pool.acquire)
+    print(f"[JobWorker:{worker_id}] Started (pid {os.getpid()})")
+    try:
+        while stop_event is None or not stop_event.is_set():
+            job = queue.lease(worker_id, kinds)
+            if job is None:
+                time.sleep(poll_interval)
+                continue
+            run_job(queue, job, worker_id, registry, pool.acquire)
+    finally:
+        registry.close()
+        pool.close()
+        print(f"[JobWorker:{worker_id}] Stopped")
+
+
+def run_job(queue: JobQueue, job: Dict[str, Any], worker_id: str, registry: AgentRegistry,
+            connect: Callable[[], Any]):
+    """Run one leased job and record its outcome"""
+    label = f"{job['kind']} job {job['job_id']} (attempt {job['attempts']}/{job['max_attempts']})"
+    print(f"[JobWorker:{worker_id}] Running {label}"
+          f"{' from checkpoint ' + json.dumps(job['checkpoint']) if job['checkpoint'] else ''}")
+    started = time.time()
+    try:
+        handler = JOB_HANDLERS.get(job['kind'])
+        if handler is None:
+            raise ValueError(f"Unknown job kind: {job['kind']}")
+        result = handler(JobContext(queue, job, worker_id, registry, connect))
+        queue.complete(job['job_id'], worker_id, result)
+        print(f"✓ [JobWorker:{worker_id}] {label} completed in {int((time.time() - started) * 1000)}ms")
+    except JobCancelled:
+        queue.mark_cancelled(job['job_id'], worker_id)
+        print(f"[JobWorker:{worker_id}] {label} cancelled")
+    except JobLeaseLost as e:
+        print(f"Warning: [JobWorker:{worker_id}] {e}, abandoning it")
+    except Exception as e:
+        print(f"✗ [JobWorker:{worker_id}] {label} failed: {e}")
+        traceback.print_exc()
+        queue.fail(job['job_id'], worker_id, str(e))
+
+
+def _worker_process(db_path: str, worker_id: str, kinds: Optional[List[str]], poll_interval: float, nice: int,
+                    stop_event):
+    # Bulk work yields the CPU to the interactive server
+    if nice:
+        os.nice(nice)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    run_worker(db_path, worker_id, kinds, poll_interval, stop_event)
+
+
+def run_workers(db_path: str, processes: int, kinds: Optional[List[str]] = None, poll_interval: float = 1.0,
+                nice: int = 10):
+    """Run worker processes until interrupted, restarting any that die"""
+    stop_event = multiprocessing.Event()
+    host = socket.gethostname()
+
+    def start(index: int) -> multiprocessing.Process:
+        worker_id = f"{host}:{os.getpid()}:{index}"
+        process = multiprocessing.Process(target=_worker_process, name=f"job-worker-{index}",
+                                          args=(db_path, worker_id, kinds, poll_interval, nice, stop_event))
+        process.start()
+        return process
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    workers = [start(index) for index in range(processes)]
+    print(f"[JobWorker] Running {processes} worker process(es) on {db_path}")
+    try:
+        while not stop_event.is_set():
+            for index, process in enumerate(workers):
+                if not process.is_alive():
+                    print(f"Warning: [JobWorker] Worker {index} exited with code {process.exitcode}, restarting; "
+                          f"its job is retried once the lease expires")
+                    workers[index] = start(index)
+            stop_event.wait(1.0)
+    except KeyboardInterrupt:
+        stop_event.set()
+    print("[JobWorker] Stopping workers after their current job...")
+    for process in workers:
+        process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Storywriter job queue')
+    parser.add_argument('--db', default='storywriter.db', help='Database path')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    worker = commands.add_parser('worker', help='Run worker processes')
+    worker.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='Worker processes (default: CPU count)')
+    worker.add_argument('--kinds', help='Comma-separated job kinds to run (default: all)')
+    worker.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between polls when idle')
+    worker.add_argument('--nice', type=int, default=int(os.getenv('JOB_WORKER_NICE', '10')),
+                        help='Scheduling niceness increment for workers')
+
+    enqueue = commands.add_parser('enqueue', help='Queue a job')
+    enqueue.add_argument('kind', choices=sorted(JOB_HANDLERS))
+    enqueue.add_argument('--payload', default='{}', help='JSON payload, e.g. {"story_id": "1"}')
+    enqueue.add_argument('--priority', type=int, default=0)
+    enqueue.add_argument('--max-attempts', type=int, default=3)
+
+    listing = commands.add_parser('list', help='Show recent jobs')
+    listing.add_argument('--status', help='Only jobs with this status')
+
+    cancel = commands.add_parser('cancel', help='Cancel a job')
+    cancel.add_argument('job_id', type=int)
+
+    args = parser.parse_args()
+
+    if args.command == 'worker':
+        kinds = args.kinds.split(',') if args.kinds else None
+        run_workers(args.db, args.processes, kinds, args.poll_interval, args.nice)
+        return
+
+    pool = ConnectionPool(args.db, max_size=1)
+    queue = JobQueue.from_env(pool.acquire)
+    try:
+        if args.command == 'enqueue':
+            queue.enqueue(args.kind, json.loads(args.payload), args.priority, args.max_attempts)
+        elif args.command == 'list':
+            for job in queue.list_jobs(args.status):
+                total = job['progress_total'] if job['progress_total'] is not None else '?'
+                print(f"{job['job_id']:>6}  {job['kind']:<20} {job['status']:<10} "
+                      f"{job['progress_done']}/{total}  attempts {job['attempts']}/{job['max_attempts']}"
+                      f"{'  ' + job['error'] if job['error'] else ''}")
+        elif args.command == 'cancel':
+            print(f"Cancelled job {args.job_id}" if queue.cancel(args.job_id) else f"Job {args.job_id} is not active")
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
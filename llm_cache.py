@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+
+# Parameters that change what the model returns; everything else (stream, timeouts, ...)
+# is transport detail and must not split the cache
+_KEY_PARAMS = ('model', 'messages', 'max_tokens', 'temperature', 'top_p', 'n', 'stop',
+               'presence_penalty', 'frequency_penalty', 'seed', 'response_format', 'tools',
+               'tool_choice', 'logit_bias')
+
+
+def request_key(call_params: Dict[str, Any]) -> str:
+    """Content-addressed key for a chat completion request"""
+    material = {k: call_params[k] for k in _KEY_PARAMS if k in call_params}
+    encoded = json.dumps(material, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """Two-level (memory LRU + SQLite) cache of LLM responses with per-entry TTL
+
+    The memory level is bounded by max_entries; the disk level by max_disk_entries,
+    pruned least-recently-hit first. Expired entries are dropped lazily on lookup
+    and during pruning.
+    """
+
+    def __init__(self, db_path: str = "llm_cache.db", max_entries: int = 1000,
+                 max_disk_entries: int = 50000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[float, str, int]]" = OrderedDict()
+        self._stats = {'hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'misses': 0,
+                       'stores': 0, 'evictions': 0, 'expirations': 0}
+        self._writes_since_prune = 0
+
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS llm_response_cache (
+                cache_key TEXT PRIMARY KEY,
+                model TEXT,
+                response_text TEXT NOT NULL,
+                tokens INTEGER DEFAULT 0,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_hit_at REAL NOT NULL,
+                hit_count INTEGER DEFAULT 0
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_llm_response_cache_last_hit ON llm_response_cache(last_hit_at)")
+        self.db.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response text for key, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self._stats['hits'] += 1
+                    self._stats['memory_hits'] += 1
+                    return entry[1]
+                del self._memory[key]
+                self._stats['expirations'] += 1
+
+            row = self.db.execute("""
+                SELECT response_text, tokens, expires_at FROM llm_response_cache WHERE cache_key = ?
+            """, (key,)).fetchone()
+            if not row:
+                self._stats['misses'] += 1
+                return None
+
+            response_text, tokens, expires_at = row
+            if expires_at <= now:
+                self.db.execute("DELETE FROM llm_response_cache WHERE cache_key = ?", (key,))
+                self.db.commit()
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+
+            self.db.execute("""
+                UPDATE llm_response_cache SET last_hit_at = ?, hit_count = hit_count + 1
+                WHERE cache_key = ?
+            """, (now, key))
+            self.db.commit()
+            self._remember(key, (expires_at, response_text, tokens))
+            self._stats['hits'] += 1
+            self._stats['disk_hits'] += 1
+            return response_text
+
+    def put(self, key: str, response_text: str, ttl_seconds: int, model: str = "", tokens: int = 0):
+        """Store a response for ttl_seconds in memory and on disk"""
+        now = time.time()
+        expires_at = now + ttl_seconds
+        with self._lock:
+            self._remember(key, (expires_at, response_text, tokens))
+            self.db.execute("""
+                INSERT OR REPLACE INTO llm_response_cache
+                (cache_key, model, response_text, tokens, created_at, expires_at, last_hit_at, hit_count)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 0)
+            """, (key, model, response_text, tokens, now, expires_at, now))
+            self.db.commit()
+            self._stats['stores'] += 1
+
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= 100:
+                self._prune_disk(now)
+                self._writes_since_prune = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters plus current sizes"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+            stats['disk_entries'] = self.db.execute("SELECT COUNT(*) FROM llm_response_cache").fetchone()[0]
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        return stats
+
+    def clear(self):
+        """Drop every cached response"""
+        with self._lock:
+            self._memory.clear()
+            self.db.execute("DELETE FROM llm_response_cache")
+            self.db.commit()
+
+    def _remember(self, key: str, entry: Tuple[float, str, int]):
+        """Insert into the memory LRU (caller holds the lock)"""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def _prune_disk(self, now: float):
+        """Delete expired rows and trim the table to max_disk_entries (caller holds the lock)"""
+        cursor = self.db.execute("DELETE FROM llm_response_cache WHERE expires_at <= ?", (now,))
+        self._stats['expirations'] += cursor.rowcount
+        cursor = self.db.execute("""
+            DELETE FROM llm_response_cache WHERE cache_key IN (
+                SELECT cache_key FROM llm_response_cache
+                ORDER BY last_hit_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_disk_entries,))
+        self._stats['evictions'] += cursor.rowcount
+        self.db.commit()
+
+
+_response_cache: Optional[LLMResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> LLMResponseCache:
+    """Process-wide response cache, configured from LLM_CACHE_DB / LLM_CACHE_MAX_ENTRIES"""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = LLMResponseCache(
+                db_path=os.getenv("LLM_CACHE_DB", "llm_cache.db"),
+                max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+            )
+        return _response_cache
@@ -0,0 +1,285 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Callable, Optional
+
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {'APIConnectionError', 'APITimeoutError', 'RateLimitError', 'InternalServerError'}
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the provider while a model's circuit breaker is open"""
+
+
+def is_retryable(error: Exception) -> bool:
+    """Transient provider errors worth retrying (timeouts, connection drops, 429, 5xx)"""
+    if type(error).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    return getattr(error, 'status_code', None) in RETRYABLE_STATUS_CODES
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """Retry-After header from a provider error response, if any"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class ResiliencePolicy:
+    """Retry, circuit breaker and hedging settings for LLM calls"""
+
+    def __init__(self, max_retries: int = 2, backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 breaker_threshold: int = 5, breaker_cooldown: float = 30.0,
+                 hedge: bool = False, hedge_quantile: float = 0.95, hedge_min_delay: float = 0.5,
+                 hedge_min_samples: int = 20):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+
+    @classmethod
+    def from_env(cls) -> 'ResiliencePolicy':
+        """Build a policy from LLM_* environment variables"""
+        return cls(
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+            backoff_base=float(os.getenv("LLM_BACKOFF_BASE", "0.5")),
+            backoff_max=float(os.getenv("LLM_BACKOFF_MAX", "8")),
+            breaker_threshold=int(os.getenv("LLM_BREAKER_THRESHOLD", "5")),
+            breaker_cooldown=float(os.getenv("LLM_BREAKER_COOLDOWN", "30")),
+            hedge=os.getenv("LLM_HEDGE", "0") == "1",
+            hedge_quantile=float(os.getenv("LLM_HEDGE_QUANTILE", "0.95")),
+            hedge_min_delay=float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5")),
+        )
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, never shorter than a Retry-After hint"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+
+class CircuitBreaker:
+    """Per-model breaker: opens after consecutive retryable failures, half-opens after a cooldown"""
+
+    def __init__(self, model: str, threshold: int, cooldown: float):
+        self.model = model
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+    def allow(self):
+        """Raise CircuitOpenError unless a call may go through (one probe when half-open)"""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.cooldown or self._probe_in_flight:
+                raise CircuitOpenError(f"Circuit open for model {self.model}")
+            self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    print(f"[LLMResilience] Circuit opened for model {self.model} after {self.failures} failures")
+                self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Sliding window of successful call durations for one model"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class ResilientCaller:
+    """Runs LLM requests with jittered retries, per-model circuit breakers and optional hedging
+
+    Hedging only applies to non-streaming calls: when the primary request has not
+    finished after the model's observed p95 latency, an identical request is fired
+    and whichever finishes first wins.
+    """
+
+    def __init__(self, policy: ResiliencePolicy):
+        self.policy = policy
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latency: Dict[str, LatencyTracker] = {}
+        self._hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            if model not in self._breakers:
+                self._breakers[model] = CircuitBreaker(model, self.policy.breaker_threshold,
+                                                       self.policy.breaker_cooldown)
+            return self._breakers[model]
+
+    def latency(self, model: str) -> LatencyTracker:
+        with self._lock:
+            if model not in self._latency:
+                self._latency[model] = LatencyTracker()
+            return self._latency[model]
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """Seconds to wait before hedging, or None while hedging is off or under-sampled"""
+        if not self.policy.hedge:
+            return None
+        p = self.latency(model).quantile(self.policy.hedge_quantile, self.policy.hedge_min_samples)
+        return None if p is None else max(p, self.policy.hedge_min_delay)
+
+    def call(self, request: Callable[[], Any], model: str, hedge: bool = True,
+             stats: Optional[Dict[str, Any]] = None) -> Any:
+        """Run request() with retries; stats receives llm_attempts / hedged"""
+        breaker = self.breaker(model)
+        attempt = 0
+        while True:
+            breaker.allow()
+            attempt += 1
+            started = time.monotonic()
+            try:
+                delay = self.hedge_delay(model) if hedge else None
+                if delay is None:
+                    result, hedged = request(), False
+                else:
+                    result, hedged = self._hedged(request, delay)
+            except Exception as e:
+                if not is_retryable(e):
+                    breaker.record_success()  # provider answered; the request itself was bad
+                    raise
+                breaker.record_failure()
+                if attempt > self.policy.max_retries:
+                    raise
+                pause = self.policy.backoff(attempt - 1, e)
+                print(f"[LLMResilience] {model} attempt {attempt} failed ({type(e).__name__}), retrying in {pause:.2f}s")
+                time.sleep(pause)
+                continue
+
+            breaker.record_success()
+            self.latency(model).add(time.monotonic() - started)
+            if stats is not None:
+                stats.update(llm_attempts=attempt, hedged=hedged)
+            return result
+
+    async def call_async(self, request: Callable[[], Any], model: str, hedge: bool = True,
+                         stats: Optional[Dict[str, Any]] = None) -> Any:
+        """Async call(); request() must return an awaitable"""
+        breaker = self.breaker(model)
+        attempt = 0
+        while True:
+            breaker.allow()
+            attempt += 1
+            started = time.monotonic()
+            try:
+                delay = self.hedge_delay(model) if hedge else None
+                if delay is None:
+                    result, hedged = await request(), False
+                else:
+                    result, hedged = await self._hedged_async(request, delay)
+            except Exception as e:
+                if not is_retryable(e):
+                    breaker.record_success()
+                    raise
+                breaker.record_failure()
+                if attempt > self.policy.max_retries:
+                    raise
+                pause = self.policy.backoff(attempt - 1, e)
+                print(f"[LLMResilience] {model} attempt {attempt} failed ({type(e).__name__}), retrying in {pause:.2f}s")
+                await asyncio.sleep(pause)
+                continue
+
+            breaker.record_success()
+            self.latency(model).add(time.monotonic() - started)
+            if stats is not None:
+                stats.update(llm_attempts=attempt, hedged=hedged)
+            return result
+
+    def _hedged(self, request: Callable[[], Any], delay: float):
+        primary = self._hedge_pool.submit(request)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result(), False
+
+        print(f"[LLMResilience] No response after {delay:.2f}s, sending hedged request")
+        pending = {primary, self._hedge_pool.submit(request)}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # The slower request keeps running in the pool; its result is discarded
+                    return future.result(), True
+                error = future.exception()
+        raise error
+
+    async def _hedged_async(self, request: Callable[[], Any], delay: float):
+        primary = asyncio.ensure_future(request())
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result(), False
+
+        print(f"[LLMResilience] No response after {delay:.2f}s, sending hedged request")
+        pending = {primary, asyncio.ensure_future(request())}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result(), True
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+_resilient_caller: Optional[ResilientCaller] = None
+_resilient_caller_lock = threading.Lock()
+
+
+def get_resilient_caller() -> ResilientCaller:
+    """Process-wide ResilientCaller built from the environment"""
+    global _resilient_caller
+    with _resilient_caller_lock:
+        if _resilient_caller is None:
+            _resilient_caller = ResilientCaller(ResiliencePolicy.from_env())
+        return _resilient_caller
@@ -0,0 +1,205 @@
+import asyncio
+import os
+import threading
+import weakref
+from typing import Dict, List, Any, Callable, Optional, Tuple
+
+
+class StreamFlight:
+    """Shared state of one in-flight streamed completion
+
+    The leader publishes deltas as they arrive; every follower replays the
+    prefix received so far and then follows the live tail.
+    """
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+
+    def publish(self, delta: str):
+        with self._cond:
+            self.chunks.append(delta)
+            self._cond.notify_all()
+
+    def finish(self, error: Optional[BaseException] = None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def replay(self):
+        """Iterate every delta of the stream, blocking for the live tail"""
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self.chunks) and not self.done:
+                    self._cond.wait()
+                pending = self.chunks[index:]
+                finished, error = self.done, self.error
+            for delta in pending:
+                yield delta
+            index += len(pending)
+            if finished and index >= len(self.chunks):
+                if error is not None:
+                    raise Exception(f"Shared LLM stream failed: {error}")
+                return
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesces identical concurrent requests across threads into one upstream call"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, StreamFlight] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run fn() once per key among concurrent callers; returns (result, is_leader)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise Exception(f"Shared LLM call failed: {call.error}")
+            return call.result, False
+
+        try:
+            call.result = fn()
+            return call.result, True
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def join_stream(self, key: str) -> Tuple[StreamFlight, bool]:
+        """Return the flight for key and whether the caller must lead it (then call end_stream)"""
+        with self._lock:
+            flight = self._streams.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._streams[key] = StreamFlight()
+            return flight, True
+
+    def end_stream(self, key: str, flight: StreamFlight, error: Optional[BaseException] = None):
+        """Leader only: stop accepting joiners and release followers"""
+        with self._lock:
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+        flight.finish(error)
+
+
+class AsyncStreamFlight:
+    """StreamFlight for coroutines on a single event loop"""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, delta: str):
+        self.chunks.append(delta)
+        self._changed.set()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done = True
+        self.error = error
+        self._changed.set()
+
+    async def replay(self):
+        index = 0
+        while True:
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise Exception(f"Shared LLM stream failed: {self.error}")
+                return
+            self._changed.clear()
+            await self._changed.wait()
+
+
+class AsyncSingleFlight:
+    """Coalesces identical concurrent requests among coroutines of one event loop"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._streams: Dict[str, AsyncStreamFlight] = {}
+
+    async def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Await fn() once per key among concurrent callers; returns (result, is_leader)"""
+        future = self._calls.get(key)
+        if future is not None:
+            try:
+                return await asyncio.shield(future), False
+            except (Exception, asyncio.CancelledError) as e:
+                if future.cancelled():
+                    raise Exception("Shared LLM call was cancelled by its leader")
+                raise Exception(f"Shared LLM call failed: {e}")
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result, True
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved so followerless failures do not log "exception never retrieved"
+            future.exception()
+            raise
+        finally:
+            del self._calls[key]
+
+    def join_stream(self, key: str) -> Tuple[AsyncStreamFlight, bool]:
+        flight = self._streams.get(key)
+        if flight is not None:
+            return flight, False
+        flight = self._streams[key] = AsyncStreamFlight()
+        return flight, True
+
+    def end_stream(self, key: str, flight: AsyncStreamFlight, error: Optional[BaseException] = None):
+        if self._streams.get(key) is flight:
+            del self._streams[key]
+        flight.finish(error)
+
+
+_single_flight = SingleFlight()
+_async_single_flights: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def single_flight_enabled() -> bool:
+    """LLM_SINGLE_FLIGHT=0 turns request coalescing off"""
+    return os.getenv("LLM_SINGLE_FLIGHT", "1") != "0"
+
+
+def get_single_flight() -> SingleFlight:
+    return _single_flight
+
+
+def get_async_single_flight() -> AsyncSingleFlight:
+    """AsyncSingleFlight for the running event loop"""
+    loop = asyncio.get_running_loop()
+    flight = _async_single_flights.get(loop)
+    if flight is None:
+        flight = _async_single_flights[loop] = AsyncSingleFlight()
+    return flight
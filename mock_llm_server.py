@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible stand-in for benchmarks and load tests
+Serves /v1/chat/completions (streaming and non-streaming) with configurable
+latency and failure injection. Point the agents at it with:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8099/v1 OPENAI_API_KEY=mock python app.py
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Any, Optional
+
+
+STORY_SENTENCES = [
+    "The lantern light trembled across the wet cobblestones.",
+    "Somewhere beyond the harbor wall, a bell began to toll.",
+    "Mara pulled her coat tighter and listened for footsteps.",
+    "The old captain laughed, but his eyes never left the door.",
+    "A gull cried once and the street fell silent again.",
+    "Rain traced slow lines down the tavern window.",
+    "Nobody spoke of the ship that had not come home.",
+    "Tom set the letter down and reached for his pipe.",
+    "The fog rolled in thick enough to swallow the lamps.",
+    "Far below, the tide whispered against the pilings.",
+]
+
+CAPITALIZED_WORD = re.compile(r"\b[A-Z][a-z]{2,}\b")
+COMMON_WORDS = {'The', 'And', 'But', 'Then', 'When', 'She', 'His', 'Her', 'They', 'There',
+                'This', 'That', 'What', 'Somewhere', 'Nobody', 'Far', 'Rain', 'Text', 'Existing',
+                'Scene', 'Beat', 'Story', 'Continue', 'Given', 'Respond', 'Indicate', 'Keep'}
+
+
+class MockSettings:
+    """Latency, failure and output settings shared by all request handlers"""
+
+    def __init__(self, ttft_ms: float = 300, token_ms: float = 20, jitter: float = 0.2,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, retry_after: float = 1.0,
+                 max_story_tokens: int = 200, responses: Optional[List[Dict[str, str]]] = None,
+                 seed: Optional[int] = None):
+        self.ttft_ms = ttft_ms
+        self.token_ms = token_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.max_story_tokens = max_story_tokens
+        self.responses = responses or []
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'streams': 0, 'errors': 0, 'rate_limited': 0,
+                      'completion_tokens': 0, 'in_flight': 0, 'max_in_flight': 0}
+
+    def roll(self) -> float:
+        with self._lock:
+            return self.random.random()
+
+    def delay(self, ms: float):
+        """Sleep ms milliseconds +/- jitter"""
+        if ms <= 0:
+            return
+        with self._lock:
+            factor = 1 + self.random.uniform(-self.jitter, self.jitter)
+        time.sleep(ms * factor / 1000.0)
+
+    def count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self.stats[name] += value
+            self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self.stats['in_flight'])
+
+
+def _prompt_text(messages: List[Dict[str, Any]]) -> str:
+    return "\n\n".join(str(m.get('content') or '') for m in messages)
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def eval_response(prompt: str) -> str:
+    """Canned EvalAgent JSON: paragraphs of the evaluated text become segments"""
+    text = prompt.split("\n\n", 1)[1] if "\n\n" in prompt else prompt
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text.strip()) if p.strip()]
+    segments = [{"text": p, "new_scene": bool(re.match(r"^(scene|\#\s*scene)\b", p, re.IGNORECASE))}
+                for p in paragraphs]
+    return json.dumps({
+        "processed_text": "\n\n".join(paragraphs),
+        "segments": segments,
+        "new_scene": segments[0]["new_scene"] if segments else False,
+        "new_beat": len(segments) > 1,
+    })
+
+
+def entity_response(prompt: str) -> str:
+    """Canned EntityAgent JSON array: capitalized words of the analyzed text"""
+    text = prompt.rsplit("Text to analyze:", 1)[-1]
+    names = []
+    for word in CAPITALIZED_WORD.findall(text):
+        if word not in COMMON_WORDS and word not in names:
+            names.append(word)
+    return json.dumps([{"name": name, "confidence": 0.9} for name in names[:10]])
+
+
+def story_response(settings: MockSettings, max_tokens: int, rng: random.Random, markers: bool = False) -> str:
+    """Story prose roughly max_tokens long (capped by --max-story-tokens)
+
+    With markers each paragraph opens with a <<BEAT>> (sometimes <<SCENE>>) line,
+    as GeneratorAgent requests in its segment-marker mode.
+    """
+    budget = min(max_tokens, settings.max_story_tokens)
+    sentences, used = [], 0
+    while used < budget:
+        sentence = rng.choice(STORY_SENTENCES)
+        sentences.append(sentence)
+        used += estimate_tokens(sentence) + 1
+    paragraphs = [" ".join(sentences[i:i + 3]) for i in range(0, len(sentences), 3)]
+    if markers:
+        paragraphs = [f"{'<<SCENE>>' if i and rng.random() < 0.2 else '<<BEAT>>'}\n{p}"
+                      for i, p in enumerate(paragraphs)]
+    return "\n\n".join(paragraphs)
+
+
+def build_response(settings: MockSettings, body: Dict[str, Any], choice_index: int) -> str:
+    """Pick the output for one choice: configured template, Eval/Entity JSON or story prose"""
+    prompt = _prompt_text(body.get('messages', []))
+    for rule in settings.responses:
+        if rule.get('match', '') in prompt:
+            return rule['response'].replace('{prompt}', prompt[-2000:])
+    if '"processed_text"' in prompt:
+        return eval_response(prompt)
+    if 'Text to analyze:' in prompt:
+        return entity_response(prompt)
+    rng = random.Random(f"{zlib.crc32(prompt.encode('utf-8'))}:{choice_index}:{settings.roll()}")
+    return story_response(settings, int(body.get('max_tokens') or 1000), rng, markers='<<BEAT>>' in prompt)
+
+
+def split_tokens(text: str) -> List[str]:
+    """Split text into token-sized deltas that join back to the original"""
+    return re.findall(r"\s*\S+|\s+", text)
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    settings: MockSettings = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self._json(200, {"object": "list", "data": [
+                {"id": "mock-model", "object": "model", "owned_by": "mock"}]})
+        elif self.path.rstrip('/').endswith('/stats'):
+            self._json(200, self.settings.stats)
+        else:
+            self._json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            self._json(400, {"error": {"message": "Invalid JSON body", "type": "invalid_request_error"}})
+            return
+
+        settings = self.settings
+        settings.count(requests=1, in_flight=1)
+        try:
+            roll = settings.roll()
+            if roll < settings.rate_limit_rate:
+                settings.count(rate_limited=1)
+                self._json(429, {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error"}},
+                           headers={'Retry-After': str(settings.retry_after)})
+                return
+            if roll < settings.rate_limit_rate + settings.error_rate:
+                settings.delay(settings.ttft_ms)
+                settings.count(errors=1)
+                self._json(500, {"error": {"message": "Injected server error (mock)", "type": "server_error"}})
+                return
+
+            n = max(1, int(body.get('n') or 1))
+            outputs = [build_response(settings, body, i) for i in range(n)]
+            prompt_tokens = estimate_tokens(_prompt_text(body.get('messages', [])))
+            if body.get('stream'):
+                self._stream(body, outputs, prompt_tokens)
+            else:
+                self._complete(body, outputs, prompt_tokens)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            settings.count(in_flight=-1)
+
+    def _complete(self, body: Dict[str, Any], outputs: List[str], prompt_tokens: int):
+        settings = self.settings
+        completion_tokens = sum(len(split_tokens(text)) for text in outputs)
+        settings.delay(settings.ttft_ms + settings.token_ms * completion_tokens / len(outputs))
+        settings.count(completion_tokens=completion_tokens)
+        self._json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get('model', 'mock-model'),
+            "choices": [{"index": i, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+                        for i, text in enumerate(outputs)],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    def _stream(self, body: Dict[str, Any], outputs: List[str], prompt_tokens: int):
+        settings = self.settings
+        settings.count(streams=1)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        base = {"id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": body.get('model', 'mock-model')}
+
+        def send(payload: Dict[str, Any]):
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        settings.delay(settings.ttft_ms)
+        tokens = [split_tokens(text) for text in outputs]
+        completion_tokens = 0
+        # Choices advance in lock step, one delta each per tick
+        for position in range(max(len(t) for t in tokens)):
+            if position:
+                settings.delay(settings.token_ms)
+            for index, choice_tokens in enumerate(tokens):
+                if position < len(choice_tokens):
+                    send(dict(base, choices=[{"index": index, "delta": {"content": choice_tokens[position]},
+                                              "finish_reason": None}]))
+                    completion_tokens += 1
+
+        for index in range(len(outputs)):
+            send(dict(base, choices=[{"index": index, "delta": {}, "finish_reason": "stop"}]))
+        if (body.get('stream_options') or {}).get('include_usage'):
+            send(dict(base, choices=[], usage={"prompt_tokens": prompt_tokens,
+                                               "completion_tokens": completion_tokens,
+                                               "total_tokens": prompt_tokens + completion_tokens}))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        settings.count(completion_tokens=completion_tokens)
+
+    def _json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve(settings: MockSettings, host: str = "127.0.0.1", port: int = 8099) -> ThreadingHTTPServer:
+    """Start the server on a background thread and return it (call shutdown() to stop)"""
+    handler = type('ConfiguredMockLLMHandler', (MockLLMHandler,), {'settings': settings})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.settings = settings
+    threading.Thread(target=server.serve_forever, name="mock-llm-server", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OpenAI-compatible mock LLM server')
+    parser.add_argument('--host', default='127.0.0.1', help='Bind address')
+    parser.add_argument('--port', type=int, default=8099, help='Port')
+    parser.add_argument('--ttft-ms', type=float, default=300, help='Time to first token (ms)')
+    parser.add_argument('--token-ms', type=float, default=20, help='Delay between streamed tokens (ms)')
+    parser.add_argument('--jitter', type=float, default=0.2, help='Relative latency jitter (0.2 = +/-20%%)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 429')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After seconds sent with 429s')
+    parser.add_argument('--max-story-tokens', type=int, default=200, help='Cap on generated story length')
+    parser.add_argument('--responses', help='JSON file of [{"match": "...", "response": "... {prompt} ..."}] overrides')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible runs')
+
+    args = parser.parse_args()
+
+    responses = None
+    if args.responses:
+        with open(args.responses, 'r') as f:
+            responses = json.load(f)
+
+    settings = MockSettings(ttft_ms=args.ttft_ms, token_ms=args.token_ms, jitter=args.jitter,
+                            error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                            retry_after=args.retry_after, max_story_tokens=args.max_story_tokens,
+                            responses=responses, seed=args.seed)
+    server = serve(settings, args.host, args.port)
+    print(f"Mock LLM server listening on http://{args.host}:{args.port}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(f"Stopping mock LLM server: {settings.stats}")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,9 @@ class PrepAgent(BaseAgent):
     """Prepares context and prompts for story generation"""
     
     def execute(self, story_id: str, scene_id: str, beat_id: str, 
-                user_input: str = "", prompt_entities: List[Dict] = None) -> Dict[str, Any]:
+                user_input: str = "", prompt_entities: List[Dict] = None,
+                scene_context: Optional[Dict[str, List[Dict]]] = None,
+                prompt_context: Optional[Dict[str, List[Dict]]] = None) -> Dict[str, Any]:
         """
         Queries entity relationships and states to prepare generation context:
         1. Get all relationships in current beat
@@ -18,25 +20,25 @@ class PrepAgent(BaseAgent):
         Args:
             prompt_entities: List of entities identified in user prompt by EntityAgent
                 Format: [{'entity_id': 123, 'name': 'Sarah', 'mentions': ['Sarah', 'she']}, ...]
+            scene_context: Result of load_scene_context() when already loaded (e.g. by a
+                pipeline stage running alongside entity extraction)
+            prompt_context: Result of load_prompt_context() when already loaded
         """
         execution_id = self._start_execution(story_id, source_text=f"user_input: {user_input}")
         
         try:
-            # 1. Get relationships in current beat (most immediate context)
-            beat_relationships = self._get_beat_relationships(story_id, scene_id, beat_id)
+            # 1, 2, 4. Beat and scene relationships, states of the entities involved
+            if scene_context is None:
+                scene_context = self.load_scene_context(story_id, scene_id, beat_id)
+            beat_relationships = scene_context['beat_relationships']
+            scene_relationships = scene_context['scene_relationships']
+            entity_states = scene_context['entity_states']
             
-            # 2. Get relationships in current scene (broader context)
-            scene_relationships = self._get_scene_relationships(story_id, scene_id, beat_id)
-            
-            # 3. For entities mentioned in prompt, get their full historical context
-            prompt_entity_ids = [e['entity_id'] for e in (prompt_entities or [])]
-            historical_relationships = self._get_historical_relationships(story_id, scene_id, prompt_entity_ids)
-            
-            # 4. Get all states for entities involved in relationships
-            entity_states = self._get_entity_states_for_context(story_id, scene_id, beat_id)
-            
-            # 5. Get detailed states for prompt entities across all scenes
-            prompt_entity_states = self._get_prompt_entity_detailed_states(story_id, prompt_entity_ids)
+            # 3, 5. Full history and detailed states for entities mentioned in the prompt
+            if prompt_context is None:
+                prompt_context = self.load_prompt_context(story_id, scene_id, prompt_entities)
+            historical_relationships = prompt_context['historical_relationships']
+            prompt_entity_states = prompt_context['prompt_entity_states']
             
             # 6. Build comprehensive context summary
             context_summary = self._build_context_summary(
@@ -63,118 +65,116 @@ class PrepAgent(BaseAgent):
             self._finish_execution("", f"Error: {str(e)}")
             return {'success': False, 'error': str(e)}
     
+    def load_scene_context(self, story_id: str, scene_id: str, beat_id: str) -> Dict[str, List[Dict]]:
+        """Context that depends only on the position in the story, not on the user prompt"""
+        return {
+            'beat_relationships': self._get_beat_relationships(story_id, scene_id, beat_id),
+            'scene_relationships': self._get_scene_relationships(story_id, scene_id, beat_id),
+            'entity_states': self._get_entity_states_for_context(story_id, scene_id, beat_id),
+        }
+    
+    def load_prompt_context(self, story_id: str, scene_id: str,
+                            prompt_entities: List[Dict] = None) -> Dict[str, List[Dict]]:
+        """Context for the entities mentioned in the user prompt"""
+        prompt_entity_ids = [e['entity_id'] for e in (prompt_entities or [])]
+        return {
+            'historical_relationships': self._get_historical_relationships(story_id, scene_id, prompt_entity_ids),
+            'prompt_entity_states': self._get_prompt_entity_detailed_states(story_id, prompt_entity_ids),
+        }
+    
     def _get_beat_relationships(self, story_id: str, scene_id: str, beat_id: str) -> List[Dict]:
         """Get all relationships within the current beat"""
-        cursor = self.db.execute("""
-            SELECT r.*, 
-                   e1.name as entity1_name, e1.base_type as entity1_type,
-                   e2.name as entity2_name, e2.base_type as entity2_type,
-                   s1.entity_id as entity1_id, s2.entity_id as entity2_id
-            FROM relationships r
-            JOIN states s1 ON r.state_id1 = s1.state_id
-            JOIN states s2 ON r.state_id2 = s2.state_id  
-            JOIN entities e1 ON s1.entity_id = e1.entity_id
-            JOIN entities e2 ON s2.entity_id = e2.entity_id
-            WHERE r.story_id = ? AND r.scene_id = ? AND r.beat_id = ?
-            ORDER BY r.created_at DESC
-        """, (story_id, scene_id, beat_id))
-        
-        return [dict(row) for row in cursor.fetchall()]
+        return [r for r in self._get_all_scene_relationships(story_id, scene_id) if r['beat_id'] == beat_id]
     
     def _get_scene_relationships(self, story_id: str, scene_id: str, beat_id: str) -> List[Dict]:
         """Get all relationships within the current scene (excluding current beat)"""
-        cursor = self.db.execute("""
-            SELECT r.*, 
-                   e1.name as entity1_name, e1.base_type as entity1_type,
-                   e2.name as entity2_name, e2.base_type as entity2_type,
-                   s1.entity_id as entity1_id, s2.entity_id as entity2_id
-            FROM relationships r
-            JOIN states s1 ON r.state_id1 = s1.state_id
-            JOIN states s2 ON r.state_id2 = s2.state_id  
-            JOIN entities e1 ON s1.entity_id = e1.entity_id
-            JOIN entities e2 ON s2.entity_id = e2.entity_id
-            WHERE r.story_id = ? AND r.scene_id = ? AND r.beat_id != ?
-            ORDER BY r.created_at DESC
-        """, (story_id, scene_id, beat_id))
-        
-        return [dict(row) for row in cursor.fetchall()]
+        return [r for r in self._get_all_scene_relationships(story_id, scene_id) if r['beat_id'] != beat_id]
     
     def _get_historical_relationships(self, story_id: str, current_scene_id: str, 
                                     prompt_entity_ids: List[int]) -> List[Dict]:
-        """Get ALL historical relationships for entities mentioned in user prompt"""
+        """Get ALL historical relationships for entities mentioned in user prompt (memoized per request context)"""
         if not prompt_entity_ids:
             return []
         
         placeholders = ','.join(['?' for _ in prompt_entity_ids])
         
-        cursor = self.db.execute(f"""
-            SELECT r.*, 
-                   e1.name as entity1_name, e1.base_type as entity1_type,
-                   e2.name as entity2_name, e2.base_type as entity2_type,
-                   s1.entity_id as entity1_id, s2.entity_id as entity2_id,
-                   r.scene_id as historical_scene,
-                   r.beat_id as historical_beat
-            FROM relationships r
-            JOIN states s1 ON r.state_id1 = s1.state_id
-            JOIN states s2 ON r.state_id2 = s2.state_id  
-            JOIN entities e1 ON s1.entity_id = e1.entity_id
-            JOIN entities e2 ON s2.entity_id = e2.entity_id
-            WHERE r.story_id = ? 
-            AND r.scene_id != ?
-            AND (s1.entity_id IN ({placeholders}) OR s2.entity_id IN ({placeholders}))
-            ORDER BY r.scene_id DESC, r.beat_id DESC, r.created_at DESC
-        """, [story_id, current_scene_id] + prompt_entity_ids + prompt_entity_ids)
-        
-        return [dict(row) for row in cursor.fetchall()]
+        def query():
+            cursor = self.db.execute(f"""
+                SELECT r.*, 
+                       e1.name as entity1_name, e1.base_type as entity1_type,
+                       e2.name as entity2_name, e2.base_type as entity2_type,
+                       s1.entity_id as entity1_id, s2.entity_id as entity2_id,
+                       r.scene_id as historical_scene,
+                       r.beat_id as historical_beat
+                FROM relationships r
+                JOIN states s1 ON r.state_id1 = s1.state_id
+                JOIN states s2 ON r.state_id2 = s2.state_id  
+                JOIN entities e1 ON s1.entity_id = e1.entity_id
+                JOIN entities e2 ON s2.entity_id = e2.entity_id
+                WHERE r.story_id = ? 
+                AND r.scene_id != ?
+                AND (s1.entity_id IN ({placeholders}) OR s2.entity_id IN ({placeholders}))
+                ORDER BY r.scene_id DESC, r.beat_id DESC, r.created_at DESC
+            """, [story_id, current_scene_id] + prompt_entity_ids + prompt_entity_ids)
+        
+            return [dict(row) for row in cursor.fetchall()]
+        
+        return self._memo('historical_relationships', (story_id, current_scene_id, tuple(prompt_entity_ids)), query)
     
     def _get_entity_states_for_context(self, story_id: str, scene_id: str, beat_id: str) -> List[Dict]:
-        """Get detailed entity states for all entities involved in current scene relationships"""
-        cursor = self.db.execute("""
-            SELECT DISTINCT e.*, s.*, 
-                   s.current_form_description, s.current_form_description_detail,
-                   s.current_function_description, s.current_function_description_detail,
-                   s.current_character_description, s.current_character_description_detail,
-                   s.current_goal_description, s.current_goal_description_detail,
-                   s.current_history_description, s.current_history_description_detail,
-                   s.attributes as current_attributes
-            FROM entities e
-            LEFT JOIN states s ON e.entity_id = s.entity_id 
-                AND s.story_id = ? AND s.scene_id = ?
-            WHERE e.story_id = ?
-            AND e.entity_id IN (
-                SELECT DISTINCT s1.entity_id FROM relationships r
-                JOIN states s1 ON (r.state_id1 = s1.state_id OR r.state_id2 = s1.state_id)
-                WHERE r.story_id = ? AND r.scene_id = ?
-            )
-            ORDER BY e.name
-        """, (story_id, scene_id, story_id, story_id, scene_id))
-        
-        return [dict(row) for row in cursor.fetchall()]
+        """Get detailed entity states for all entities involved in current scene relationships (memoized per request context)"""
+        def query():
+            cursor = self.db.execute("""
+                SELECT DISTINCT e.*, s.*, 
+                       s.current_form_description, s.current_form_description_detail,
+                       s.current_function_description, s.current_function_description_detail,
+                       s.current_character_description, s.current_character_description_detail,
+                       s.current_goal_description, s.current_goal_description_detail,
+                       s.current_history_description, s.current_history_description_detail,
+                       s.attributes as current_attributes
+                FROM entities e
+                LEFT JOIN states s ON e.entity_id = s.entity_id 
+                    AND s.story_id = ? AND s.scene_id = ?
+                WHERE e.story_id = ?
+                AND e.entity_id IN (
+                    SELECT DISTINCT s1.entity_id FROM relationships r
+                    JOIN states s1 ON (r.state_id1 = s1.state_id OR r.state_id2 = s1.state_id)
+                    WHERE r.story_id = ? AND r.scene_id = ?
+                )
+                ORDER BY e.name
+            """, (story_id, scene_id, story_id, story_id, scene_id))
+        
+            return [dict(row) for row in cursor.fetchall()]
+        
+        return self._memo('scene_entity_states', (story_id, scene_id), query)
     
     def _get_prompt_entity_detailed_states(self, story_id: str, prompt_entity_ids: List[int]) -> List[Dict]:
-        """Get comprehensive state history for entities mentioned in prompt"""
+        """Get comprehensive state history for entities mentioned in prompt (memoized per request context)"""
         if not prompt_entity_ids:
             return []
         
         placeholders = ','.join(['?' for _ in prompt_entity_ids])
         
-        cursor = self.db.execute(f"""
-            SELECT e.*, s.*,
-                   s.current_form_description, s.current_form_description_detail,
-                   s.current_function_description, s.current_function_description_detail,
-                   s.current_character_description, s.current_character_description_detail,
-                   s.current_goal_description, s.current_goal_description_detail,
-                   s.current_history_description, s.current_history_description_detail,
-                   s.attributes as current_attributes,
-                   s.scene_id as state_scene,
-                   s.beat_id as state_beat
-            FROM entities e
-            LEFT JOIN states s ON e.entity_id = s.entity_id AND s.story_id = ?
-            WHERE e.entity_id IN ({placeholders})
-            ORDER BY e.entity_id, s.scene_id DESC, s.beat_id DESC, s.created_at DESC
-        """, [story_id] + prompt_entity_ids)
-        
-        return [dict(row) for row in cursor.fetchall()]
+        def query():
+            cursor = self.db.execute(f"""
+                SELECT e.*, s.*,
+                       s.current_form_description, s.current_form_description_detail,
+                       s.current_function_description, s.current_function_description_detail,
+                       s.current_character_description, s.current_character_description_detail,
+                       s.current_goal_description, s.current_goal_description_detail,
+                       s.current_history_description, s.current_history_description_detail,
+                       s.attributes as current_attributes,
+                       s.scene_id as state_scene,
+                       s.beat_id as state_beat
+                FROM entities e
+                LEFT JOIN states s ON e.entity_id = s.entity_id AND s.story_id = ?
+                WHERE e.entity_id IN ({placeholders})
+                ORDER BY e.entity_id, s.scene_id DESC, s.beat_id DESC, s.created_at DESC
+            """, [story_id] + prompt_entity_ids)
+        
+            return [dict(row) for row in cursor.fetchall()]
+        
+        return self._memo('prompt_entity_states', (story_id, tuple(prompt_entity_ids)), query)
     
     def _build_context_summary(self, beat_relationships: List[Dict], scene_relationships: List[Dict],
                              historical_relationships: List[Dict], entity_states: List[Dict],
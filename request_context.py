@@ -0,0 +1,60 @@
+import threading
+import uuid
+from typing import Dict, Any, Callable, Optional, Tuple
+
+
+class RequestContext:
+    """Memo of story-scoped lookups shared by the agents of one pipeline run
+
+    Set it as agent.request_context on every agent of a run (EntityAgent ->
+    PrepAgent -> GeneratorAgent) and repeated lookups (existing entities, aliases,
+    scene relationships, entity states) are answered from memory after the first
+    query. Values are shared between agents and must be treated as read-only;
+    agents that write invalidate() the lookups they change. A context lives for one
+    user request, so it never serves data older than that request.
+    """
+
+    def __init__(self, request_id: Optional[str] = None):
+        self.request_id = request_id or uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, tuple], Any] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def get_or_compute(self, name: str, key: tuple, compute: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Return (value, hit) for lookup name with key, running compute() on a miss"""
+        memo_key = (name, key)
+        with self._lock:
+            if memo_key in self._values:
+                self._count(name, 'hits')
+                return self._values[memo_key], True
+            self._count(name, 'misses')
+
+        # Queries run outside the lock so parallel stages are not serialized
+        value = compute()
+        with self._lock:
+            value = self._values.setdefault(memo_key, value)
+        return value, False
+
+    def invalidate(self, *names: str):
+        """Forget memoized lookups with the given names (all lookups when none given)"""
+        with self._lock:
+            if not names:
+                self._values.clear()
+            else:
+                self._values = {k: v for k, v in self._values.items() if k[0] not in names}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = {name: dict(counts) for name, counts in self._stats.items()}
+            entries = len(self._values)
+        return {
+            'request_id': self.request_id,
+            'hits': sum(c['hits'] for c in lookups.values()),
+            'misses': sum(c['misses'] for c in lookups.values()),
+            'entries': entries,
+            'lookups': lookups,
+        }
+
+    def _count(self, name: str, outcome: str):
+        counts = self._stats.setdefault(name, {'hits': 0, 'misses': 0})
+        counts[outcome] += 1
@@ -281,6 +281,7 @@ CREATE TABLE agents (
     agent_instructions TEXT, -- Core instructions/prompt for this specific task
     agent_function_calls JSON, -- Available function calls/tools for this task
     model TEXT, -- Which AI model this specific task uses
+    cache_ttl_seconds INTEGER DEFAULT 0, -- Response cache lifetime for this task (0 = caching disabled)
     
     -- Status
     is_active BOOLEAN DEFAULT TRUE, -- Is this agent task currently active?
@@ -316,6 +317,24 @@ CREATE TABLE agent_executions (
     
     -- Cost tracking
     tokens INTEGER, -- Number of tokens consumed
+    prompt_tokens INTEGER, -- Input tokens reported by the provider
+    completion_tokens INTEGER, -- Output tokens reported by the provider
+    
+    -- Streaming latency (NULL for non-streaming calls)
+    time_to_first_token_ms INTEGER, -- Request sent -> first content chunk
+    chunk_count INTEGER, -- Number of content chunks received
+    inter_chunk_p50_ms REAL, -- Median gap between consecutive chunks
+    inter_chunk_p95_ms REAL, -- 95th percentile gap between consecutive chunks
+    inter_chunk_max_ms REAL, -- Longest stall between consecutive chunks
+    
+    -- Resilience (see llm_resilience.py)
+    llm_attempts INTEGER, -- Provider attempts including retries
+    hedged BOOLEAN, -- Whether a hedged duplicate request answered first
+    coalesced BOOLEAN, -- Whether the result was shared from an identical in-flight request (see llm_singleflight.py)
+    
+    -- Request-scoped memoization (see request_context.py)
+    memo_hits INTEGER, -- Lookups answered from the pipeline run's request context
+    memo_misses INTEGER, -- Lookups that had to query the database
     
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -324,6 +343,36 @@ CREATE TABLE agent_executions (
     FOREIGN KEY (story_entry_id) REFERENCES stories(story_entry_id)
 );
 
+-- Durable queue for bulk agent work run by job_queue.py worker processes
+-- (times are Unix epoch seconds so lease expiry is plain arithmetic)
+CREATE TABLE job_queue (
+    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL, -- Handler name in job_queue.JOB_HANDLERS, e.g. 'reextract_entities'
+    payload JSON, -- Handler arguments
+    status TEXT NOT NULL DEFAULT 'queued', -- 'queued', 'running', 'completed', 'failed', 'cancelled'
+    priority INTEGER DEFAULT 0, -- Higher runs first
+    
+    -- Leasing and retries
+    attempts INTEGER DEFAULT 0, -- Leases handed out so far
+    max_attempts INTEGER DEFAULT 3,
+    available_at REAL NOT NULL, -- Not leased before this time (retry backoff)
+    lease_owner TEXT, -- Worker holding the lease
+    lease_expires_at REAL, -- Another worker may take the job over after this time
+    cancel_requested BOOLEAN DEFAULT FALSE, -- Checked by the running worker at its next progress report
+    
+    -- Progress and resumption
+    progress_done INTEGER DEFAULT 0,
+    progress_total INTEGER,
+    checkpoint JSON, -- Handler state saved with progress; a retried job resumes from it
+    result JSON,
+    error TEXT,
+    
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    updated_at REAL NOT NULL
+);
+
 -- Performance indexes
 CREATE INDEX idx_classes_type ON classes(type);
 CREATE INDEX idx_classes_parent ON classes(parent_class_id);
@@ -404,6 +453,10 @@ CREATE INDEX idx_agent_executions_story_id ON agent_executions(story_id);
 CREATE INDEX idx_agent_executions_request_time ON agent_executions(request_time);
 CREATE INDEX idx_agent_executions_story_entry ON agent_executions(story_entry_id);
 
+-- Indexes for job_queue table
+CREATE INDEX idx_job_queue_lease ON job_queue(status, priority DESC, job_id); -- Next job to lease
+CREATE INDEX idx_job_queue_updated_at ON job_queue(updated_at); -- Progress polling
+
 -- Base classes for entity types
 INSERT INTO classes (type, parent_class_id, details, attributes, constraints) VALUES 
 ('actor', NULL, 'Base class for all character entities', '{}', '{}'),
@@ -457,8 +510,20 @@ BEGIN
         updated_at = CURRENT_TIMESTAMP
     WHERE awareness_id = NEW.awareness_id;
 END;
+
+-- Bump agents.updated_at (millisecond precision) on every edit so cached agent configs
+-- (AgentRegistry) notice the change even when the caller does not set updated_at
+CREATE TRIGGER update_agents_timestamp
+AFTER UPDATE ON agents
+WHEN NEW.updated_at IS OLD.updated_at
+BEGIN
+    UPDATE agents
+    SET updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now')
+    WHERE agent_id = NEW.agent_id;
+END;
+
 -- Default agent instructions
-INSERT INTO agents (agent_type, agent_task_id, agent_name, agent_description, agent_instructions, agent_function_calls, model, is_active)
+INSERT INTO agents (agent_type, agent_task_id, agent_name, agent_description, agent_instructions, agent_function_calls, model, cache_ttl_seconds, is_active)
 VALUES (
     'EvalAgent',
     1,
@@ -467,6 +532,7 @@ VALUES (
     'Given raw story text, break it into logical segments representing beats. Indicate if any segment starts a new scene. Respond with JSON: {"processed_text":"text","segments":[{"text":"segment","new_scene":false}]}.',
     '{}',
     'gpt-3.5-turbo',
+    86400,
     1
 );
 
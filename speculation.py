@@ -0,0 +1,136 @@
+import hashlib
+import os
+import threading
+import time
+import traceback
+from typing import Dict, Any, Callable, Optional, Tuple
+
+
+SpeculationKey = Tuple[str, str, str, str]
+
+
+class Speculation:
+    """One speculative background computation and its eventual result"""
+
+    def __init__(self, key: SpeculationKey):
+        self.key = key
+        self.status = 'running'  # running, ready, failed, cancelled
+        self.result: Any = None
+        self.cancel_event = threading.Event()
+        self.done = threading.Event()
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        """Stop the speculative work; agents given cancel_event abort at the next stream chunk"""
+        self.cancel_event.set()
+
+
+class SpeculationCache:
+    """Short-lived results of speculative work, keyed by the story state they assumed
+
+    Keys are (story_id, scene_id, beat_id, hash of the latest story text), so a
+    result is only found while the story still looks the way it did when the work
+    started. Starting a speculation cancels older ones for the same story, results
+    expire after ttl_seconds, and invalidate() cancels and drops everything for a
+    story (or every story) whenever its state changes.
+    """
+
+    def __init__(self, start_task: Callable[..., Any], ttl_seconds: float = 120.0):
+        self._start_task = start_task
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: Dict[SpeculationKey, Speculation] = {}
+        self._stats = {'started': 0, 'ready': 0, 'failed': 0, 'cancelled': 0,
+                       'hits': 0, 'misses': 0, 'expired': 0, 'invalidated': 0}
+
+    @classmethod
+    def from_env(cls, start_task: Callable[..., Any]) -> 'SpeculationCache':
+        """Cache with SPECULATION_TTL_SECONDS lifetime"""
+        return cls(start_task, ttl_seconds=float(os.getenv("SPECULATION_TTL_SECONDS", "120")))
+
+    @staticmethod
+    def key(story_id: str, scene_id: str, beat_id: str, story_text: str) -> SpeculationKey:
+        digest = hashlib.sha256((story_text or "").encode('utf-8')).hexdigest()
+        return (story_id, scene_id, beat_id, digest)
+
+    def start(self, key: SpeculationKey, work: Callable[[Speculation], Any]) -> Speculation:
+        """Run work(speculation) in the background and cache its return value under key"""
+        speculation = Speculation(key)
+        with self._lock:
+            superseded = [s for k, s in self._entries.items() if k[0] == key[0]]
+            self._entries = {k: s for k, s in self._entries.items() if k[0] != key[0]}
+            self._entries[key] = speculation
+            self._stats['started'] += 1
+        for previous in superseded:
+            previous.cancel()
+
+        self._start_task(self._run, speculation, work)
+        return speculation
+
+    def take(self, key: SpeculationKey, timeout: float = 30.0) -> Optional[Any]:
+        """Remove and return the result for key, waiting up to timeout for one still running"""
+        with self._lock:
+            speculation = self._entries.get(key)
+        if speculation is None:
+            with self._lock:
+                self._stats['misses'] += 1
+            return None
+
+        # A running speculation is already ahead of a fresh request, so wait for it
+        speculation.done.wait(timeout)
+        with self._lock:
+            if self._entries.get(key) is speculation:
+                del self._entries[key]
+            expired = (speculation.finished_at is not None
+                       and time.time() - speculation.finished_at > self.ttl_seconds)
+            hit = speculation.status == 'ready' and not expired
+            self._stats['hits' if hit else 'misses'] += 1
+            if expired:
+                self._stats['expired'] += 1
+        if not hit:
+            speculation.cancel()
+            return None
+        print(f"[Speculation] Serving speculative result for story {key[0]} "
+              f"({int((time.time() - speculation.created_at) * 1000)}ms after it started)")
+        return speculation.result
+
+    def invalidate(self, story_id: Optional[str] = None, reason: str = "") -> int:
+        """Cancel and drop speculations for story_id (all stories when None)"""
+        with self._lock:
+            dropped = [s for k, s in self._entries.items() if story_id is None or k[0] == story_id]
+            self._entries = {k: s for k, s in self._entries.items() if not (story_id is None or k[0] == story_id)}
+            self._stats['invalidated'] += len(dropped)
+        for speculation in dropped:
+            speculation.cancel()
+        if dropped:
+            print(f"[Speculation] Invalidated {len(dropped)} speculation(s)"
+                  f"{f' for story {story_id}' if story_id is not None else ''}{f': {reason}' if reason else ''}")
+        return len(dropped)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._entries)
+        return stats
+
+    def _run(self, speculation: Speculation, work: Callable[[Speculation], Any]):
+        try:
+            speculation.result = work(speculation)
+            speculation.status = 'cancelled' if speculation.cancelled else 'ready'
+        except Exception as e:
+            speculation.status = 'cancelled' if speculation.cancelled else 'failed'
+            if speculation.status == 'failed':
+                print(f"Warning: [Speculation] Speculative work for story {speculation.key[0]} failed: {e}")
+                traceback.print_exc()
+        finally:
+            speculation.finished_at = time.time()
+            with self._lock:
+                self._stats[speculation.status] += 1
+                if speculation.status != 'ready' and self._entries.get(speculation.key) is speculation:
+                    del self._entries[speculation.key]
+            speculation.done.set()
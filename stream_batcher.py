@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Any, Optional
+
+
+class StreamBatcher:
+    """Coalesces streamed token deltas into fewer, larger emits
+
+    Deltas are buffered and handed to emit as one batch when window_ms has passed
+    since the first buffered delta, or as soon as max_bytes are waiting. A timer
+    flushes the tail of a batch when the stream pauses, and close() flushes
+    whatever is left. Every batch carries an increasing sequence number so the
+    client can detect gaps or reordering.
+    """
+
+    def __init__(self, emit: Callable[[Dict[str, Any]], None], window_ms: float = 40,
+                 max_bytes: int = 512):
+        """
+        Args:
+            emit: Called with {'chunk': text, 'seq': n} for every batch
+            window_ms: Longest time a delta waits in the buffer
+            max_bytes: Buffered size (UTF-8) that triggers an immediate flush
+        """
+        self._emit = emit
+        self.window = window_ms / 1000.0
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._buffer: List[str] = []
+        self._buffered_bytes = 0
+        self._first_at: Optional[float] = None
+        self._timer: Optional[threading.Timer] = None
+        self._closed = False
+        self.seq = 0
+        self.deltas = 0
+
+    @classmethod
+    def from_env(cls, emit: Callable[[Dict[str, Any]], None]) -> 'StreamBatcher':
+        """Batcher configured from STREAM_BATCH_MS / STREAM_BATCH_BYTES (STREAM_BATCH_MS=0 emits every delta)"""
+        return cls(emit,
+                   window_ms=float(os.getenv("STREAM_BATCH_MS", "40")),
+                   max_bytes=int(os.getenv("STREAM_BATCH_BYTES", "512")))
+
+    def __call__(self, delta: str):
+        self.write(delta)
+
+    def write(self, delta: str):
+        """Buffer one delta, flushing when the window or byte threshold is reached"""
+        if not delta:
+            return
+        with self._lock:
+            if self._closed:
+                return
+            self.deltas += 1
+            self._buffer.append(delta)
+            self._buffered_bytes += len(delta.encode('utf-8'))
+            now = time.monotonic()
+            if self._first_at is None:
+                self._first_at = now
+
+            if self._buffered_bytes >= self.max_bytes or now - self._first_at >= self.window:
+                self._flush_locked()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.window - (now - self._first_at), self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Emit the buffered deltas now"""
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        """Flush the final batch; later writes are dropped"""
+        with self._lock:
+            self._flush_locked()
+            self._closed = True
+
+    def _flush_locked(self):
+        # Emitting under the lock keeps batches in sequence order between the
+        # writer thread and the timer thread
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._buffer:
+            return
+        text = ''.join(self._buffer)
+        self._buffer, self._buffered_bytes, self._first_at = [], 0, None
+        self.seq += 1
+        self._emit({'chunk': text, 'seq': self.seq})
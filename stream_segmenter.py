@@ -0,0 +1,195 @@
+import re
+from typing import Dict, List, Any, Callable, Optional
+
+
+# Shared with EvalAgent's heuristic evaluation
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SCENE_HEADER = re.compile(r"^(scene|\#\s*scene)\b", re.IGNORECASE)
+
+# Openings that often start a new scene without a header; the LLM evaluation decides
+SCENE_CUES = re.compile(
+    r"^(\*\s*\*\s*\*|-{3,}|#{1,3}\s|meanwhile\b|later\b|the next (morning|day|evening|night)\b|"
+    r"(hours|days|weeks|months|years) later\b|elsewhere\b|back at\b|by (morning|nightfall|dawn)\b)",
+    re.IGNORECASE)
+
+
+class StreamSegmenter:
+    """Splits streamed generation text into beat segments as paragraph breaks arrive
+
+    Every paragraph becomes one segment, flagged new_scene when it opens with a
+    scene header. Segments are final the moment the break after them is seen, so
+    on_segment fires while the model is still writing; finish() flushes the last
+    one. Segments with scene cues but no header, or paragraphs too long to be a
+    single beat, are marked ambiguous for the LLM evaluation to refine.
+    """
+
+    def __init__(self, on_segment: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 max_beat_chars: int = 1500):
+        self.on_segment = on_segment
+        self.max_beat_chars = max_beat_chars
+        self.segments: List[Dict[str, Any]] = []
+        self._buffer = ""
+        self._finished = False
+
+    def __call__(self, delta: str):
+        self.feed(delta)
+
+    def feed(self, delta: str):
+        """Consume one streamed delta, emitting every paragraph it completes"""
+        if not delta or self._finished:
+            return
+        self._buffer += delta
+        # Keep the trailing break candidate in the buffer until text follows it
+        while True:
+            match = PARAGRAPH_BREAK.search(self._buffer)
+            if not match or match.end() == len(self._buffer):
+                break
+            paragraph, self._buffer = self._buffer[:match.start()], self._buffer[match.end():]
+            self._emit(paragraph)
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """Flush the final paragraph and return all segments"""
+        if not self._finished:
+            self._finished = True
+            for paragraph in PARAGRAPH_BREAK.split(self._buffer):
+                self._emit(paragraph)
+            self._buffer = ""
+        return self.segments
+
+    @property
+    def ambiguous(self) -> bool:
+        return any(segment['ambiguous'] for segment in self.segments)
+
+    def evaluation(self) -> Dict[str, Any]:
+        """Evaluation in EvalAgent's response format, built from the segments"""
+        segments = [{'text': s['text'], 'new_scene': s['new_scene']} for s in self.segments]
+        return {
+            'processed_text': "\n\n".join(s['text'] for s in segments),
+            'segments': segments,
+            'new_scene': segments[0]['new_scene'] if segments else False,
+            'new_beat': len(segments) > 1,
+        }
+
+    def _emit(self, paragraph: str):
+        text = paragraph.strip()
+        if not text:
+            return
+        new_scene = bool(SCENE_HEADER.match(text))
+        ambiguous = not new_scene and (bool(SCENE_CUES.match(text)) or len(text) > self.max_beat_chars)
+        segment = {'index': len(self.segments), 'text': text, 'new_scene': new_scene, 'ambiguous': ambiguous}
+        self.segments.append(segment)
+        if self.on_segment:
+            self.on_segment(segment)
+
+
+# Inline boundary markers GeneratorAgent asks for in its fused generate-and-segment mode
+BEAT_MARKER = "<<BEAT>>"
+SCENE_MARKER = "<<SCENE>>"
+MARKER = re.compile(r"<<\s*(BEAT|SCENE)\s*>>", re.IGNORECASE)
+MARKER_INSTRUCTIONS = (f"Start every beat with {BEAT_MARKER} on its own line, or with {SCENE_MARKER} "
+                       f"when the beat opens a new scene. Do not mention the markers otherwise.")
+
+
+class MarkerParser:
+    """Strips inline beat/scene markers from streamed text and builds segments from them
+
+    feed() returns the text with markers removed, ready to forward to the client; a
+    possible partial marker at the end of a delta is held back until the next one
+    decides it. Each segment is emitted through on_segment as soon as the marker
+    that closes it arrives. found is False when the model wrote no markers, in which
+    case the caller falls back to StreamSegmenter / EvalAgent.
+    """
+
+    def __init__(self, on_segment: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.on_segment = on_segment
+        self.segments: List[Dict[str, Any]] = []
+        self.found = False
+        self._parts: List[str] = []
+        self._pending = ""
+        self._current: List[str] = []
+        self._current_scene = False
+        self._after_marker = False
+        self._finished = False
+
+    @property
+    def text(self) -> str:
+        """Text emitted so far, markers removed"""
+        return "".join(self._parts)
+
+    def feed(self, delta: str) -> str:
+        """Consume one streamed delta and return its marker-free text"""
+        if not delta or self._finished:
+            return ""
+        buffer = self._pending + delta
+        hold = self._partial_marker_start(buffer)
+        buffer, self._pending = buffer[:hold], buffer[hold:]
+        return self._consume(buffer)
+
+    def finish(self) -> str:
+        """Flush held-back text and the final segment; returns any remaining text"""
+        if self._finished:
+            return ""
+        out = self._consume(self._pending)
+        self._pending = ""
+        self._finished = True
+        self._close_segment()
+        return out
+
+    def evaluation(self) -> Dict[str, Any]:
+        """Evaluation in EvalAgent's response format, built from the markers"""
+        segments = [{'text': s['text'], 'new_scene': s['new_scene']} for s in self.segments]
+        return {
+            'processed_text': "\n\n".join(s['text'] for s in segments),
+            'segments': segments,
+            'new_scene': segments[0]['new_scene'] if segments else False,
+            'new_beat': len(segments) > 1,
+        }
+
+    def _consume(self, text: str) -> str:
+        out = []
+        position = 0
+        for match in MARKER.finditer(text):
+            out.append(self._append(text[position:match.start()]))
+            self.found = True
+            self._close_segment()
+            self._current_scene = match.group(1).upper() == 'SCENE'
+            self._after_marker = True
+            position = match.end()
+        out.append(self._append(text[position:]))
+        return "".join(out)
+
+    def _append(self, text: str) -> str:
+        if self._after_marker:
+            # Drop the newline after a marker, and keep beats a paragraph apart
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._after_marker = False
+            emitted = self.text
+            if emitted.strip():
+                text = "\n" * max(0, 2 - (len(emitted) - len(emitted.rstrip("\n")))) + text
+        if text:
+            self._current.append(text)
+            self._parts.append(text)
+        return text
+
+    def _close_segment(self):
+        text = "".join(self._current).strip()
+        self._current = []
+        if not text:
+            return
+        segment = {'index': len(self.segments), 'text': text, 'new_scene': self._current_scene, 'ambiguous': False}
+        self.segments.append(segment)
+        if self.on_segment:
+            self.on_segment(segment)
+
+    @staticmethod
+    def _partial_marker_start(text: str) -> int:
+        """Index where a possibly incomplete marker starts at the end of text (len(text) if none)"""
+        for start in range(max(0, len(text) - 12), len(text)):
+            if text[start] != '<':
+                continue
+            tail = re.sub(r"\s+", "", text[start:]).upper()
+            if any(marker.startswith(tail) for marker in (BEAT_MARKER, SCENE_MARKER)):
+                return start
+        return len(text)